@@ -27,7 +27,8 @@ class Application(QApplication):
     workspace_added = Signal(Workspace)
 
     def __init__(self, *args, file_path=None, file_loader=None, embedded=False,
-                 dev=False, skip_splash=False, **kwargs):
+                 dev=False, skip_splash=False, parallel_linelists=False,
+                 linelist_workers=None, **kwargs):
         super(Application, self).__init__(*args, **kwargs)
 
         # Set application icon
@@ -36,9 +37,12 @@ class Application(QApplication):
         # Load local plugins
         self.load_local_plugins()
 
-        # cache the line lists for speedier access
+        # register the line list library. Line lists themselves are
+        # only read when first needed, in a pool of worker processes
+        # if so requested.
         from .core import linelist
-        linelist.populate_linelists_cache()
+        linelist.populate_linelists_cache(parallel=parallel_linelists,
+                                          max_workers=linelist_workers)
 
         # Show splash
         if not skip_splash:
@@ -168,15 +172,20 @@ class SplashDialog(QDialog):
 @click.option('--loader', '-L', type=str, help="Use specified loader when opening the provided file.")
 @click.option('--embed', '-E', is_flag=True, help="Only display a single plot window. Useful when embedding in other applications.")
 @click.option('--dev', '-D', is_flag=True, help="Open SpecViz in developer mode. This mode auto-loads example spectral data.")
+@click.option('--parallel_linelists', '-P', is_flag=True, help="Read line lists in a pool of worker processes. Pays off with large line list libraries.")
+@click.option('--linelist_workers', '-W', type=int, help="Number of worker processes used to read line lists. Defaults to one per processor.")
 @click.option('--version', '-V', is_flag=True, help="Print version information", is_eager=True)
-def start(version=False, file_path=None, loader=None, embed=None, dev=None, hide_splash=False):
+def start(version=False, file_path=None, loader=None, embed=None, dev=None, hide_splash=False,
+          parallel_linelists=False, linelist_workers=None):
     if version:
         print(__version__)
         return
 
     # Start the application, passing in arguments
     app = Application(sys.argv, file_path=file_path, file_loader=loader,
-                      embedded=embed, dev=dev, skip_splash=hide_splash)
+                      embedded=embed, dev=dev, skip_splash=hide_splash,
+                      parallel_linelists=parallel_linelists,
+                      linelist_workers=linelist_workers)
 
     # Enable hidpi icons
     QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
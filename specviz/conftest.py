@@ -59,6 +59,7 @@ from astropy.tests.helper import enable_deprecations_as_exceptions
 
 import pytest
 from .app import Application
+from .core import linelist
 @pytest.fixture(scope='session')
 def specviz_gui():
     """
@@ -68,3 +69,15 @@ def specviz_gui():
     spec_app = Application([], skip_splash=True, dev=True)
     yield spec_app
     spec_app.quit()
+
+
+@pytest.fixture
+def cache_path(tmpdir, monkeypatch):
+    """
+    keeps the line list disk cache of each test in a temporary
+    directory, away from the user's cache.
+    :return: path to the cache directory
+    """
+    path = str(tmpdir.join('linelists_cache'))
+    monkeypatch.setattr(linelist, 'CACHE_PATH', path)
+    return path
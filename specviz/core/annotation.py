@@ -1,145 +1,219 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-from pyqtgraph import functions, TextItem
-
-from qtpy.QtCore import QPointF
-from qtpy.QtGui import QPolygonF, QPen, QColor
-
-orientations = {
-    'horizontal': {'anchor': (0.5, 1), 'angle': 0},
-    'vertical': {'anchor': (0, 0.5), 'angle': 90}
-}
-
+import numpy as np
+
+from pyqtgraph import functions, GraphicsObject
+
+from qtpy.QtCore import QPointF, QRectF
+from qtpy.QtGui import QPen, QColor, QFont, QFontMetricsF, QStaticText
+
+# length, in pixels, of the tick drawn below each label.
+TICK_LENGTH = 20
+
+# coordinate systems for the label heights: data values, or
+# fractions of the view height (0 at the bottom, 1 at the top).
+DATA_COORDINATES = 'data'
+VIEW_FRACTION = 'view'
+
+
+class LineIDLabels(GraphicsObject):
+    ''' A single graphics item that draws a whole set of spectral line
+        ID labels, each one made of a vertical text and a tick mark.
+
+        This replaces the former approach of one pyqtgraph TextItem per
+        line. Profiling showed that the TextItem constructor, and the
+        addItem and removeItem calls (which in turn generate an inordinate
+        amount of calls to connect() and disconnect()), dominated the
+        time spent in plotting and zooming line labels. Here, the labels
+        are just arrays: x and y in data coordinates, the label strings,
+        and an index into a color palette. Updating them is a matter of
+        replacing the arrays, and the item is added to the plot once.
+
+        Label heights can be given as fractions of the view height. These
+        are mapped to data values when painting, so the labels stay at the
+        same height on screen when the plot is zoomed or panned, with no
+        need to update them. The text glyphs are laid out once per unique
+        string, and cached. Labels are painted in device coordinates, so
+        they keep their size and orientation whatever the zoom. Tooltips
+        are handled here as well, by hit-testing the mouse position
+        against the label boxes.
+
+        The item covers the entire view, so it should be added to the plot
+        with 'ignoreBounds=True', in order not to affect auto ranging.
+    '''
 
-class LineIDMarkerProxy(object):
-    ''' A proxy class that is used in lieu of a real, full-blown Line1DMarker.
+    def __init__(self, font=None):
+        super(LineIDLabels, self).__init__()
 
-        The LineIDMarker constructor calls pyqtgraph's TextItem constructor. Profiling
-        analysis showed that it's an expensive operation to perform. However, it has
-        to be called many times during the course of a zoom operation. This proxy,
-        by avoiding to call the Line1DMarker base class' constructor, speeds up
-        the entire process.
+        self._font = font or QFont()
+        self._metrics = QFontMetricsF(self._font)
 
-        The idea is that this proxy is used to perform all the de-cluttering and
-        explicit clipping operations that take place before an actual marker can
-        be added to the plot. By postponing the instantiation of full-blown Line1DMarker
-        objects for the very end, only the ones actually showing up on screen are
-        instantiated. This saves an enormous amount of time not only on the constructor
-        phase, but also on the addItem and removeItem calls, which seem to generate in
-        turn an inordinate amount of calls to connect() and disconnect().
-    '''
+        self._x = np.zeros(0)
+        self._y = np.zeros(0)
+        self._y_coordinates = DATA_COORDINATES
+        self._offset = 0.
+        self._text = []
+        self._color_index = np.zeros(0, dtype=int)
+        self._pens = []
+        self._tooltips = None
 
-    def __init__(self, x0, y0, proxy=None, text=None, plot_item=None, tip="", color=(0, 0, 0),
-                 orientation='horizontal'):
+        # glyph layouts, per unique label string, and
+        # label widths, computed when first needed.
+        self._glyphs = {}
+        self._widths = None
 
-        self.x0 = x0
-        self.y0 = y0
+        self.setAcceptHoverEvents(True)
 
-        if proxy:
-            # complete initialization by taking
-            # parameters from another instance.
-            self._text = proxy._text
-            self._plot_item = proxy._plot_item
-            self._tooltip = proxy._tooltip
-            self._color = proxy._color
-            self._orientation = proxy._orientation
+    def setData(self, x, y, text, color_index=None, palette=None, tooltips=None,
+                y_coordinates=DATA_COORDINATES, offset=0.):
+        '''
+        Replaces the labels on display.
+
+        Parameters
+        ----------
+        x, y: array
+            label positions; x in data coordinates, y in
+            the coordinates given by 'y_coordinates'
+        text: sequence of str
+            label strings
+        color_index: array of int, optional
+            index of each label's color in 'palette'
+        palette: list, optional
+            colors, in any form accepted by pyqtgraph's mkColor
+        tooltips: sequence of str, or callable, optional
+            label tooltips, or a function that builds the tooltip
+            of a label from its index, when the mouse hovers over it
+        y_coordinates: str, optional
+            DATA_COORDINATES or VIEW_FRACTION
+        offset: float, optional
+            distance, in pixels, by which labels are raised above
+            their positions
+        '''
+        self._x = np.asarray(x, dtype=float)
+        self._y = np.asarray(y, dtype=float)
+        self._y_coordinates = y_coordinates
+        self._offset = offset
+        self._text = [str(label) for label in text]
 
-        else:
-            # initialize from passed values.
-            self._text = text
-            self._plot_item = plot_item
-            self._tooltip = tip
-            self._color = color
-            self._orientation = orientation
+        if color_index is None:
+            color_index = np.zeros(len(self._x), dtype=int)
+        self._color_index = np.asarray(color_index, dtype=int)
 
-    def __str__(self):
-        return str(self._text)
+        palette = palette or [(0, 0, 0)]
+        self._pens = [QPen(QColor(functions.mkColor(color))) for color in palette]
 
+        self._tooltips = tooltips
+        self._widths = None
 
-class LineIDMarker(TextItem):
-    ''' This class handles the drawing of a modified TextItem that's
-        augmented with a linear vertical marker. These items are used
-        to generate spectral line ID markers on the plot surface.
+        self.update()
 
-        Note the convoluted handling of the 'color' parameter. This is
-        due to a bug in pyqtgraph's function 'functions.mkColor', which
-        bombs when presented with an argument of type Qt.GlobalColor.
+    def clear(self):
+        self.setData([], [], [])
 
-        Line1DMarker instances can only be built from instances of the
-        matching Line1DMarkerProxy class, or from instances of itself.
-    '''
+    def __len__(self):
+        return len(self._x)
 
-    def __init__(self, marker=None):
+    def text_height(self):
+        '''
+        Height of the text, in pixels. This is the width of a
+        label on screen, since labels are drawn vertically.
+        '''
+        return self._metrics.height()
+
+    def _glyph(self, text):
+        glyph = self._glyphs.get(text)
+        if glyph is None:
+            glyph = QStaticText(text)
+            glyph.prepare(font=self._font)
+            self._glyphs[text] = glyph
+        return glyph
+
+    def boundingRect(self):
+        # labels extend a fixed number of pixels away from their
+        # positions in data coordinates. The simplest way to account
+        # for that is to take the entire view.
+        rect = self.viewRect()
+        if rect is None:
+            return QRectF()
+        return rect
+
+    def viewRangeChanged(self):
+        self.prepareGeometryChange()
+
+    def _device_positions(self, transform):
+        # maps label positions to device coordinates. Heights in
+        # view fractions are first mapped to data values, for the
+        # current view range.
+        y = self._y
+        if self._y_coordinates == VIEW_FRACTION:
+            rect = self.viewRect()
+            if rect is not None:
+                y = rect.top() + y * rect.height()
+
+        x = transform.m11() * self._x + transform.m21() * y + transform.dx()
+        y = transform.m12() * self._x + transform.m22() * y + transform.dy() - self._offset
+        return x, y
 
-        self.x0 = marker.x0
-        self.y0 = marker.y0
+    def paint(self, p, *args):
+        if len(self._x) == 0:
+            return
 
-        self._text = marker._text
-        self._plot_item = marker._plot_item
-        self._orientation = marker._orientation
-        self._color = marker._color
+        x, y = self._device_positions(p.transform())
 
-        self._anchor = orientations[self._orientation]['anchor']
-        self._angle = orientations[self._orientation]['angle']
+        p.save()
+        p.resetTransform()
+        p.setFont(self._font)
 
-        super(LineIDMarker, self).__init__(text=self._text, color=self._color,
-                                           anchor=self._anchor, angle=self._angle)
+        height = self._metrics.height()
 
-        self._tooltip = marker._tooltip
-        self.setToolTip(marker._tooltip)
+        for index in range(len(x)):
+            p.setPen(self._pens[self._color_index[index]])
 
-        self.setFlag(self.ItemIsMovable)
+            # tick below the label...
+            p.drawLine(QPointF(x[index], y[index]), QPointF(x[index], y[index] + TICK_LENGTH))
 
-    # Repositioning the line labels on the fly, as the data is  zoomed in and out,
-    # does not work. The behavior that is described in the PyQt documentation is not
-    # observed. It appears that the setFlags(ItemSendsGeometryChanges) does not work.
-    # I am using pyqt version 4.8, so support for this flag should be there. The
-    # ItemIgnoresTransformations flag doesn't work either. When set, it messes up with
-    # the entire plot. This could be due to interference with pyqtgraph, or a threading
-    # issue. We give up on this approach and let the caller handle the zoom requests and
-    # the repainting.
+            # ...and text reading upwards from the label position.
+            p.save()
+            p.translate(x[index], y[index])
+            p.rotate(-90)
+            p.drawStaticText(QPointF(0., -height / 2.), self._glyph(self._text[index]))
+            p.restore()
 
-    def __str__(self):
-        return str(self._text)
+        p.restore()
 
-    def paint(self, p, *args):
-        ''' Overrides the default implementation so as
-            to draw a vertical marker.
+    def label_at(self, scene_pos):
         '''
-        # draw the text
-        #
-        # Note that this actually doesn't work. Commenting out this call to the base
-        # class doesn't prevent the text to be painted on screen regardless. Tests with
-        # the base class itself prove that the base class paint() is not responsible for
-        # painting the text. Even when the base class' code in its paint() method is
-        # replaced by a sole 'pass' statement, the text still shows up on the plot.
-        # Thus there is something else in either pyqtgraph or pyqt that paints the text
-        # even though the entire painting mechanism in the classes is disabled.
-        super(LineIDMarker, self).paint(p, args)
-
-        # Add marker. Geometry depends on the
-        # text being vertical or horizontal.
-        points = []
-        bounding_rect = self.boundingRect()
-
-        if self._orientation == 'vertical':
-            x = bounding_rect.x()
-            y = bounding_rect.y() + bounding_rect.height() / 2.
-
-            points.append(QPointF(x, y))
-            points.append(QPointF(x - 20, y))
+        Index of the label under a given position in scene
+        coordinates, or None if there is no label there.
+        '''
+        if len(self._x) == 0:
+            return None
+
+        x, y = self._device_positions(self.sceneTransform())
+
+        if self._widths is None:
+            self._widths = np.array([self._glyph(text).size().width() for text in self._text])
+
+        height = self._metrics.height()
+        hits = np.flatnonzero((np.abs(scene_pos.x() - x) <= height / 2.) &
+                              (scene_pos.y() <= y + TICK_LENGTH) &
+                              (scene_pos.y() >= y - self._widths))
+        if len(hits) == 0:
+            return None
+
+        # the closest one, when labels overlap.
+        return int(hits[np.argmin(np.abs(scene_pos.x() - x[hits]))])
+
+    def hoverEvent(self, ev):
+        if ev.isExit() or self._tooltips is None:
+            self.setToolTip('')
+            return
+
+        index = self.label_at(ev.scenePos())
+        if index is None:
+            self.setToolTip('')
+        elif callable(self._tooltips):
+            self.setToolTip(self._tooltips(index))
         else:
-            x = bounding_rect.x() + bounding_rect.width() / 2.
-            y = bounding_rect.y() + bounding_rect.height() * 2.
-
-            points.append(QPointF(x, y))
-            points.append(QPointF(x, y - 20))
-
-        polygon = QPolygonF(points)
-
-        pen = QPen(QColor(functions.mkColor(self._color)))
-        p.setPen(pen)
-        p.drawPolygon(polygon)
-
-
+            self.setToolTip(self._tooltips[index])
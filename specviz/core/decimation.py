@@ -0,0 +1,300 @@
+import logging
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from qtpy.QtCore import QThread, Signal
+
+# number of samples above which plot data items are drawn from a
+# decimation pyramid rather than at full resolution.
+DECIMATION_THRESHOLD = 2 ** 18
+
+# size, in bytes, above which pyramid levels are memory-mapped
+# to a temporary file instead of kept in memory.
+MEMMAP_THRESHOLD = 64 * 2 ** 20
+
+# samples per pixel up to which data is drawn at full resolution.
+SAMPLES_PER_PIXEL = 2
+
+# maximum number of pyramids kept in the pyramid cache.
+PYRAMID_CACHE_SIZE = 8
+
+
+class DecimationPyramid(object):
+    """
+    Multi-resolution min/max summary of a spectrum, for display.
+
+    Level 0 is the data itself. Each bin in level k holds the minimum
+    and the maximum of 2**k consecutive samples, and is built from two
+    bins in level k - 1. Drawing the level with about one bin per pixel
+    looks the same as drawing every sample, at a cost that depends on
+    the plot width instead of the data size. Minima and maxima ignore
+    NaNs, unless a bin has nothing else.
+
+    Minima and maxima can also be taken over separate lower and upper
+    values, such as the bounds of an uncertainty band.
+
+    Parameters
+    ----------
+    x: array
+        monotonic sample positions, or bin edges, with one more value
+        than 'y', for data drawn in step mode
+    y: array
+        sample values, or lower values if 'y_high' is given
+    y_high: array, optional
+        upper values
+    memmap_threshold: int, optional
+        size, in bytes, above which levels are memory-mapped
+    """
+    def __init__(self, x, y, y_high=None, memmap_threshold=MEMMAP_THRESHOLD):
+        x = np.asarray(x)
+        y = np.asarray(y)
+        y_high = y if y_high is None else np.asarray(y_high)
+
+        self.step = len(x) == len(y) + 1
+
+        # descending axes are reversed, so positions can be searched.
+        # Reversing both the bin edges and the values of step mode
+        # data leaves every bin spanning the same range.
+        if len(x) > 1 and x[0] > x[-1]:
+            x = x[::-1]
+            y = y[::-1]
+            y_high = y_high[::-1]
+        if not np.all(x[1:] >= x[:-1]):
+            raise ValueError("positions are not monotonic")
+
+        self._x = x
+        self._y = y
+
+        sizes = []
+        size = len(y)
+        while size > 1:
+            size = (size + 1) // 2
+            sizes.append(size)
+
+        # all levels are stored in a single buffer.
+        total = 2 * sum(sizes)
+        if total * 8 > memmap_threshold:
+            buffer = np.memmap(tempfile.TemporaryFile(), dtype=float, mode='w+', shape=(total,))
+        else:
+            buffer = np.empty(total, dtype=float)
+
+        self._levels = [(y, y_high)]
+        offset = 0
+        for size in sizes:
+            low = buffer[offset:offset + size]
+            high = buffer[offset + size:offset + 2 * size]
+            offset += 2 * size
+
+            _reduce(self._levels[-1], low, high)
+            self._levels.append((low, high))
+
+    def __len__(self):
+        return len(self._y)
+
+    @property
+    def nlevels(self):
+        return len(self._levels)
+
+    def samples(self, xmin, xmax):
+        """
+        Start and end indices of the samples that show up in between
+        'xmin' and 'xmax'. These include the neighbours on each side,
+        which lines reach into the range from.
+        """
+        n = len(self._y)
+        if self.step:
+            start = np.searchsorted(self._x[1:], xmin, side='left')
+            end = np.searchsorted(self._x[:-1], xmax, side='right')
+        else:
+            start = np.searchsorted(self._x, xmin, side='left') - 1
+            end = np.searchsorted(self._x, xmax, side='right') + 1
+
+        return int(min(max(start, 0), n)), int(min(max(end, 0), n))
+
+    def level(self, samples, pixels):
+        """
+        Level to draw a number of samples with, across a
+        number of pixels.
+        """
+        if samples <= SAMPLES_PER_PIXEL * pixels:
+            return 0
+        return min(int(np.log2(samples / pixels)), len(self._levels) - 1)
+
+    def envelope(self, level, start, end):
+        """
+        Positions, minima, and maxima, of the bins that hold the
+        samples in between 'start' and 'end' at a given level. At level
+        0 in step mode, positions are the bin edges.
+        """
+        if level == 0:
+            low, high = self._levels[0]
+            if self.step:
+                return self._x[start:end + 1], low[start:end], high[start:end]
+            return self._x[start:end], low[start:end], high[start:end]
+
+        first = start >> level
+        last = -(-end >> level)
+
+        low, high = self._levels[level]
+        x = self._x[:len(self._y):1 << level][first:last]
+
+        return x, low[first:last], high[first:last]
+
+    def display(self, level, start, end):
+        """
+        Positions and values that draw the samples in between 'start'
+        and 'end' at a given level. Level 0 is drawn in the same way
+        as the full data; other levels are drawn as a vertical stroke
+        per bin, in between its minimum and maximum.
+        """
+        x, low, high = self.envelope(level, start, end)
+        if level == 0:
+            return x, low
+
+        return np.repeat(x, 2), np.column_stack((low, high)).ravel()
+
+    def bounds(self, ax, orthoRange=None):
+        """
+        Range of the data along an axis, as in pyqtgraph's dataBounds.
+        The range of values is over the samples in 'orthoRange', when
+        given.
+        """
+        if ax == 0:
+            return float(self._x[0]), float(self._x[-1])
+
+        start, end = 0, len(self._y)
+        if orthoRange is not None:
+            start, end = self.samples(*orthoRange)
+
+        # bins of the top levels cover a few more samples, which
+        # doesn't matter for ranging.
+        level = self.level(end - start, 1024)
+        first = start >> level
+        last = -(-end >> level)
+
+        low, high = self._levels[level]
+        if last <= first or np.all(np.isnan(low[first:last])):
+            return None, None
+
+        return float(np.nanmin(low[first:last])), float(np.nanmax(high[first:last]))
+
+
+def _reduce(level, low, high):
+    # builds the bins of a level out of pairs of bins in the
+    # level below. An odd bin out is copied over.
+    below_low, below_high = level
+    pairs = len(below_low) // 2
+
+    np.fmin(below_low[0:2 * pairs:2], below_low[1:2 * pairs:2], out=low[:pairs])
+    np.fmax(below_high[0:2 * pairs:2], below_high[1:2 * pairs:2], out=high[:pairs])
+
+    if len(below_low) % 2:
+        low[pairs] = below_low[-1]
+        high[pairs] = below_high[-1]
+
+
+class PyramidBuilder(QThread):
+
+    # Builds a decimation pyramid in a worker thread.
+
+    ready = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, *arrays):
+        super(PyramidBuilder, self).__init__()
+
+        self._arrays = arrays
+
+    def run(self):
+        try:
+            self.ready.emit(DecimationPyramid(*self._arrays))
+        except Exception as err:
+            logging.warning("Could not build decimation pyramid: %s", err)
+            self.failed.emit(str(err))
+
+
+class PyramidCache(object):
+    """
+    Least recently used cache of decimation pyramids.
+
+    Pyramids are keyed by the identifier and version of the
+    :class:`~specviz.core.items.DataItem` they are built from, the
+    quantity they summarize, and the units of its converted arrays, so
+    plot windows that display the same data in the same units share
+    them. Pyramids are built in
+    worker threads, one at a time per key. Data that can't be decimated
+    is cached as None.
+    """
+    def __init__(self, size=PYRAMID_CACHE_SIZE):
+        self._size = size
+        self._pyramids = OrderedDict()
+        self._builders = {}
+        self._callbacks = {}
+
+    def get(self, data_item, quantity, units):
+        """
+        Returns a pyramid from the cache, or None if it isn't there.
+        """
+        key = (data_item.identifier, data_item.version, quantity, units)
+
+        if key in self._pyramids:
+            self._pyramids.move_to_end(key)
+        return self._pyramids.get(key)
+
+    def request(self, data_item, quantity, units, arrays, callback):
+        """
+        Returns a pyramid from the cache, or starts building it from
+        'arrays', the positional arguments to :class:`DecimationPyramid`,
+        and returns None. 'callback' is called with no arguments when
+        the build is over.
+        """
+        key = (data_item.identifier, data_item.version, quantity, units)
+
+        if key in self._pyramids:
+            self._pyramids.move_to_end(key)
+            return self._pyramids[key]
+
+        builder = self._builders.get(key)
+        if builder is None:
+            builder = PyramidBuilder(*arrays)
+            builder.ready.connect(lambda pyramid: self._store(key, pyramid))
+            builder.failed.connect(lambda message: self._store(key, None))
+            builder.finished.connect(lambda: self._finish(key))
+
+            self._builders[key] = builder
+            builder.start()
+
+        self._callbacks.setdefault(key, []).append(callback)
+
+        return None
+
+    def _finish(self, key):
+        self._builders.pop(key, None)
+        for callback in self._callbacks.pop(key, []):
+            callback()
+
+    def _store(self, key, pyramid):
+        self._pyramids[key] = pyramid
+        if len(self._pyramids) > self._size:
+            self._pyramids.popitem(last=False)
+
+    def invalidate(self, identifier):
+        """
+        Drops all pyramids built from a given data item.
+        """
+        for key in [key for key in self._pyramids if key[0] == identifier]:
+            del self._pyramids[key]
+
+    def wait(self):
+        """
+        Blocks until all builds are over.
+        """
+        for builder in list(self._builders.values()):
+            builder.wait()
+
+    def clear(self):
+        self._pyramids.clear()
+
+
+pyramid_cache = PyramidCache()
@@ -1,20 +1,226 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from itertools import cycle
 
 import numpy as np
 import pyqtgraph as pg
 from astropy.units import spectral, spectral_density
 from qtpy.QtCore import Qt, Signal
-from qtpy.QtGui import QStandardItem
+from qtpy.QtGui import QPainterPath, QPen, QStandardItem
+
+from .decimation import DECIMATION_THRESHOLD, pyramid_cache
 
 flatui = cycle(["#000000", "#9b59b6", "#3498db", "#95a5a6", "#e74c3c",
                 "#34495e", "#2ecc71"])
 
+# maximum total size, in bytes, of the converted arrays kept in the
+# conversion cache.
+CONVERSION_CACHE_BYTES = 512 * 1024 ** 2
+
+# uncertainty displays: error bars on every bin, or a filled band,
+# with error bars on top when zoomed in on a few bins.
+UNCERTAINTY_ERROR_BARS = 'error_bars'
+UNCERTAINTY_BAND = 'band'
+
+# number of visible bins up to which error bars are drawn
+# over the uncertainty band.
+ERROR_BAR_POINTS = 500
+
+
+class ConversionCache(object):
+    """
+    Least recently used cache of unit-converted data arrays.
+
+    Arrays are keyed by the identifier and version of the
+    :class:`DataItem` they come from, the quantity they hold (flux,
+    spectral axis, or uncertainty), and the unit string. The cache is
+    shared by all plot data items, so plot windows that display the
+    same data in the same units convert it just once. Cached arrays are
+    read-only.
+
+    The cache is bounded by the total size of the arrays it holds, not
+    by their number. The most recently used array is always kept, even
+    if it is larger than the limit on its own. Nothing is evicted while
+    the cache is pinned. Arrays of data items that are not cacheable
+    are never stored.
+    """
+    def __init__(self, max_bytes=CONVERSION_CACHE_BYTES):
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._pins = 0
+        self._arrays = OrderedDict()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        self._max_bytes = value
+        self._evict()
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the cached arrays.
+        """
+        return self._nbytes
+
+    def get(self, data_item, quantity, unit, convert):
+        """
+        Returns a converted array from the cache, or computes it by
+        calling 'convert' with no arguments, and caches it.
+        """
+        key = (data_item.identifier, data_item.version, quantity, str(unit))
+
+        array = self._arrays.get(key)
+        if array is None:
+            array = self.put(data_item, quantity, unit, convert())
+        else:
+            self._arrays.move_to_end(key)
+
+        return array
+
+    def put(self, data_item, quantity, unit, array):
+        """
+        Caches an array converted elsewhere, e.g. in a worker thread,
+        and returns it.
+        """
+        key = (data_item.identifier, data_item.version, quantity, str(unit))
+
+        array = np.asarray(array)
+        array.flags.writeable = False
+
+        if not data_item.cacheable:
+            return array
+
+        previous = self._arrays.pop(key, None)
+        if previous is not None:
+            self._nbytes -= previous.nbytes
+
+        self._arrays[key] = array
+        self._nbytes += array.nbytes
+        self._evict()
+
+        return array
+
+    def contains(self, data_item, quantity, unit):
+        return (data_item.identifier, data_item.version, quantity, str(unit)) in self._arrays
+
+    def invalidate(self, identifier):
+        """
+        Drops all arrays converted from a given data item.
+        """
+        for key in [key for key in self._arrays if key[0] == identifier]:
+            self._nbytes -= self._arrays.pop(key).nbytes
+
+    def clear(self):
+        self._arrays.clear()
+        self._nbytes = 0
+
+    @contextmanager
+    def pinned(self):
+        """
+        Keeps all arrays cached in the block, e.g. arrays converted
+        ahead of a batch of unit changes, until the block exits.
+        """
+        self._pins += 1
+        try:
+            yield self
+        finally:
+            self._pins -= 1
+            self._evict()
+
+    def _evict(self):
+        if self._pins > 0:
+            return
+
+        while self._nbytes > self._max_bytes and len(self._arrays) > 1:
+            self._nbytes -= self._arrays.popitem(last=False)[1].nbytes
+
+
+conversion_cache = ConversionCache()
+
+
+class CompatibilityCache(object):
+    """
+    Compatibility of data items with display units.
+
+    Whether the data in a :class:`DataItem` can be displayed in a given
+    unit depends only on the units of its flux and spectral axis, its
+    compatibility class. Physical types won't do: unrelated units, such
+    as counts and ADU, share the 'unknown' type. Compatibility is
+    evaluated with astropy equivalencies once per class, equivalency
+    set, and unit, and looked up
+    afterwards, so checking many data items against the units of a plot
+    costs a dictionary lookup per item.
+    """
+    def __init__(self):
+        self._compatible = {}
+
+    def is_data_unit_compatible(self, data_item, unit):
+        key = (data_item.compatibility_class, 'data', str(unit))
+
+        compatible = self._compatible.get(key)
+        if compatible is None:
+            # equivalencies depend on the units of the spectral
+            # axis, not on its values. One will do.
+            spectral_axis = data_item.spectral_axis[:1]
+            compatible = data_item.flux.unit.is_equivalent(
+                unit, equivalencies=spectral_density(spectral_axis))
+            self._compatible[key] = compatible
+
+        return compatible
+
+    def is_spectral_axis_unit_compatible(self, data_item, unit):
+        key = (data_item.compatibility_class, 'spectral_axis', str(unit))
+
+        compatible = self._compatible.get(key)
+        if compatible is None:
+            compatible = data_item.spectral_axis.unit.is_equivalent(
+                unit, equivalencies=spectral())
+            self._compatible[key] = compatible
+
+        return compatible
+
+    def clear(self):
+        self._compatible.clear()
+
+
+compatibility_cache = CompatibilityCache()
+
+
+def convert(spectrum, quantity, unit):
+    """
+    Converts the flux, spectral axis, or uncertainty, of a
+    :class:`~specutils.Spectrum1D` to a given unit. This touches no Qt
+    objects, so it can run in a worker thread.
+    """
+    if quantity == 'flux':
+        return spectrum.flux.to(unit, equivalencies=spectral_density(
+            spectrum.spectral_axis)).value
+
+    if quantity == 'spectral_axis':
+        return spectrum.spectral_axis.to(unit, equivalencies=spectral()).value
+
+    if quantity == 'uncertainty':
+        uncertainty = spectrum.uncertainty.array * spectrum.uncertainty.unit
+
+        return uncertainty.to(unit, equivalencies=spectral_density(
+            spectrum.spectral_axis)).value
+
+    raise ValueError("Unknown quantity '{}'".format(quantity))
+
 
 class DataItem(QStandardItem):
     NameRole = Qt.UserRole + 1
     IdRole = Qt.UserRole + 2
     DataRole = Qt.UserRole + 3
 
+    # whether arrays converted from the data can be cached. Data
+    # items whose values change without a new version must not be.
+    cacheable = True
+
     def __init__(self, name, identifier, data, *args, **kwargs):
         super(DataItem, self).__init__(*args, **kwargs)
 
@@ -25,6 +231,12 @@ class DataItem(QStandardItem):
 
         self.setCheckable(True)
 
+        # bumped every time the data is replaced.
+        self._version = 0
+
+        # units of the flux and spectral axis, when first needed.
+        self._compatibility_class = None
+
     @property
     def identifier(self):
         return self.data(self.IdRole)
@@ -33,6 +245,21 @@ class DataItem(QStandardItem):
     def name(self):
         return self.data(self.NameRole)
 
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def compatibility_class(self):
+        """
+        Units of the flux and the spectral axis. Data items in the
+        same class are compatible with the same units.
+        """
+        if self._compatibility_class is None:
+            self._compatibility_class = (self.flux.unit.to_string(),
+                                         self.spectral_axis.unit.to_string())
+        return self._compatibility_class
+
     @name.setter
     def name(self, value):
         self.setData(value, self.NameRole)
@@ -53,6 +280,11 @@ class DataItem(QStandardItem):
         """
         Updates the stored :class:`~specutils.Spectrum1D` data values.
         """
+        self._version += 1
+        self._compatibility_class = None
+        conversion_cache.invalidate(self.identifier)
+        pyramid_cache.invalidate(self.identifier)
+
         self.setData(data, self.DataRole)
 
     @property
@@ -66,10 +298,28 @@ class PlotDataItem(pg.PlotDataItem):
     color_changed = Signal(str)
     width_changed = Signal(int)
     visibility_changed = Signal(bool)
+    uncertainty_mode_changed = Signal(str)
 
     def __init__(self, data_item, color=None, *args, **kwargs):
         super(PlotDataItem, self).__init__(stepMode=True, *args, **kwargs)
 
+        # step mode of the full resolution data. Decimated data is
+        # drawn without it.
+        self._step_mode = self.opts['stepMode']
+
+        # spectra with many samples are drawn from a decimation
+        # pyramid, once it's built. The window is the level and the
+        # range of samples on display.
+        self._pyramid = None
+        self._window = None
+
+        # the uncertainty band is decimated in the same way, and drawn
+        # over the same window. Error bars are drawn over a slice of
+        # the data, or all of it.
+        self._band_pyramid = None
+        self._band_window = None
+        self._error_bar_slice = None
+
         self._data_item = data_item
         self._data_unit = self._data_item.flux.unit.to_string()
         self._spectral_axis_unit = self._data_item.spectral_axis.unit.to_string()
@@ -77,22 +327,23 @@ class PlotDataItem(pg.PlotDataItem):
         self._width = 1
         self._visible = False
 
-        # Include error bar item
+        # Include error bar and uncertainty band items
         self._error_bar_item = pg.ErrorBarItem(pen=[128, 128, 128, 200])
+        self._band_item = UncertaintyBandItem(brush=[128, 128, 128, 80])
+        self._uncertainty_mode = UNCERTAINTY_ERROR_BARS
+        self.error_bar_points = ERROR_BAR_POINTS
 
         # Set data
         self.set_data()
         self._update_pen()
 
-        # Connect slots to data item signals
-        self.data_unit_changed.connect(self.set_data)
-        self.spectral_axis_unit_changed.connect(self.set_data)
-
         # Connect to color signals
         self.color_changed.connect(self._update_pen)
         self.width_changed.connect(self._update_pen)
         self.visibility_changed.connect(self._update_pen)
 
+        self.uncertainty_mode_changed.connect(self.set_data)
+
     def _update_pen(self, *args):
         if self.visible:
             try:
@@ -115,23 +366,25 @@ class PlotDataItem(pg.PlotDataItem):
     @data_unit.setter
     def data_unit(self, value):
         self._data_unit = value
+        self.set_data()
         self.data_unit_changed.emit(self._data_unit)
 
     @property
     def error_bar_item(self):
-        spectral_axis = self.spectral_axis
+        return self._error_bar_item
 
-        # If step mode is one, offset the error bars by a half delta so that
-        # they cross the middle of the bin.
-        if self.opts.get('stepMode'):
-            diff = np.diff(spectral_axis)
-            spectral_axis += np.append(diff, diff[-1]) * 0.5
+    @property
+    def band_item(self):
+        return self._band_item
 
-        self._error_bar_item.setData(x=spectral_axis,
-                                     y=self.flux,
-                                     height=self.uncertainty)
+    @property
+    def uncertainty_mode(self):
+        return self._uncertainty_mode
 
-        return self._error_bar_item
+    @uncertainty_mode.setter
+    def uncertainty_mode(self, value):
+        self._uncertainty_mode = value
+        self.uncertainty_mode_changed.emit(self._uncertainty_mode)
 
     def are_units_compatible(self, spectral_axis_unit, data_unit):
         return self.is_data_unit_compatible(data_unit) and \
@@ -139,14 +392,11 @@ class PlotDataItem(pg.PlotDataItem):
 
     def is_data_unit_compatible(self, unit):
         return (unit is not None and
-                self.data_item.flux.unit.is_equivalent(
-                    unit, equivalencies=spectral_density(
-                        self.data_item.spectral_axis)))
+                compatibility_cache.is_data_unit_compatible(self.data_item, unit))
 
     def is_spectral_axis_unit_compatible(self, unit):
         return (unit is not None and
-                self.data_item.spectral_axis.unit.is_equivalent(
-                    unit, equivalencies=spectral()))
+                compatibility_cache.is_spectral_axis_unit_compatible(self.data_item, unit))
 
     @property
     def spectral_axis_unit(self):
@@ -155,37 +405,81 @@ class PlotDataItem(pg.PlotDataItem):
     @spectral_axis_unit.setter
     def spectral_axis_unit(self, value):
         self._spectral_axis_unit = value
+        self.set_data()
         self.spectral_axis_unit_changed.emit(self._spectral_axis_unit)
 
+    def set_units(self, data_unit=None, spectral_axis_unit=None):
+        """
+        Changes the data and spectral axis units together, and redraws
+        the data just once. Units that are None are left alone.
+        """
+        if data_unit is not None:
+            self._data_unit = data_unit
+        if spectral_axis_unit is not None:
+            self._spectral_axis_unit = spectral_axis_unit
+
+        self.set_data()
+
+        if data_unit is not None:
+            self.data_unit_changed.emit(self._data_unit)
+        if spectral_axis_unit is not None:
+            self.spectral_axis_unit_changed.emit(self._spectral_axis_unit)
+
     def reset_units(self):
-        self.data_unit = self.data_item.flux.unit.to_string()
-        self.spectral_axis_unit = self.data_item.spectral_axis.unit.to_string()
+        self.set_units(self.data_item.flux.unit.to_string(),
+                       self.data_item.spectral_axis.unit.to_string())
+
+    def conversions(self, data_unit, spectral_axis_unit):
+        """
+        The (quantity, unit) pairs of the converted arrays needed to
+        display the data in the given units.
+        """
+        conversions = [('spectral_axis', spectral_axis_unit or ""),
+                       ('flux', data_unit)]
+        if self.data_item.uncertainty is not None:
+            conversions.append(('uncertainty', data_unit or ""))
+
+        return conversions
+
+    def _converted(self, quantity, unit):
+        return conversion_cache.get(self.data_item, quantity, unit,
+                                    lambda: convert(self.data_item.spectrum, quantity, unit))
 
     @property
     def flux(self):
         """
         Converts data_item.flux - which consists of the flux axis with units - into the new flux unit
         """
-        return self.data_item.flux.to(self.data_unit,
-                                      equivalencies=spectral_density(
-                                          self.data_item.spectral_axis)).value
+        return self._converted('flux', self.data_unit)
 
     @property
     def spectral_axis(self):
-        return self.data_item.spectral_axis.to(self.spectral_axis_unit or "",
-                                               equivalencies=spectral()).value
+        return self._converted('spectral_axis', self.spectral_axis_unit or "")
+
+    @property
+    def bin_centers(self):
+        """
+        Spectral axis values at the middle of the bins drawn in step mode,
+        where error bars are drawn.
+        """
+        if not self._step_mode:
+            return self.spectral_axis
+
+        def centers():
+            # offset by a half delta, so error bars cross the
+            # middle of the bin.
+            spectral_axis = self.spectral_axis
+            diff = np.diff(spectral_axis)
+            return spectral_axis + np.append(diff, diff[-1]) * 0.5
+
+        return conversion_cache.get(self.data_item, 'bin_centers', self.spectral_axis_unit or "", centers)
 
     @property
     def uncertainty(self):
         if self.data_item.uncertainty is None:
             return
 
-        uncertainty = self.data_item.uncertainty.array * \
-                      self.data_item.uncertainty.unit
-
-        return uncertainty.to(self.data_unit or "",
-                              equivalencies=spectral_density(
-                                  self.data_item.spectral_axis)).value
+        return self._converted('uncertainty', self.data_unit or "")
 
     @property
     def color(self):
@@ -232,16 +526,243 @@ class PlotDataItem(pg.PlotDataItem):
         """
         spectral_axis = self.spectral_axis
 
-        if self.opts.get('stepMode'):
+        if self._step_mode:
             spectral_axis = np.append(self.spectral_axis, self.spectral_axis[-1])
 
-        self.setData(spectral_axis, self.flux, connect="finite")
+        self._window = None
+        self._pyramid = None
+        self._band_pyramid = None
+        if len(self.flux) > DECIMATION_THRESHOLD:
+            self._pyramid = pyramid_cache.request(self.data_item, 'flux', self._units(),
+                                                  (spectral_axis, self.flux),
+                                                  self._on_pyramid_ready)
+
+            if self.uncertainty is not None and self.uncertainty_mode == UNCERTAINTY_BAND:
+                self._band_pyramid = pyramid_cache.request(
+                    self.data_item, 'band', self._units(),
+                    (spectral_axis, self.flux - self.uncertainty, self.flux + self.uncertainty),
+                    self._on_pyramid_ready)
+
+        # until the pyramid is ready, data is drawn at full resolution.
+        if self._pyramid is None:
+            self.setData(spectral_axis, self.flux, connect="finite", stepMode=self._step_mode)
+        else:
+            self._update_view()
 
         # Without this call, the plot tries to do autoRange based on DataItem (which does not change), when it should
         # instead be doing autoRange based on PlotDataItem, which updates based on what units are being used
-        self._error_bar_item.setData(x=self.spectral_axis,
-                                     y=self.flux,
-                                     height=self.uncertainty)
+        self._band_window = None
+        self._error_bar_slice = None
+        self._update_uncertainty()
+
+    def _units(self):
+        return self.spectral_axis_unit or "", self.data_unit or ""
+
+    def _on_pyramid_ready(self):
+        # the data or units may have changed while building.
+        if len(self.flux) > DECIMATION_THRESHOLD:
+            self._pyramid = pyramid_cache.get(self.data_item, 'flux', self._units())
+            if self._pyramid is not None:
+                self._update_view()
+
+            if self.uncertainty is not None and self.uncertainty_mode == UNCERTAINTY_BAND:
+                self._band_pyramid = pyramid_cache.get(self.data_item, 'band', self._units())
+                self._update_uncertainty()
+
+    def _update_view(self):
+        # draws the pyramid level with about one bin per pixel, over
+        # the samples in the view range and half a view on each side.
+        # Nothing is redrawn while the view stays within those samples,
+        # at the same level.
+        pyramid = self._pyramid
+
+        view_box = self.getViewBox()
+        if view_box is None:
+            (xmin, xmax), pixels = pyramid.bounds(0), 1024
+        else:
+            (xmin, xmax), pixels = view_box.viewRange()[0], max(view_box.width(), 1)
+
+        start, end = pyramid.samples(xmin, xmax)
+        level = pyramid.level(end - start, pixels)
+
+        if self._window is not None:
+            window_level, window_start, window_end = self._window
+            if window_level == level and window_start <= start and end <= window_end:
+                return
+
+        margin = (end - start) // 2
+        start = max(start - margin, 0)
+        end = min(end + margin, len(pyramid))
+        self._window = (level, start, end)
+
+        x, y = pyramid.display(level, start, end)
+        self.setData(x, y, connect="finite",
+                     stepMode=self._step_mode if level == 0 else None)
+
+    def viewRangeChanged(self, *args, **kwargs):
+        # connected by pyqtgraph to the view box sigRangeChanged.
+        super(PlotDataItem, self).viewRangeChanged(*args, **kwargs)
+
+        if self._pyramid is not None:
+            self._update_view()
+
+        if self.uncertainty_mode == UNCERTAINTY_BAND:
+            self._update_uncertainty()
+
+    def _update_uncertainty(self):
+        # error bars cover the whole data. The band covers the same
+        # window as the curve when both are decimated, or the whole
+        # data, and error bars show up on top of it over the visible
+        # bins, when there are few enough.
+        uncertainty = self.uncertainty
+        if uncertainty is None:
+            self._band_item.setVisible(False)
+            self._error_bar_item.setVisible(False)
+            return
+
+        if self.uncertainty_mode != UNCERTAINTY_BAND:
+            self._band_item.setVisible(False)
+            self._set_error_bars(slice(None))
+            return
+
+        self._band_item.setVisible(True)
+
+        if self._pyramid is not None and self._band_pyramid is not None:
+            window = self._window
+        else:
+            window = 'all'
+
+        if window != self._band_window:
+            self._band_window = window
+
+            if window == 'all':
+                spectral_axis = self.spectral_axis
+                if self._step_mode:
+                    spectral_axis = np.append(spectral_axis, spectral_axis[-1])
+                self._band_item.setData(spectral_axis, self.flux - uncertainty,
+                                        self.flux + uncertainty, step=self._step_mode)
+            else:
+                level, start, end = window
+                self._band_item.setData(*self._band_pyramid.envelope(level, start, end),
+                                        step=self._step_mode and level == 0)
+
+        visible = self._visible_slice()
+        if visible.stop - visible.start <= self.error_bar_points:
+            self._set_error_bars(visible)
+        else:
+            self._error_bar_item.setVisible(False)
+
+    def _set_error_bars(self, bins):
+        if bins != self._error_bar_slice:
+            self._error_bar_slice = bins
+
+            uncertainty = self.uncertainty[bins]
+            self._error_bar_item.setData(x=self.bin_centers[bins],
+                                         y=self.flux[bins],
+                                         top=uncertainty,
+                                         bottom=uncertainty)
+
+        self._error_bar_item.setVisible(True)
+
+    def _visible_slice(self):
+        # slice of the bins in the view range, for data sorted in
+        # either direction.
+        spectral_axis = self.spectral_axis
+        view_box = self.getViewBox()
+        if view_box is None or len(spectral_axis) == 0:
+            return slice(0, len(spectral_axis))
+
+        xmin, xmax = view_box.viewRange()[0]
+        if spectral_axis[0] <= spectral_axis[-1]:
+            return slice(int(np.searchsorted(spectral_axis, xmin, side='left')),
+                         int(np.searchsorted(spectral_axis, xmax, side='right')))
+
+        size = len(spectral_axis)
+        reversed_axis = spectral_axis[::-1]
+        return slice(size - int(np.searchsorted(reversed_axis, xmax, side='right')),
+                     size - int(np.searchsorted(reversed_axis, xmin, side='left')))
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        # decimated data on display is clipped to the view, so the
+        # bounds of the whole data come from the pyramid.
+        if self._pyramid is not None:
+            return self._pyramid.bounds(ax, orthoRange)
+
+        return super(PlotDataItem, self).dataBounds(ax, frac, orthoRange)
+
+
+class UncertaintyBandItem(pg.GraphicsObject):
+    """
+    Filled band in between lower and upper bounds of a spectrum.
+
+    The band is drawn as a single path, made of one polygon per run of
+    finite values. Unlike error bars, its cost doesn't depend on the
+    number of bins on display, when drawn from a decimation pyramid.
+
+    Parameters
+    ----------
+    brush: optional
+        fill, in any form accepted by pyqtgraph's mkBrush
+    """
+    def __init__(self, brush=None):
+        super(UncertaintyBandItem, self).__init__()
+
+        self._brush = pg.mkBrush(brush)
+        self._path = QPainterPath()
+
+    def setData(self, x, low, high, step=False):
+        """
+        Replaces the band on display.
+
+        Parameters
+        ----------
+        x: array
+            positions, or bin edges, with one more value than
+            'low' and 'high', in step mode
+        low, high: array
+            lower and upper bounds
+        step: bool, optional
+            whether bounds are constant across bins
+        """
+        x = np.asarray(x, dtype=float)
+        low = np.asarray(low, dtype=float)
+        high = np.asarray(high, dtype=float)
+
+        if step:
+            x = np.column_stack((x[:-1], x[1:])).ravel()
+            low = np.repeat(low, 2)
+            high = np.repeat(high, 2)
+
+        self.prepareGeometryChange()
+        self._path = _band_path(x, low, high)
+        self.update()
+
+    def boundingRect(self):
+        return self._path.boundingRect()
+
+    def paint(self, p, *args):
+        p.setPen(QPen(Qt.NoPen))
+        p.setBrush(self._brush)
+        p.drawPath(self._path)
+
+
+def _band_path(x, low, high):
+    # each run of finite values is a polygon along the upper bounds,
+    # and back along the lower bounds. Polygons are separated by NaNs,
+    # which start new sub-paths.
+    finite = np.isfinite(x) & np.isfinite(low) & np.isfinite(high)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], finite.view(np.int8), [0]))))
+
+    xs = []
+    ys = []
+    for start, end in zip(edges[0::2], edges[1::2]):
+        xs.extend((x[start:end], x[start:end][::-1], [np.nan]))
+        ys.extend((high[start:end], low[start:end][::-1], [np.nan]))
+
+    if len(xs) == 0:
+        return QPainterPath()
+
+    return pg.arrayToQPath(np.concatenate(xs), np.concatenate(ys), connect='finite')
 
 
 class ModelItem(QStandardItem):
@@ -6,13 +6,20 @@ Line list utilities
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 import os
+import re
 import glob
+import concurrent.futures
+from copy import deepcopy
+import shutil
+import hashlib
+import logging
+import tempfile
 import yaml
 
 import numpy as np
 
 from astropy.io import ascii
-from astropy.table import Table, vstack
+from astropy.table import Table, Column, MaskedColumn
 from astropy import constants
 from astropy import units as u
 from astropy.units.core import UnitConversionError
@@ -20,11 +27,16 @@ from astropy.units.core import UnitConversionError
 
 __all__ = [
     'get_from_file',
+    'get_from_files',
+    'stream_from_file',
+    'source_size',
     'get_from_cache',
     'ingest',
     'populate_linelists_cache',
     'descriptions',
     'LineList',
+    'LineListView',
+    'CompactLineList',
 ]
 
 # yaml specs
@@ -35,6 +47,7 @@ COLUMN_END = 'end'
 WAVELENGTH_COLUMN = 'Wavelength'
 ERROR_COLUMN = 'Error'
 ID_COLUMN = 'Species'
+INTENSITY_COLUMN = 'Intensity'
 UNITS_COLUMN = 'units'
 TOOLTIP_COLUMN = 'tooltip'
 
@@ -50,20 +63,46 @@ columns_to_remove = [REDSHIFTED_WAVELENGTH_COLUMN, COLOR_COLUMN, HEIGHT_COLUMN,
 
 _linelists_cache = []
 
+# Parsed line lists are kept on disk, one directory per list, with
+# one .npy file per column. This allows warm starts to memory-map
+# the column arrays instead of running the ASCII parser again.
+CACHE_PATH = os.path.join(os.path.expanduser("~/.specviz"), "linelists_cache")
+CACHE_VERSION = 2
+CACHE_META_FILE = 'meta.yaml'
+
+# Parallel ingestion is opt-in. When enabled, independent line lists
+# that must be parsed (that is, are not in the disk cache) are read
+# in a pool of worker processes. A worker count of None lets the pool
+# pick one worker per processor.
+_ingestion_options = {'parallel': False, 'max_workers': None}
+
+# Line list files larger than this are better imported by streaming
+# over them in chunks of STREAMING_CHUNK_SIZE bytes, and keeping just
+# the lines in the wavelength range of interest.
+STREAMING_THRESHOLD = 64 * 1024 * 1024
+STREAMING_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Range queries over the whole library (see 'ingest') run on an
+# index of the wavelength intervals spanned by each list, in one
+# common unit. The index is built on the first query, from the list
+# summaries, and lists are read only when their interval overlaps
+# the range of a query.
+INDEX_UNIT = u.AA
+_interval_index = None
+
 
 def get_from_file(linelist_path, filename):
 
     if filename.endswith('.yaml'):
         yaml_object = yaml.load(open(filename, 'r'))
-        linelist_fullname = linelist_path + os.path.sep + yaml_object['filename']
 
-        return LineList.read_list(linelist_fullname, yaml_object)
+        return _read_yaml_described_list(linelist_path, yaml_object)
 
     elif filename.endswith('.ecsv'):
         table = Table.read(filename, format='ascii.ecsv')
 
         linelist = LineList(table, name=os.path.split(filename)[1])
-        _linelists_cache.append(linelist)
+        _linelists_cache.append(_LineListEntry.from_linelist(linelist))
 
         return linelist
 
@@ -71,82 +110,1065 @@ def get_from_file(linelist_path, filename):
         return None
 
 
+def get_from_files(filenames, parallel=None, max_workers=None):
+    """
+    Reads several line list files, each one with its line list
+    (for YAML descriptors) living in the same directory.
+
+    Parameters
+    ----------
+    filenames: [str, ...]
+        YAML descriptor and/or ECSV file names.
+    parallel: bool
+        If true, files are parsed in a pool of worker processes.
+        Defaults to the setting in `populate_linelists_cache`.
+    max_workers: int
+        Number of worker processes. Defaults to the setting in
+        `populate_linelists_cache`.
+
+    Returns
+    -------
+    [LineList, ...]
+        The line lists, in the same order as 'filenames'. Files
+        in unsupported formats result in None.
+    """
+    parallel, max_workers = _resolve_ingestion_options(parallel, max_workers)
+
+    if not parallel or len(filenames) < 2:
+        return [get_from_file(os.path.dirname(name), name) for name in filenames]
+
+    result = [None] * len(filenames)
+    tasks = []
+    task_indices = []
+
+    for index, filename in enumerate(filenames):
+        linelist_path = os.path.dirname(filename)
+
+        if filename.endswith('.yaml'):
+            yaml_object = yaml.load(open(filename, 'r'))
+            linelist_fullname = linelist_path + os.path.sep + yaml_object['filename']
+
+            # lists in the disk cache are memory-mapped right here.
+            result[index] = _read_from_disk_cache(linelist_fullname, yaml_object)
+            if result[index] is None:
+                tasks.append(('yaml', linelist_path, yaml_object))
+                task_indices.append(index)
+
+        elif filename.endswith('.ecsv'):
+            tasks.append(('ecsv', linelist_path, filename))
+            task_indices.append(index)
+
+    for index, task, linelist in zip(task_indices, tasks, _parse_in_pool(tasks, max_workers)):
+        result[index] = linelist
+
+        if task[0] == 'yaml':
+            linelist_fullname = task[1] + os.path.sep + task[2]['filename']
+            _write_to_disk_cache(linelist_fullname, task[2], linelist)
+        else:
+            _linelists_cache.append(_LineListEntry.from_linelist(linelist))
+
+    return result
+
+
+def _resolve_ingestion_options(parallel, max_workers):
+    if parallel is None:
+        parallel = _ingestion_options['parallel']
+    if max_workers is None:
+        max_workers = _ingestion_options['max_workers']
+    return parallel, max_workers
+
+
+def _parse_in_pool(tasks, max_workers):
+    """
+    Parses line lists in a pool of worker processes.
+
+    Workers send back the column arrays only; LineList instances
+    are assembled here, in the same order as 'tasks'. If the pool
+    cannot be used, lists are parsed serially instead.
+    """
+    if len(tasks) == 0:
+        return []
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            payloads = list(executor.map(_parse_task, tasks))
+
+    except (OSError, concurrent.futures.process.BrokenProcessPool) as err:
+        logging.warning("Parallel line list ingestion failed, "
+                        "reading line lists serially: %s", err)
+        payloads = [_parse_task(task) for task in tasks]
+
+    return [_linelist_from_payload(payload) for payload in payloads]
+
+
+def _parse_task(task):
+    # Runs in a worker process, so it must live at module level.
+    kind, linelist_path, source = task
+
+    if kind == 'yaml':
+        linelist_fullname = linelist_path + os.path.sep + source['filename']
+        linelist = LineList.read_list(linelist_fullname, source)
+    else:
+        table = Table.read(source, format='ascii.ecsv')
+        linelist = LineList(table, name=os.path.split(source)[1])
+
+    return _payload_from_linelist(linelist)
+
+
+def _payload_from_linelist(linelist):
+    """
+    Strips a line list down to plain python objects and numpy
+    arrays, which are cheap to send in between processes.
+    """
+    columns = []
+    for colname in linelist.colnames:
+        column = linelist[colname]
+        if isinstance(column, MaskedColumn):
+            data, mask = column.data.data, np.ma.getmaskarray(column.data)
+        else:
+            data, mask = column.data, None
+        unit = None if column.unit is None else column.unit.to_string()
+        columns.append((colname, unit, np.ascontiguousarray(data), mask))
+
+    return {'name': linelist.name,
+            'tooltips': linelist.tooltips,
+            'comments': list(linelist.meta.get('comments', [])),
+            'columns': columns}
+
+
+def _linelist_from_payload(payload):
+    columns = []
+    for colname, unit, data, mask in payload['columns']:
+        if mask is None:
+            columns.append(Column(data, name=colname, unit=unit, copy=False))
+        else:
+            columns.append(MaskedColumn(data, name=colname, mask=mask, unit=unit, copy=False))
+
+    table = Table(columns, copy=False, meta={'comments': payload['comments']})
+
+    return LineList(table, tooltips=payload['tooltips'], name=payload['name'], copy=False)
+
+
+def _read_yaml_described_list(linelist_path, yaml_object):
+    linelist_fullname = linelist_path + os.path.sep + yaml_object['filename']
+
+    linelist = _read_from_disk_cache(linelist_fullname, yaml_object)
+
+    if linelist is None:
+        linelist = LineList.read_list(linelist_fullname, yaml_object)
+        _write_to_disk_cache(linelist_fullname, yaml_object, linelist)
+
+    return linelist
+
+
+def source_size(filename):
+    """
+    Returns the size, in bytes, of the line list file behind
+    a YAML descriptor or an ECSV file.
+    """
+    if filename.endswith('.yaml'):
+        yaml_object = yaml.load(open(filename, 'r'))
+        filename = os.path.join(os.path.dirname(filename), yaml_object['filename'])
+
+    return os.path.getsize(filename)
+
+
+def stream_from_file(filename, wrange, chunk_size=None, progress=None):
+    """
+    Reads a line list file in chunks, keeping only the lines
+    that fall within a wavelength range.
+
+    This is meant for line lists too large to be read whole.
+    Memory use is bounded by the chunk size plus the lines
+    that are kept. Lines are kept in their file order.
+
+    Parameters
+    ----------
+    filename: str
+        YAML descriptor or ECSV file name.
+    wrange: (Quantity, Quantity)
+        minimum and maximum wavelength
+    chunk_size: int
+        approximate number of bytes read at a time. Defaults
+        to STREAMING_CHUNK_SIZE.
+    progress: callable
+        If given, it is called after each chunk with the fraction
+        of the file read so far. Returning False cancels the import.
+
+    Returns
+    -------
+    LineList or None
+        the lines within range, or None if the import was
+        cancelled or the file format is not supported.
+    """
+    chunk_size = chunk_size or STREAMING_CHUNK_SIZE
+
+    if filename.endswith('.yaml'):
+        yaml_object = yaml.load(open(filename, 'r'))
+        names, starts, ends, units, tooltips = _yaml_column_specs(yaml_object)
+
+        data_filename = os.path.join(os.path.dirname(filename), yaml_object['filename'])
+        name = yaml_object['name']
+        has_header = False
+
+        def parse(header, chunk):
+            table = _parse_fixed_width(chunk, names, starts, ends)
+            _set_yaml_column_units(table, units)
+            return table
+
+    elif filename.endswith('.ecsv'):
+        data_filename = filename
+        name = os.path.split(filename)[1]
+        tooltips = None
+        has_header = True
+
+        def parse(header, chunk):
+            # each chunk is read as a complete ECSV file, so
+            # column types come from the header every time.
+            return ascii.read((header + chunk).decode('utf-8'), format='ecsv')
+
+    else:
+        return None
+
+    total_size = max(os.path.getsize(data_filename), 1)
+
+    tables = []
+    comments = []
+    meta = None
+
+    with open(data_filename, 'rb') as f:
+        header = _read_ecsv_header(f) if has_header else b''
+
+        for chunk in _iter_line_chunks(f, chunk_size):
+            table = parse(header, chunk)
+
+            if meta is None:
+                meta = deepcopy(table.meta)
+            comments.extend(table.meta.get('comments', []))
+
+            if len(table):
+                tables.append(table[_range_mask(table, wrange)])
+
+            if progress is not None and progress(f.tell() / total_size) is False:
+                return None
+
+    if not tables:
+        # no lines at all; an empty chunk still provides the columns.
+        tables.append(parse(header, b''))
+
+    if not has_header:
+        meta = {'comments': comments}
+
+    return LineList(_stack_tables(tables, meta), tooltips=tooltips, name=name, copy=False)
+
+
+def _read_ecsv_header(f):
+    # the ECSV header is made of the '#' lines at the top of the
+    # file, plus the line with the column names.
+    header = b''
+    for line in f:
+        header += line
+        if not line.startswith(b'#'):
+            break
+    return header
+
+
+def _iter_line_chunks(f, chunk_size):
+    # yields chunks of whole lines, of about 'chunk_size' bytes.
+    remainder = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+
+        chunk = remainder + chunk
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            remainder = chunk
+            continue
+
+        remainder = chunk[end:]
+        yield chunk[:end]
+
+    if remainder:
+        yield remainder
+
+
+def _range_mask(table, wrange):
+    column = table[WAVELENGTH_COLUMN]
+    bounds = sorted([wrange[0].to(column.unit, equivalencies=u.spectral()).value,
+                     wrange[1].to(column.unit, equivalencies=u.spectral()).value])
+
+    wavelengths = np.asarray(column, dtype=float)
+
+    return (wavelengths >= bounds[0]) & (wavelengths <= bounds[1])
+
+
+def _stack_tables(tables, meta):
+    # stacks tables with the same columns. Column types may
+    # differ in between tables, and are promoted as needed.
+    lengths = [len(table) for table in tables]
+
+    columns = []
+    for colname in tables[0].colnames:
+        unit = tables[0][colname].unit
+
+        data, mask = _concatenate_columns([table[colname] for table in tables], lengths)
+        if mask is None:
+            columns.append(Column(data, name=colname, unit=unit, copy=False))
+        else:
+            columns.append(MaskedColumn(data, name=colname, mask=mask, unit=unit, copy=False))
+
+    return Table(columns, copy=False, meta=meta)
+
+
 # This should be called at the appropriate time when starting the
-# app, so the lists are cached for speedier access later on.
-def populate_linelists_cache():
-    # we could benefit from a threaded approach here. But I couldn't
-    # see the benefits, since the reading of even the largest line
-    # list files takes a fraction of a second at most.
+# app, so the line list library is known for speedier access later
+# on. Only the YAML descriptors, and the summaries stored in the disk
+# cache, are read at this point. The line lists themselves are read
+# when first needed.
+def populate_linelists_cache(parallel=False, max_workers=None):
+    """
+    Registers the line lists in the internal library.
+
+    Parameters
+    ----------
+    parallel: bool
+        If true, line lists that have to be parsed when first needed
+        are parsed in a pool of worker processes. The reading of even
+        the largest bundled list takes a fraction of a second, so this
+        pays off only with large user-supplied libraries.
+    max_workers: int
+        Number of worker processes. None picks one per processor.
+    """
+    _ingestion_options['parallel'] = parallel
+    _ingestion_options['max_workers'] = max_workers
+
     linelist_path = os.path.dirname(os.path.abspath(__file__))
     linelist_path +=  '/../data/linelists/'
-    yaml_paths = glob.glob(linelist_path + '*.yaml')
+
+    # sorted, so the library order doesn't depend on the file system.
+    yaml_paths = sorted(glob.glob(linelist_path + '*.yaml'))
 
     for yaml_filename in yaml_paths:
-        linelist = get_from_file(linelist_path, yaml_filename)
-        _linelists_cache.append(linelist)
+        entry = _LineListEntry.from_descriptor(linelist_path, yaml_filename)
+        _linelists_cache.append(entry)
+
+
+class _LineListEntry(object):
+    """
+    Registry entry for one line list in the library.
+
+    An entry knows how to read its line list, and carries a summary
+    (name, number of lines, wavelength range, units, and comments)
+    that is enough to describe the list without reading it. The
+    full LineList is read on first access.
+    """
+    def __init__(self, linelist_path=None, yaml_object=None, summary=None, linelist=None):
+        self._linelist_path = linelist_path
+        self._yaml_object = yaml_object
+        self._summary = summary
+        self._linelist = linelist
+
+    @classmethod
+    def from_descriptor(cls, linelist_path, yaml_filename):
+        yaml_object = yaml.load(open(yaml_filename, 'r'))
+        linelist_fullname = linelist_path + os.path.sep + yaml_object['filename']
+
+        summary = _read_summary_from_disk_cache(linelist_fullname, yaml_object)
+
+        return cls(linelist_path, yaml_object, summary=summary)
+
+    @classmethod
+    def from_linelist(cls, linelist):
+        return cls(linelist=linelist)
+
+    @property
+    def is_loaded(self):
+        return self._linelist is not None
+
+    @property
+    def has_summary(self):
+        return self._summary is not None or self._linelist is not None
+
+    @property
+    def linelist(self):
+        if self._linelist is None:
+            self._linelist = _read_yaml_described_list(self._linelist_path, self._yaml_object)
+        return self._linelist
+
+    @property
+    def linelist_fullname(self):
+        return self._linelist_path + os.path.sep + self._yaml_object['filename']
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            self._summary = _summarize(self.linelist)
+        return self._summary
+
+
+def _load_entries(entries, parallel=None, max_workers=None):
+    """
+    Makes sure the line lists in the given registry entries are read.
+    Lists that are not in the disk cache can be parsed in parallel.
+    """
+    parallel, max_workers = _resolve_ingestion_options(parallel, max_workers)
+
+    pending = [entry for entry in entries if not entry.is_loaded]
+
+    if not parallel or len(pending) < 2:
+        for entry in pending:
+            entry.linelist
+        return
+
+    to_parse = []
+    for entry in pending:
+        entry._linelist = _read_from_disk_cache(entry.linelist_fullname, entry._yaml_object)
+        if entry._linelist is None:
+            to_parse.append(entry)
+
+    tasks = [('yaml', entry._linelist_path, entry._yaml_object) for entry in to_parse]
+
+    for entry, linelist in zip(to_parse, _parse_in_pool(tasks, max_workers)):
+        entry._linelist = linelist
+        _write_to_disk_cache(entry.linelist_fullname, entry._yaml_object, linelist)
+
+
+def _summarize(linelist):
+    """
+    Returns a dict with the summary of a line list, as stored
+    in the disk cache and in the line list registry.
+    """
+    wmin = wmax = None
+    if linelist.wmin is not None:
+        wmin = float(linelist.wmin)
+        wmax = float(linelist.wmax)
+
+    unit = linelist[WAVELENGTH_COLUMN].unit
+
+    return {'name': linelist.name,
+            'nlines': len(linelist[WAVELENGTH_COLUMN]),
+            'wmin': wmin,
+            'wmax': wmax,
+            'units': None if unit is None else unit.to_string(),
+            'comments': list(linelist.meta.get('comments', []))}
+
+
+def _disk_cache_key(filename, yaml_object):
+    """
+    Returns the (slot, key) pair that identifies the disk cache entry
+    of a line list.
+
+    The slot depends only on the location of the line list file, so
+    that there is at most one entry per file. The key depends on the
+    YAML descriptor and on the file modification time and size, so
+    that any change to either one invalidates the cached entry.
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+
+    slot = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:16]
+
+    key = hashlib.sha1()
+    key.update(str(CACHE_VERSION).encode('utf-8'))
+    key.update(yaml.dump(yaml_object).encode('utf-8'))
+    key.update(str(stat.st_mtime_ns).encode('utf-8'))
+    key.update(str(stat.st_size).encode('utf-8'))
+
+    return slot, key.hexdigest()[:16]
+
+
+def _disk_cache_entry_path(filename, yaml_object):
+    slot, key = _disk_cache_key(filename, yaml_object)
+    return os.path.join(CACHE_PATH, slot + '-' + key)
+
+
+def _read_disk_cache_meta(entry_path):
+    with open(os.path.join(entry_path, CACHE_META_FILE), 'r') as meta_file:
+        return yaml.safe_load(meta_file)
+
+
+def _read_summary_from_disk_cache(filename, yaml_object):
+    """
+    Returns the summary of a line list as stored in its disk cache
+    entry, or None if there is no valid entry. Column arrays are not
+    touched.
+    """
+    try:
+        return _read_disk_cache_meta(_disk_cache_entry_path(filename, yaml_object))['summary']
+    except Exception:
+        return None
+
+
+def _read_from_disk_cache(filename, yaml_object):
+    """
+    Builds a LineList instance from the disk cache entry associated
+    with a line list file. The column arrays are memory-mapped.
+
+    Returns
+    -------
+    LineList or None
+        None if there is no valid cache entry for the file.
+    """
+    try:
+        entry_path = _disk_cache_entry_path(filename, yaml_object)
+
+        if not os.path.isdir(entry_path):
+            return None
+
+        meta = _read_disk_cache_meta(entry_path)
+
+        columns = []
+        for column_meta in meta['columns']:
+            column_path = os.path.join(entry_path, column_meta['file'])
+            data = np.load(column_path, mmap_mode='r')
+
+            if column_meta['masked']:
+                mask = np.load(column_path.replace('.npy', '.mask.npy'))
+                column = MaskedColumn(data, name=column_meta['name'],
+                                      mask=mask, unit=column_meta['unit'],
+                                      copy=False)
+            else:
+                column = Column(data, name=column_meta['name'],
+                                unit=column_meta['unit'], copy=False)
+            columns.append(column)
+
+        table = Table(columns, copy=False, meta={'comments': meta['comments']})
+
+        return LineList(table, tooltips=meta['tooltips'], name=meta['name'], copy=False)
+
+    except Exception as err:
+        # a damaged or unreadable entry is just a cache miss.
+        logging.debug("Line list cache miss for '%s': %s", filename, err)
+        return None
+
+
+def _write_to_disk_cache(filename, yaml_object, linelist):
+    """
+    Stores the columns of a freshly parsed line list in the disk
+    cache, and evicts any stale entry left behind for the same file.
+
+    Failing to write the cache is not an error; the list will just
+    be parsed again next time.
+    """
+    try:
+        slot, key = _disk_cache_key(filename, yaml_object)
+
+        if not os.path.exists(CACHE_PATH):
+            os.makedirs(CACHE_PATH)
+
+        # write to a scratch directory first, and rename it into
+        # place when complete, so that readers never see a partial
+        # entry.
+        scratch_path = tempfile.mkdtemp(dir=CACHE_PATH, prefix='.tmp-')
+
+        columns_meta = []
+        for index, colname in enumerate(linelist.colnames):
+            column = linelist[colname]
+            column_file = 'column_{}.npy'.format(index)
+            masked = isinstance(column, MaskedColumn)
+
+            np.save(os.path.join(scratch_path, column_file),
+                    np.ascontiguousarray(column.data.data if masked else column.data))
+            if masked:
+                np.save(os.path.join(scratch_path, column_file.replace('.npy', '.mask.npy')),
+                        np.ma.getmaskarray(column.data))
+
+            columns_meta.append({'name': colname,
+                                 'file': column_file,
+                                 'unit': None if column.unit is None else column.unit.to_string(),
+                                 'masked': masked})
+
+        meta = {'name': linelist.name,
+                'source': os.path.abspath(filename),
+                'tooltips': linelist.tooltips,
+                'comments': list(linelist.meta.get('comments', [])),
+                'columns': columns_meta,
+                'summary': _summarize(linelist)}
+
+        with open(os.path.join(scratch_path, CACHE_META_FILE), 'w') as meta_file:
+            yaml.safe_dump(meta, meta_file)
+
+        entry_path = os.path.join(CACHE_PATH, slot + '-' + key)
+        if os.path.exists(entry_path):
+            shutil.rmtree(scratch_path, ignore_errors=True)
+        else:
+            os.rename(scratch_path, entry_path)
+
+        # evict entries built for older versions of the same file.
+        for stale_path in glob.glob(os.path.join(CACHE_PATH, slot + '-*')):
+            if stale_path != entry_path:
+                shutil.rmtree(stale_path, ignore_errors=True)
+
+    except Exception as err:
+        logging.warning("Could not cache line list '%s': %s", filename, err)
 
 
 def get_from_cache(index):
-    return _linelists_cache[index]
+    return _linelists_cache[index].linelist
 
 
 def ingest(range):
     """
-    Returns a list with LineList instances.
+    Returns a list with LineList views.
 
     Each original list is stripped out of lines that lie outside the
-    wavelength range.
+    wavelength range. Lists with no lines in the range are skipped.
+    Lists whose wavelength interval doesn't overlap the range are
+    not even read.
 
     Parameters
     ----------
     range:
         The wavelength range of interest.
 
-    Returns
-    -------
-    [LineList, ...]
-        The list of linelists found.
-    """
-    result = []
-    for linelist in _linelists_cache:
-        try:
-            ll = linelist.extract_range(range)
-            result.append(ll)
-        except UnitConversionError as err:
-            pass
+    Returns
+    -------
+    [LineListView, ...]
+        The list of linelists found.
+    """
+    return _get_interval_index().extract_range(range)
+
+
+def _get_interval_index():
+    # the index is rebuilt whenever lists are added to the library.
+    global _interval_index
+
+    if _interval_index is None or not _interval_index.covers(_linelists_cache):
+        _interval_index = _IntervalIndex(_linelists_cache)
+
+    return _interval_index
+
+
+class _IntervalIndex(object):
+    """
+    Wavelength index over all the line lists in the library.
+
+    The index holds the wavelength interval spanned by each list, in
+    INDEX_UNIT, taken from the list summaries. Queries find the lists
+    that overlap the range first, read just those, and search each
+    one in its own wavelength index. Lists whose wavelengths can't be
+    expressed as a spectral quantity are left out of the index
+    altogether.
+
+    Parameters
+    ----------
+    entries: [_LineListEntry, ...]
+        registry entries. Lists are read only if their summary
+        is not in the disk cache.
+    """
+    # list intervals are widened by this relative amount, so that
+    # round off in unit conversions doesn't leave out lines sitting
+    # right at the end points of a range.
+    _LEEWAY = 1.e-9
+
+    def __init__(self, entries):
+        self._entries = list(entries)
+
+        _load_entries([entry for entry in self._entries if not entry.has_summary])
+
+        list_ids = []
+        wmin = []
+        wmax = []
+        for list_id, entry in enumerate(self._entries):
+            summary = entry.summary
+            if summary['wmin'] is None or summary['units'] is None:
+                continue
+
+            unit = u.Unit(summary['units'])
+            if not unit.is_equivalent(INDEX_UNIT, equivalencies=u.spectral()):
+                continue
+
+            bounds = u.Quantity([summary['wmin'], summary['wmax']], unit)
+            bounds = np.sort(bounds.to(INDEX_UNIT, equivalencies=u.spectral()).value)
+
+            list_ids.append(list_id)
+            wmin.append(bounds[0] * (1. - self._LEEWAY))
+            wmax.append(bounds[1] * (1. + self._LEEWAY))
+
+        self._list_ids = np.array(list_ids, dtype=np.intp)
+        self._wmin = np.array(wmin, dtype=float)
+        self._wmax = np.array(wmax, dtype=float)
+
+    def __len__(self):
+        return len(self._list_ids)
+
+    def covers(self, entries):
+        """
+        Tells if the index was built from exactly these entries.
+        """
+        return len(entries) == len(self._entries) and \
+               all(entry is indexed for entry, indexed in zip(entries, self._entries))
+
+    def overlapping(self, wrange):
+        """
+        Returns the registry entries of the lists whose wavelength
+        interval overlaps the range, in the library order. Ranges
+        that are not spectral match nothing.
+        """
+        unit = wrange[0].unit
+        if not unit.is_equivalent(INDEX_UNIT, equivalencies=u.spectral()) or \
+           not wrange[1].unit.is_equivalent(INDEX_UNIT, equivalencies=u.spectral()):
+            return []
+
+        bounds = sorted([wrange[0].to(INDEX_UNIT, equivalencies=u.spectral()).value,
+                         wrange[1].to(INDEX_UNIT, equivalencies=u.spectral()).value])
+
+        overlaps = (self._wmin <= bounds[1]) & (self._wmax >= bounds[0])
+
+        return [self._entries[list_id] for list_id in self._list_ids[overlaps]]
+
+    def extract_range(self, wrange):
+        """
+        Builds views, one per list, with the lines that fall
+        within the wavelength range, in the library order.
+        """
+        entries = self.overlapping(wrange)
+        _load_entries(entries)
+
+        result = []
+        for entry in entries:
+            view = entry.linelist.extract_range(wrange)
+            if len(view) > 0:
+                result.append(view)
+
+        return result
+
+
+def descriptions():
+    """
+    Returns a python list with strings containing a description of each line list.
+
+    Descriptions are built from the line list summaries, so they do
+    not require the lists themselves to be read.
+
+    Returns
+    -------
+    list
+        The list of strings.
+    """
+    _load_entries([entry for entry in _linelists_cache if not entry.has_summary])
+
+    result = []
+    for entry in _linelists_cache:
+        summary = entry.summary
+
+        desc = summary['name']
+        nlines = summary['nlines']
+        w1 = summary['wmin']
+        w2 = summary['wmax']
+        units = summary['units']
+
+        description = '{:15}  ({:>d},  [ {:.2f} - {:.2f} ] {})'.format(desc, nlines, w1, w2, units)
+
+        result.append(description)
+
+    return result
+
+
+def _read_fixed_width_no_header(filename, names, col_starts, col_ends):
+    """
+    Reads a fixed width table without header, the same way as
+    `~astropy.io.ascii` does with format 'fixed_width_no_header',
+    but in bulk.
+
+    The file is read once. Lines are located in the raw buffer,
+    and each column is cut out of all data lines at once with
+    numpy indexing; numeric columns are then converted in one
+    go. Lines starting with '#' are kept in meta['comments'].
+
+    Parameters
+    ----------
+    filename: str
+        the file to read
+    names: [str, ...]
+        column names
+    col_starts, col_ends: [int, ...]
+        first and last (inclusive) character positions of
+        each column
+
+    Returns
+    -------
+    `~astropy.table.Table`
+        the table read from the file.
+    """
+    with open(filename, 'rb') as f:
+        raw = f.read()
+
+    table = _parse_fixed_width(raw, names, col_starts, col_ends)
+    if len(table) == 0:
+        raise ValueError("no data lines in {}".format(filename))
+
+    return table
+
+
+def _parse_fixed_width(raw, names, col_starts, col_ends):
+    # Parses the fixed width lines in a bytes object. Returns a
+    # table, which can be empty if there are no data lines.
+    if not raw.endswith(b'\n'):
+        raw += b'\n'
+
+    buffer = np.frombuffer(raw, dtype=np.uint8)
+    string_kind = 'S'
+    if buffer.max() >= 128:
+        # column positions count characters, not bytes.
+        buffer = np.frombuffer(raw.decode('utf-8').encode('utf-32-le'), dtype='<u4')
+        string_kind = '<U'
+
+    ends = np.flatnonzero(buffer == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # DOS line endings.
+    is_cr = buffer[np.maximum(ends - 1, 0)] == ord('\r')
+    ends = np.where(is_cr & (ends > starts), ends - 1, ends)
+
+    # running count of non blank characters, used to skip blank
+    # lines and to find comment lines: those where a '#' is the
+    # first non blank character.
+    nonblank = np.zeros(len(buffer) + 1, dtype=np.intp)
+    np.cumsum(buffer > ord(' '), out=nonblank[1:])
+    has_text = nonblank[ends] > nonblank[starts]
+
+    hashes = np.flatnonzero(buffer == ord('#'))
+    hash_lines = np.searchsorted(ends, hashes)
+    is_comment = np.zeros(len(ends), dtype=bool)
+    is_comment[hash_lines[nonblank[hashes] == nonblank[starts[hash_lines]]]] = True
+
+    comments = []
+    for line in np.flatnonzero(is_comment):
+        text = buffer[starts[line]:ends[line]].tobytes()
+        text = text.decode('utf-8' if string_kind == 'S' else 'utf-32-le')
+        comments.append(text.lstrip()[1:].strip())
+
+    data_lines = np.flatnonzero(has_text & ~is_comment)
+    line_starts = starts[data_lines][:, np.newaxis]
+    line_ends = ends[data_lines][:, np.newaxis]
+
+    columns = []
+    for name, start, end in zip(names, col_starts, col_ends):
+        # characters past the end of a line read as blanks.
+        width = end - start + 1
+        index = line_starts + np.arange(start, end + 1)
+        chars = np.where(index < line_ends, buffer[np.minimum(index, len(buffer) - 1)], ord(' '))
+        chars = np.ascontiguousarray(chars, dtype=buffer.dtype)
+        values = np.char.strip(chars.view(string_kind + str(width)).ravel())
+
+        data, mask = _convert_fixed_width_values(values)
+        if mask is None:
+            columns.append(Column(data, name=name, copy=False))
+        else:
+            columns.append(MaskedColumn(data, name=name, mask=mask, copy=False))
+
+    return Table(columns, copy=False, meta={'comments': comments})
+
+
+def _convert_fixed_width_values(values):
+    # Blank cells are masked. Types are guessed the same way
+    # as astropy does: int, then float, then str.
+    lengths = np.char.str_len(values)
+    mask = lengths == 0
+
+    filled = values
+    if mask.any():
+        filled = np.where(mask, values.dtype.type('0'), values)
+    else:
+        mask = None
+
+    for dtype in (int, float):
+        try:
+            return filled.astype(dtype), mask
+        except (ValueError, OverflowError):
+            pass
+
+    width = lengths.max() if len(lengths) else 1
+    return filled.astype('U{}'.format(max(width, 1))), mask
+
+
+# Fast readers for the formats named in the YAML descriptors.
+# They must build the same table as `~astropy.io.ascii` would,
+# and raise an exception to fall back to it.
+_fast_readers = {
+    'fixed_width_no_header': _read_fixed_width_no_header,
+}
+
+
+def _yaml_column_specs(yaml_object):
+    # column names, start and end positions, units, and
+    # tool tips, as defined in a YAML descriptor.
+    names_list = []
+    start_list = []
+    end_list = []
+    units_list = []
+    tooltips_list = []
+    for k in range(len((yaml_object['columns']))):
+        name = yaml_object['columns'][k][COLUMN_NAME]
+        names_list.append(name)
+
+        start = yaml_object['columns'][k][COLUMN_START]
+        end = yaml_object['columns'][k][COLUMN_END]
+        start_list.append(start)
+        end_list.append(end)
+
+        units = ''
+        if UNITS_COLUMN in yaml_object['columns'][k]:
+            units = yaml_object['columns'][k][UNITS_COLUMN]
+        units_list.append(units)
+
+        tooltip = ''
+        if TOOLTIP_COLUMN in yaml_object['columns'][k]:
+            tooltip = yaml_object['columns'][k][TOOLTIP_COLUMN]
+        tooltips_list.append(tooltip)
+
+    return names_list, start_list, end_list, units_list, tooltips_list
+
+
+def _set_yaml_column_units(tab, units_list):
+    for k, colname in enumerate(tab.columns):
+        tab[colname].unit = units_list[k]
+
+        # some line lists have a 'Reference' column that is
+        # wrongly read as type int. Must be str instead,
+        # otherwise an error is raised when merging.
+        if colname in ['Reference']:
+            tab[colname] = tab[colname].astype(str)
+
+
+class _WavelengthIndex(object):
+    """
+    Wavelength range queries and row extraction, shared by the
+    line list representations. Subclasses must support access to
+    the wavelength column by name, and carry the '_sort_index' and
+    '_sorted_wavelengths' attributes.
+    """
+    __slots__ = ()
+
+    @property
+    def sort_index(self):
+        """
+        Row indices that sort the list by wavelength, in the
+        list's native wavelength units.
+        """
+        sort_index = self._sort_index
+        if sort_index is None:
+            wavelengths = np.asarray(self[WAVELENGTH_COLUMN].data, dtype=float)
+            sort_index = np.argsort(wavelengths, kind='mergesort')
+
+            # lists are read from other threads, e.g. by the line list
+            # view builder. The index is published last, so whoever
+            # sees it also sees the sorted wavelengths.
+            self._sorted_wavelengths = wavelengths[sort_index]
+            self._sort_index = sort_index
+        return sort_index
+
+    @property
+    def sorted_wavelengths(self):
+        """
+        The wavelength column values, sorted, in the
+        list's native wavelength units.
+        """
+        self.sort_index
+        return self._sorted_wavelengths
+
+    def extract_range(self, wrange):
+        """
+        Builds a view on self, with the subset
+        of lines that fall within the
+        wavelength range defined by 'wmin' and 'wmax'.
+
+        REMOVED FOR NOW: The actual range is somewhat
+        wider, to allow for radial velocity and redshift
+        effects. The actual handling of this must wait
+        until we get more detailed specs for the redshift
+        functionality.
+
+        Parameters
+        ----------
+        wrange: (Quantity, Quantity)
+            minimum and maximum wavelength of the data
+            (spectrum) wavelength range
+
+        Returns
+        -------
+        LineListView
+            view on the subset of lines
+        """
+        # rows are returned in their original order.
+        start, stop = self._range_bounds(wrange)
+        rows = np.sort(self.sort_index[start:stop])
+
+        # new instance inherits the name from parent.
+        return LineListView(self, rows, name=self.name)
+
+    def count_in_range(self, wrange):
+        """
+        Returns the number of lines that fall within the
+        wavelength range, without extracting them.
 
-    return result
+        Parameters
+        ----------
+        wrange: (Quantity, Quantity)
+            minimum and maximum wavelength
 
+        Returns
+        -------
+        int
+            number of lines in range
+        """
+        start, stop = self._range_bounds(wrange)
+        return stop - start
 
-def descriptions():
-    """
-    Returns a python list with strings containing a description of each line list.
+    def _range_bounds(self, wrange):
+        """
+        Returns the (start, stop) positions of the wavelength
+        range in the sorted wavelength array.
+
+        Instead of converting every line to the units the range
+        is expressed in, the range end points are converted to
+        the list's native units. Conversions in between
+        wavelength and frequency or energy invert the order of
+        the end points, thus we sort them after converting.
+        """
+        unit = self[WAVELENGTH_COLUMN].unit
+        bounds = sorted([wrange[0].to(unit, equivalencies=u.spectral()).value,
+                         wrange[1].to(unit, equivalencies=u.spectral()).value])
 
-    Returns
-    -------
-    list
-        The list of strings.
-    """
-    result = []
-    for linelist in _linelists_cache:
+        # add some leeway at the short and long end points.
+        # For now, we extend both ends by 10%. This might
+        # be enough at the short end, but it remains to be
+        # seen how this plays out when we add redshift
+        # functionality to the app.
+        #
+        # REMOVING THIS FOR NOW.
+        # bounds = [bounds[0] - bounds[0] * 0.1, bounds[1] + bounds[1] * 0.1]
 
-        desc = linelist.name
-        nlines = len(linelist[WAVELENGTH_COLUMN])
-        w1 = linelist.wmin
-        w2 = linelist.wmax
-        units = linelist[WAVELENGTH_COLUMN].unit
+        start = np.searchsorted(self.sorted_wavelengths, bounds[0], side='left')
+        stop = np.searchsorted(self.sorted_wavelengths, bounds[1], side='right')
 
-        description = '{:15}  ({:>d},  [ {:.2f} - {:.2f} ] {})'.format(desc, nlines, w1, w2, units)
+        return int(start), int(stop)
 
-        result.append(description)
+    def extract_rows(self, indices):
+        """
+        Builds a view on self, with the subset
+        of lines pointed by 'indices'
 
-    return result
+        Parameters
+        ----------
+        indices: [QModelIndex, ...]
+            List of QModelIndex instances to extract from.
+
+        Returns
+        -------
+        LineListView
+            view on the subset of lines
+        """
+        return LineListView(self, _rows_from_indices(indices, len(self)), name=self.name)
 
 
 # Inheriting from QTable somehow makes this class incompatible
 # with the registry machinery in astropy.
 
-class LineList(Table):
+class LineList(_WavelengthIndex, Table):
     """
     A list of emission/absorption lines
 
@@ -160,18 +1182,20 @@ class LineList(Table):
 
     masked: bool
         If true, a masked table is used.
+
+    copy: bool
+        If false, the columns share their buffers with 'table'.
     """
 
-    def __init__(self, table=None, tooltips=None, name=None, masked=None):
-        Table.__init__(self, data=table, masked=masked)
+    def __init__(self, table=None, tooltips=None, name=None, masked=None, copy=True):
+        Table.__init__(self, data=table, masked=masked, copy=copy)
 
         self.name = name
 
-        # We have to carry internally a raw reference to the
-        # table data so as to be able to use vstack() to perform
-        # merging. This shouldn't be a problem as long as the
-        # LineList instance is regarded as immutable. Which it
-        # should be anyways.
+        # We carry internally a raw reference to the table
+        # data, which is what gets exported. This shouldn't be
+        # a problem as long as the LineList instance is regarded
+        # as immutable. Which it should be anyways.
 
         self._table = table
 
@@ -191,49 +1215,55 @@ class LineList(Table):
         # tool tips associated to each column.
         self.tooltips = tooltips
 
+        # sort order over the wavelength column, computed on the
+        # first range query.
+        self._sort_index = None
+        self._sorted_wavelengths = None
+
+        self._compact = None
+
+        # per-group attributes, for merged lists only.
+        self._group_runs = None
+        self._groups = None
+        self.group_names = None
+        self.group_colors = None
+        self.group_heights = None
+        self.group_redshifts = None
+
     @property
     def table(self):
         return self._table
 
+    @property
+    def compact(self):
+        """
+        A `CompactLineList` with the contents of this list. Numeric
+        columns share their buffers with this list.
+        """
+        if self._compact is None:
+            self._compact = CompactLineList.from_table(self, name=self.name,
+                                                       tooltips=self.tooltips)
+        return self._compact
+
     @classmethod
     def read_list(cls, filename, yaml_object):
-        names_list = []
-        start_list = []
-        end_list = []
-        units_list = []
-        tooltips_list = []
-        for k in range(len((yaml_object['columns']))):
-            name = yaml_object['columns'][k][COLUMN_NAME]
-            names_list.append(name)
-
-            start = yaml_object['columns'][k][COLUMN_START]
-            end = yaml_object['columns'][k][COLUMN_END]
-            start_list.append(start)
-            end_list.append(end)
-
-            units = ''
-            if UNITS_COLUMN in yaml_object['columns'][k]:
-                units = yaml_object['columns'][k][UNITS_COLUMN]
-            units_list.append(units)
-
-            tooltip = ''
-            if TOOLTIP_COLUMN in yaml_object['columns'][k]:
-                tooltip = yaml_object['columns'][k][TOOLTIP_COLUMN]
-            tooltips_list.append(tooltip)
-
-        tab = ascii.read(filename, format = yaml_object['format'],
-                         names = names_list,
-                         col_starts = start_list,
-                         col_ends = end_list)
-
-        for k, colname in enumerate(tab.columns):
-            tab[colname].unit = units_list[k]
-
-            # some line lists have a 'Reference' column that is
-            # wrongly read as type int. Must be str instead,
-            # otherwise an error is raised when merging.
-            if colname in ['Reference']:
-                tab[colname] = tab[colname].astype(str)
+        names_list, start_list, end_list, units_list, tooltips_list = _yaml_column_specs(yaml_object)
+
+        tab = None
+        reader = _fast_readers.get(yaml_object['format'])
+        if reader is not None:
+            try:
+                tab = reader(filename, names_list, start_list, end_list)
+            except Exception as err:
+                logging.debug("Fast reader failed for '%s': %s", filename, err)
+
+        if tab is None:
+            tab = ascii.read(filename, format = yaml_object['format'],
+                             names = names_list,
+                             col_starts = start_list,
+                             col_ends = end_list)
+
+        _set_yaml_column_units(tab, units_list)
 
         # The table name (for e.g. display purposes)
         # is taken from the 'name' element in the
@@ -244,13 +1274,24 @@ class LineList(Table):
     @classmethod
     def merge(cls, lists, target_units):
         """
-        Executes a 'vstack' of all input lists, and
-        then sorts the result by the wavelength column.
+        Merges all input lists into a single list, sorted by
+        wavelength in 'target_units'.
+
+        The input lists are left untouched: wavelengths are
+        converted into fresh arrays, and each list's sort order
+        is used to merge the already sorted runs, instead of
+        stacking and re-sorting everything.
+
+        The color, height, and redshift attributes of each input
+        list are not replicated row by row. They are kept once per
+        input list (the list 'groups'), and each line in the merged
+        list refers to its group by way of a run-length encoded
+        group index. See `groups` and `group_colors`.
 
         Parameters
         ----------
-        lists: [LineList, ...]
-            list of LineList instances
+        lists: [LineList, LineListView, or CompactLineList, ...]
+            list of line lists, in any representation
         target_units: Units
             units to which all lines from all tables
             must be converted to.
@@ -260,153 +1301,681 @@ class LineList(Table):
         LineList
             merged line list
         """
-        tables = []
-        for linelist in lists:
+        compacts = [linelist.compact for linelist in lists]
+
+        # converted wavelengths, sorted, plus the row order
+        # that sorts each input list.
+        sorted_runs = []
+        orders = []
+        for compact in compacts:
+            order = compact.sort_index
+            wavelengths = _converted_wavelengths(compact, target_units)[order]
+
+            # conversions in between wavelength and frequency
+            # or energy reverse the sort order.
+            if len(wavelengths) > 1 and wavelengths[0] > wavelengths[-1]:
+                order = order[::-1]
+                wavelengths = wavelengths[::-1]
+
+            sorted_runs.append(wavelengths)
+            orders.append(order)
+
+        # position of every merged line in the concatenation
+        # of the sorted inputs.
+        permutation = _merge_sorted_runs(sorted_runs)
+        lengths = [len(run) for run in sorted_runs]
+
+        # merged columns, in the order they first appear in the
+        # inputs. Columns missing from some input are masked there.
+        colnames = []
+        tooltips = []
+        for linelist, compact in zip(lists, compacts):
+            for k, colname in enumerate(compact.colnames):
+                if colname not in colnames:
+                    colnames.append(colname)
+                    tooltips.append(linelist.tooltips[k] if linelist.tooltips else '')
+
+        columns = []
+        for colname in colnames:
+            if colname == WAVELENGTH_COLUMN:
+                data = np.concatenate(sorted_runs)[permutation]
+                columns.append(Column(data, name=colname, unit=target_units, copy=False))
+                continue
+
+            pieces = []
+            unit = None
+            for compact, order in zip(compacts, orders):
+                if colname in compact.colnames:
+                    pieces.append(compact[colname][order])
+                    if unit is None:
+                        unit = compact.unit(colname)
+                else:
+                    pieces.append(None)
+
+            data, mask = _concatenate_columns(pieces, lengths)
+            if mask is None:
+                column = Column(data[permutation], name=colname, unit=unit, copy=False)
+            else:
+                column = MaskedColumn(data[permutation], name=colname, mask=mask[permutation],
+                                      unit=unit, copy=False)
+            columns.append(column)
+
+        # run-length encoded group index.
+        groups = np.repeat(np.arange(len(lists)), lengths)[permutation]
+        if len(groups):
+            run_starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+        else:
+            run_starts = np.zeros(0, dtype=np.intp)
+
+        # redshifted wavelengths, computed per group.
+        factors = np.array([_redshift_factor(linelist) for linelist in lists], dtype=float)
+        wavelengths = columns[colnames.index(WAVELENGTH_COLUMN)].data
+        z_wavelength = wavelengths * factors[groups] if len(groups) else wavelengths.copy()
+        columns.append(Column(z_wavelength, name=REDSHIFTED_WAVELENGTH_COLUMN,
+                              unit=target_units, copy=False))
+        tooltips.append('')
+
+        table = Table(columns, copy=False)
+
+        result = cls(table, tooltips=tooltips, name="Merged", copy=False)
+
+        result._group_runs = (run_starts, groups[run_starts], len(groups))
+        result.group_names = [linelist.name for linelist in lists]
+        result.group_colors = [linelist.color for linelist in lists]
+        result.group_heights = np.array([linelist.height for linelist in lists], dtype=float)
+        result.group_redshifts = [(linelist.redshift, linelist.z_units) for linelist in lists]
+
+        return result
+
+    @property
+    def groups(self):
+        """
+        For a merged list, the index of the input list (group) each
+        line came from; None otherwise. The array is expanded from
+        the run-length encoded group index on first access, and is
+        read-only.
+        """
+        if self._group_runs is None:
+            return None
+
+        if self._groups is None:
+            run_starts, run_groups, nrows = self._group_runs
+            run_lengths = np.diff(np.append(run_starts, nrows))
+
+            groups = np.repeat(run_groups, run_lengths)
+            groups.flags.writeable = False
+            self._groups = groups
+
+        return self._groups
+
+    def setRedshift(self, redshift, z_units):
+        self.redshift = redshift
+        self.z_units = z_units
+
+    def setColor(self, color):
+        self.color = color
+
+    def setHeight(self, height):
+        self.height = height
+
+
+def _rows_from_indices(indices, nrows):
+    # row numbers from a selection, without duplicates,
+    # in their original order.
+    selected = np.zeros(nrows, dtype=bool)
+    selected[np.fromiter((index.row() for index in indices), dtype=np.intp)] = True
+    return np.flatnonzero(selected)
+
+
+def _converted_wavelengths(linelist, target_units):
+    # a fresh array with the wavelengths of 'linelist'
+    # converted to 'target_units'.
+    unit = linelist.unit(WAVELENGTH_COLUMN)
+    wavelengths = u.Quantity(linelist.values(WAVELENGTH_COLUMN), unit, dtype=float, copy=True)
+    return wavelengths.to(target_units, equivalencies=u.spectral()).value
+
+
+def _redshift_factor(linelist):
+    f = 1. + linelist.redshift
+    if linelist.z_units == 'km/s':
+        f = 1. + linelist.redshift / constants.c.value * 1000.
+    return f
+
+
+def _merge_sorted_runs(runs):
+    """
+    Merges sorted arrays.
+
+    Runs are merged pairwise, in a balanced way, so each value
+    takes part in log(k) vectorized merge steps. Ties are
+    resolved in favor of the earlier run, thus the merge is
+    stable with respect to the input order.
+
+    Parameters
+    ----------
+    runs: [ndarray, ...]
+        sorted 1-D arrays
+
+    Returns
+    -------
+    ndarray
+        indices that sort the concatenation of all runs.
+    """
+    merged = []
+    offset = 0
+    for run in runs:
+        merged.append((run, np.arange(offset, offset + len(run))))
+        offset += len(run)
+
+    if not merged:
+        return np.zeros(0, dtype=np.intp)
+
+    while len(merged) > 1:
+        pairs = []
+        for k in range(0, len(merged) - 1, 2):
+            pairs.append(_merge_two_runs(merged[k], merged[k + 1]))
+        if len(merged) % 2:
+            pairs.append(merged[-1])
+        merged = pairs
+
+    return merged[0][1]
+
+
+def _merge_two_runs(left, right):
+    left_values, left_indices = left
+    right_values, right_indices = right
+
+    # final positions of the right hand values; they
+    # go after any equal values from the left run.
+    nvalues = len(left_values) + len(right_values)
+    right_positions = np.searchsorted(left_values, right_values, side='right') + \
+                      np.arange(len(right_values))
+    is_right = np.zeros(nvalues, dtype=bool)
+    is_right[right_positions] = True
+
+    values = np.empty(nvalues, dtype=np.result_type(left_values, right_values))
+    values[right_positions] = right_values
+    values[~is_right] = left_values
+
+    indices = np.empty(nvalues, dtype=np.intp)
+    indices[right_positions] = right_indices
+    indices[~is_right] = left_indices
+
+    return values, indices
+
+
+def _concatenate_columns(pieces, lengths):
+    """
+    Concatenates column pieces from different lists. A piece
+    can be None when the list lacks the column; its cells are
+    masked in the result.
+
+    Returns
+    -------
+    (ndarray, ndarray or None)
+        the data, and the mask (None if nothing is masked).
+    """
+    present = [piece for piece in pieces if piece is not None]
+
+    # a column can be read as numbers from one list and as strings
+    # from another (e.g. 'Reference'). Strings win in that case.
+    kinds = set(piece.dtype.kind in 'USO' for piece in present)
+    if len(kinds) > 1:
+        present = [np.asarray(piece).astype(str) for piece in present]
+        dtype = np.result_type(*present)
+    else:
+        dtype = np.result_type(*[piece.dtype for piece in present])
+
+    data = []
+    masks = []
+    present = iter(present)
+    for piece, length in zip(pieces, lengths):
+        if piece is None:
+            data.append(np.zeros(length, dtype=dtype))
+            masks.append(np.ones(length, dtype=bool))
+        else:
+            piece = next(present)
+            data.append(np.asarray(piece.data if hasattr(piece, 'mask') else piece).astype(dtype, copy=False))
+            masks.append(np.ma.getmaskarray(piece) if hasattr(piece, 'mask') else
+                         np.zeros(length, dtype=bool))
+
+    mask = np.concatenate(masks)
+    data = np.concatenate(data)
+
+    return data, (mask if mask.any() else None)
+
+
+class LineListView(object):
+    """
+    A subset of the lines in a `LineList` or `CompactLineList`.
+
+    A view holds just an array with row numbers into its parent
+    list, and shares the parent's column buffers. Column values
+    are gathered for the rows in the view only when a column is
+    accessed. Views of views point directly to the original list,
+    so building sets of sets never copies the catalog.
+
+    A real `LineList` is built only by `materialize`, for export
+    or merging.
+
+    Parameters
+    ----------
+    parent: LineList or CompactLineList
+        The list that holds the actual column buffers.
+    rows: array of int
+        Row numbers in 'parent', in increasing order.
+    name: str
+        The name of the view. Defaults to the parent's name.
+    """
+    def __init__(self, parent, rows, name=None):
+        self._parent = parent
+        self._rows = np.asarray(rows, dtype=np.intp)
+
+        self.name = parent.name if name is None else name
+
+        self._compact = None
+
+        # each view has its own color, height, and redshift attributes
+        self.color = None
+        self.height = DEFAULT_HEIGHT
+        self.redshift = 0.
+        self.z_units = 'z'
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def colnames(self):
+        return self._parent.colnames
+
+    @property
+    def meta(self):
+        return self._parent.meta
+
+    @property
+    def tooltips(self):
+        return self._parent.tooltips
+
+    @property
+    def wmin(self):
+        if len(self._rows):
+            return self._wavelengths().min()
 
-            # Note that vstack operates on Table instances but
-            # not on LineList instances. So we refer directly
-            # to the raw Table instances.
+    @property
+    def wmax(self):
+        if len(self._rows):
+            return self._wavelengths().max()
 
-            internal_table = linelist._table
-            internal_table[WAVELENGTH_COLUMN].convert_unit_to(target_units, equivalencies=u.spectral())
+    @property
+    def table(self):
+        return self.materialize().table
 
-            # add columns to hold color and height attributes
-            color_array = np.full(len(internal_table[WAVELENGTH_COLUMN]), linelist.color)
-            internal_table[COLOR_COLUMN] = color_array
-            height_array = np.full(len(internal_table[WAVELENGTH_COLUMN]), linelist.height)
-            internal_table[HEIGHT_COLUMN] = height_array
+    def __len__(self):
+        return len(self._rows)
 
-            # add column to hold redshifted wavelength
-            f =  1. + linelist.redshift
-            if linelist.z_units == 'km/s':
-                f = 1. + linelist.redshift / constants.c.value * 1000.
-            z_wavelength = internal_table[WAVELENGTH_COLUMN] * f
-            internal_table[REDSHIFTED_WAVELENGTH_COLUMN] = z_wavelength
+    def __getitem__(self, colname):
+        return self._parent[colname][self._rows]
 
-            # add column to hold plot markers
-            marker_array = np.full(len(internal_table[WAVELENGTH_COLUMN]), None)
-            internal_table[MARKER_COLUMN] = marker_array
+    @property
+    def compact(self):
+        """
+        A `CompactLineList` with copies of the rows in this view.
+        """
+        if self._compact is None:
+            self._compact = self._parent.compact.take(self._rows)
+            self._compact.name = self.name
+        return self._compact
 
-            tables.append(internal_table)
+    def _wavelengths(self):
+        return np.asarray(self._parent[WAVELENGTH_COLUMN].data, dtype=float)[self._rows]
 
-        merged_table = vstack(tables)
+    def _range_mask(self, wrange):
+        unit = self._parent[WAVELENGTH_COLUMN].unit
+        bounds = sorted([wrange[0].to(unit, equivalencies=u.spectral()).value,
+                         wrange[1].to(unit, equivalencies=u.spectral()).value])
 
-        merged_table.sort(WAVELENGTH_COLUMN)
+        wavelengths = self._wavelengths()
 
-        return cls(merged_table, "Merged")
+        return (wavelengths >= bounds[0]) & (wavelengths <= bounds[1])
 
     def extract_range(self, wrange):
         """
-        Builds a LineList instance out of self, with
-        the subset of lines that fall within the
-        wavelength range defined by 'wmin' and 'wmax'.
+        Builds a view with the subset of lines in this view that
+        fall within a wavelength range. See `LineList.extract_range`.
+        """
+        return LineListView(self._parent, self._rows[self._range_mask(wrange)], name=self.name)
 
-        REMOVED FOR NOW: The actual range is somewhat
-        wider, to allow for radial velocity and redshift
-        effects. The actual handling of this must wait
-        until we get more detailed specs for the redshift
-        functionality.
+    def count_in_range(self, wrange):
+        """
+        Returns the number of lines in this view that fall within
+        a wavelength range. See `LineList.count_in_range`.
+        """
+        return int(np.count_nonzero(self._range_mask(wrange)))
 
-        Parameters
-        ----------
-        wrange: (Quantity, Quantity)
-            minimum and maximum wavelength of the data
-            (spectrum) wavelength range
+    def extract_rows(self, indices):
+        """
+        Builds a view with the subset of lines in this view pointed
+        by 'indices'. See `LineList.extract_rows`.
+        """
+        rows = self._rows[_rows_from_indices(indices, len(self._rows))]
+        return LineListView(self._parent, rows, name=self.name)
+
+    def materialize(self):
+        """
+        Builds a real `LineList` with copies of the rows in this view.
 
         Returns
         -------
         LineList
-            line list with subset of lines
+            a new list, with the same name and plotting attributes
+            as this view.
         """
-        wavelengths = self[WAVELENGTH_COLUMN].quantity
+        columns = [self[colname] for colname in self.colnames]
+        table = Table(columns, copy=False, meta=deepcopy(self.meta))
 
-        wmin = wrange[0]
-        wmax = wrange[1]
+        result = LineList(table, tooltips=self.tooltips, name=self.name)
+        result.setColor(self.color)
+        result.setHeight(self.height)
+        result.setRedshift(self.redshift, self.z_units)
 
-        # convert wavelenghts in line list to whatever
-        # units the wavelength range is expressed in.
-        new_wavelengths = wavelengths.to(wmin.unit, equivalencies=u.spectral())
+        return result
 
-        # add some leeway at the short and long end points.
-        # For now, we extend both ends by 10%. This might
-        # be enough at the short end, but it remains to be
-        # seen how this plays out when we add redshift
-        # functionality to the app.
-        #
-        # REMOVING THIS FOR NOW.
-        # wmin = wmin.value - wmin.value * 0.1
-        # wmax = wmax.value + wmax.value * 0.1
-        wmin = wmin.value
-        wmax = wmax.value
+    def setRedshift(self, redshift, z_units):
+        self.redshift = redshift
+        self.z_units = z_units
 
-        # 'indices' points to rows with wavelength values
-        # that lie outside the wavelength range.
-        indices_to_remove = np.where((new_wavelengths.value < wmin) |
-                                     (new_wavelengths.value > wmax))
+    def setColor(self, color):
+        self.color = color
 
-        # if using frequency units, the test above fails. We have to
-        # test for the opposite condition then.
-        if len(indices_to_remove[0]) == len(new_wavelengths):
-            indices_to_remove = np.where((new_wavelengths.value > wmin) |
-                                         (new_wavelengths.value < wmax))
+    def setHeight(self, height):
+        self.height = height
 
-        result = self._remove_lines(indices_to_remove)
 
-        # new instance inherits the name from parent.
-        result.name = self.name
+def _decode_strings(array):
+    """
+    Turns an array of fixed width strings into an object array
+    of python strings. Repeated values (such as the species in a
+    large catalog) share one single string object.
+    """
+    uniques, inverse = np.unique(array, return_inverse=True)
 
-        return result
+    if array.dtype.kind == 'S':
+        decoded = [value.decode('utf-8') for value in uniques]
+    else:
+        decoded = [str(value) for value in uniques]
 
-    def extract_rows(self, indices):
-        """
-        Builds a LineList instance out of self, with
-        the subset of lines pointed by 'indices'
+    strings = np.empty(len(decoded), dtype=object)
+    strings[:] = decoded
 
-        Parameters
-        ----------
-        indices: [QModelIndex, ...]
-            List of QModelIndex instances to extract from.
+    return strings[inverse.ravel()]
+
+
+class CompactLineList(_WavelengthIndex):
+    """
+    A compact, column-oriented representation of a line list.
+
+    Each column is one contiguous numpy array, plus an optional
+    mask array. String columns (species, transitions, references)
+    are pre-decoded into python strings, with one single string
+    object per distinct value. Reading one cell is just an array
+    access, instead of going through `~astropy.table.Row`.
+
+    Conversion to and from `LineList` is lossless, and the same
+    range queries, row extraction, and merging are supported.
+
+    Parameters
+    ----------
+    colnames: [str, ...]
+        Column names.
+    values: [ndarray, ...]
+        Column values. Strings must be already decoded.
+    masks: [ndarray or None, ...]
+        Column masks, None for unmasked columns.
+    units: [Unit or None, ...]
+        Column units.
+    dtypes: [dtype, ...]
+        Column data types in the table representation.
+    meta: dict
+        Table metadata, including the 'comments' list.
+    tooltips: [str, ...]
+        Column tooltips.
+    name: str
+        The name of the list.
+    """
+    __slots__ = ('name', 'tooltips', 'meta', 'color', 'height', 'redshift', 'z_units',
+                 '_colnames', '_values', '_masks', '_units', '_dtypes',
+                 '_sort_index', '_sorted_wavelengths', '_string_codes')
+
+    def __init__(self, colnames, values, masks, units, dtypes,
+                 meta=None, tooltips=None, name=None):
+        self._colnames = list(colnames)
+        self._values = list(values)
+        self._masks = list(masks)
+        self._units = list(units)
+        self._dtypes = list(dtypes)
+
+        self.meta = meta if meta is not None else {}
+        self.tooltips = tooltips
+        self.name = name
+
+        self.color = None
+        self.height = DEFAULT_HEIGHT
+        self.redshift = 0.
+        self.z_units = 'z'
+
+        self._sort_index = None
+        self._sorted_wavelengths = None
+
+        # distinct values and codes of string columns, by name.
+        self._string_codes = {}
+
+    @classmethod
+    def from_table(cls, table, name=None, tooltips=None):
+        """
+        Builds a compact list from a `~astropy.table.Table` or
+        `LineList`. Numeric columns are not copied.
+        """
+        values = []
+        masks = []
+        units = []
+        dtypes = []
+        for colname in table.colnames:
+            column = table[colname]
+            data = column.data
+
+            if isinstance(column, MaskedColumn):
+                masks.append(np.ma.getmaskarray(data))
+                data = data.data
+            else:
+                masks.append(None)
+
+            dtypes.append(data.dtype)
+            if data.dtype.kind in 'US':
+                data = _decode_strings(data)
+
+            values.append(data)
+            units.append(column.unit)
+
+        return cls(table.colnames, values, masks, units, dtypes,
+                   meta=deepcopy(table.meta), tooltips=tooltips,
+                   name=getattr(table, 'name', None) if name is None else name)
+
+    def to_table(self):
+        """
+        Builds a `LineList` with the contents of this list.
 
         Returns
         -------
         LineList
-            line list with subset of lines
+            a new list, with the same name and plotting attributes.
+        """
+        columns = [self[colname] for colname in self._colnames]
+        table = Table(columns, copy=False, meta=deepcopy(self.meta))
+
+        result = LineList(table, tooltips=self.tooltips, name=self.name)
+        result.setColor(self.color)
+        result.setHeight(self.height)
+        result.setRedshift(self.redshift, self.z_units)
+
+        return result
+
+    @property
+    def colnames(self):
+        return self._colnames
+
+    @property
+    def compact(self):
+        return self
+
+    @property
+    def wmin(self):
+        if len(self):
+            return self.sorted_wavelengths[0]
+
+    @property
+    def wmax(self):
+        if len(self):
+            return self.sorted_wavelengths[-1]
+
+    def __len__(self):
+        if len(self._values) == 0:
+            return 0
+        return len(self._values[0])
+
+    def __getitem__(self, colname):
+        # Columns are rebuilt in their table representation; string
+        # columns are re-encoded, thus this is not meant for cell by
+        # cell access. Use 'cell' or 'values' for that.
+        index = self._colnames.index(colname)
+
+        data = self._values[index]
+        if data.dtype != self._dtypes[index]:
+            data = data.astype(self._dtypes[index])
+
+        if self._masks[index] is None:
+            return Column(data, name=colname, unit=self._units[index], copy=False)
+
+        return MaskedColumn(data, name=colname, mask=self._masks[index],
+                            unit=self._units[index], copy=False)
+
+    def values(self, colname):
         """
-        row_indices = []
-        for index in indices:
-            row_indices.append(index.row())
+        Returns the array with the values in a column. Strings
+        come as python strings, and masked cells are not flagged.
+        """
+        return self._values[self._colnames.index(colname)]
 
-        line_indices = []
-        for index in range(len(self.columns[0])):
-            line_indices.append(index)
+    def mask(self, colname):
+        """
+        Returns the mask array of a column, or None.
+        """
+        return self._masks[self._colnames.index(colname)]
 
-        indices_to_remove = list(
-            filter(lambda x: x not in row_indices, line_indices)
-        )
+    def unit(self, colname):
+        return self._units[self._colnames.index(colname)]
 
-        return self._remove_lines(indices_to_remove)
+    def cell(self, row, column):
+        """
+        Returns the value in a cell, addressed by row and column
+        numbers. Masked cells are returned as '--', the same way
+        astropy renders them.
+        """
+        mask = self._masks[column]
+        if mask is not None and mask[row]:
+            return '--'
+        return self._values[column][row]
 
-    def _remove_lines(self, indices_to_remove):
+    def filter_mask(self, species=None, regex=False, wrange=None, thresholds=None):
         """
-        Makes a copy of self and removes
-        unwanted lines from the copy.
+        Flags the lines that pass all the given criteria. Criteria
+        are evaluated over entire columns at once; text criteria
+        are evaluated once per distinct value only.
 
         Parameters
         ----------
-        indices_to_remove: [int, ...]
-            List of row numbers to remove
+        species: str
+            text to look for in the species column, regardless of
+            case. Or, a regular expression if 'regex' is set. No
+            line passes when the list has no species column.
+        regex: bool
+            if true, 'species' is a regular expression.
+        wrange: (Quantity, Quantity)
+            minimum and maximum wavelength
+        thresholds: dict
+            minimum and maximum values, by column name. Either one
+            can be None. Masked cells never pass a threshold.
 
         Returns
         -------
-        LineList:
-            A new copy of the `LineList` with the rows removed.
-        """
-        table = Table(self)
-
-        table.remove_rows(indices_to_remove)
+        ndarray
+            boolean array, true for the lines that pass.
 
-        result = LineList(table, tooltips=self.tooltips, name=self.name)
+        Raises
+        ------
+        re.error
+            if 'species' is not a valid regular expression.
+        """
+        mask = np.ones(len(self), dtype=bool)
+
+        if species and ID_COLUMN not in self._colnames:
+            mask[:] = False
+        elif species:
+            uniques, codes = self._codes(ID_COLUMN)
+            if regex:
+                pattern = re.compile(species)
+                matches = [pattern.search(value) is not None for value in uniques]
+            else:
+                species = species.lower()
+                matches = [species in value.lower() for value in uniques]
+            mask &= np.array(matches, dtype=bool)[codes]
+
+            if self.mask(ID_COLUMN) is not None:
+                mask &= ~self.mask(ID_COLUMN)
+
+        if wrange is not None:
+            unit = self.unit(WAVELENGTH_COLUMN)
+            bounds = sorted([wrange[0].to(unit, equivalencies=u.spectral()).value,
+                             wrange[1].to(unit, equivalencies=u.spectral()).value])
+            thresholds = dict(thresholds or {})
+            thresholds[WAVELENGTH_COLUMN] = bounds
+
+        for colname, (vmin, vmax) in (thresholds or {}).items():
+            if vmin is None and vmax is None:
+                continue
+
+            values = np.asarray(self.values(colname), dtype=float)
+            if vmin is not None:
+                mask &= values >= vmin
+            if vmax is not None:
+                mask &= values <= vmax
+
+            if self.mask(colname) is not None:
+                mask &= ~self.mask(colname)
+
+        return mask
+
+    def _codes(self, colname):
+        # distinct values in a string column, and the index of
+        # each cell's value among them.
+        if colname not in self._string_codes:
+            uniques, codes = np.unique(self.values(colname), return_inverse=True)
+            self._string_codes[colname] = (uniques, codes.ravel())
+        return self._string_codes[colname]
+
+    def take(self, rows):
+        """
+        Builds a new compact list with copies of the given rows.
+        """
+        values = [data[rows] for data in self._values]
+        masks = [None if mask is None else mask[rows] for mask in self._masks]
 
+        result = CompactLineList(self._colnames, values, masks, self._units, self._dtypes,
+                                 meta=self.meta, tooltips=self.tooltips, name=self.name)
         return result
 
     def setRedshift(self, redshift, z_units):
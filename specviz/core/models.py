@@ -124,6 +124,11 @@ class PlotProxyModel(QSortFilterProxyModel):
         return item
 
     def item_from_id(self, identifier):
+        # plot data items already created don't need a search
+        # through the source model.
+        if identifier in self._items:
+            return self._items[identifier]
+
         data_item = self.sourceModel().item_from_id(identifier)
 
         if data_item.identifier not in self._items:
@@ -0,0 +1,40 @@
+import numpy as np
+import pyqtgraph as pg
+from qtpy.QtCore import QPointF
+
+from specviz.core.annotation import LineIDLabels
+
+
+def test_line_id_labels(qtbot):
+    plot_widget = pg.PlotWidget()
+    qtbot.addWidget(plot_widget)
+    plot_widget.resize(600, 400)
+    plot_widget.plot(np.linspace(0., 10., 100), np.sin(np.linspace(0., 10., 100)))
+
+    labels = LineIDLabels()
+    plot_widget.getPlotItem().addItem(labels, ignoreBounds=True)
+
+    labels.setData([2., 5., 8.], [0., 0.5, -0.5], ['Fe I', 'H alpha', 'Ca II'],
+                   color_index=[0, 1, 0], palette=['red', 'blue'],
+                   tooltips=['Fe I tip', 'H alpha tip', 'Ca II tip'])
+    assert len(labels) == 3
+
+    plot_widget.show()
+    qtbot.waitExposed(plot_widget)
+    plot_widget.getPlotItem().vb.autoRange()
+
+    # labels do not affect the plot range.
+    xrange = plot_widget.getPlotItem().viewRange()[0]
+    assert xrange[0] < 0.5 and xrange[1] > 9.5
+
+    # the text reads upwards from the label position,
+    # and the tick hangs below it.
+    view_box = plot_widget.getPlotItem().vb
+    position = view_box.mapViewToScene(QPointF(5., 0.5))
+    assert labels.label_at(position - QPointF(0., 15.)) == 1
+    assert labels.label_at(position + QPointF(0., 10.)) == 1
+    assert labels.label_at(position + QPointF(30., 0.)) is None
+
+    labels.clear()
+    assert len(labels) == 0
+    assert labels.label_at(position) is None
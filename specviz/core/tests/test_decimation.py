@@ -0,0 +1,92 @@
+import uuid
+
+import astropy.units as u
+import numpy as np
+import pyqtgraph as pg
+from specutils import Spectrum1D
+
+from specviz.core import items
+from specviz.core.decimation import DecimationPyramid, pyramid_cache
+from specviz.core.items import DataItem, PlotDataItem
+
+
+def test_decimation_pyramid():
+    y = np.random.RandomState(0).normal(size=1001)
+    y[8:19] = np.nan
+    x = np.append(np.arange(1001.), 1000.)
+
+    pyramid = DecimationPyramid(x, y, memmap_threshold=0)
+    assert pyramid.step
+    assert pyramid.nlevels == 11
+
+    # level 0 is the data itself.
+    display_x, display_y = pyramid.display(0, 100, 200)
+    assert np.all(display_x == x[100:201])
+    assert np.all(display_y == y[100:200])
+
+    # each bin in level 3 holds the extremes of 8 samples.
+    display_x, display_y = pyramid.display(3, 0, 1001)
+    assert len(display_y) == 2 * 126
+    assert np.all(display_x[::2] == x[:1001:8])
+    assert np.allclose(display_y[0::2][2:], [np.nanmin(y[i:i + 8]) for i in range(16, 1001, 8)])
+    assert np.allclose(display_y[1::2][2:], [np.nanmax(y[i:i + 8]) for i in range(16, 1001, 8)])
+    assert np.all(np.isnan(display_y[2:4]))
+
+    assert pyramid.samples(99.5, 200.5) == (99, 201)
+    assert pyramid.level(100, 100) == 0
+    assert pyramid.level(1001, 100) == 3
+    assert pyramid.bounds(0) == (0., 1000.)
+    assert pyramid.bounds(1, (100, 200)) == (np.min(y[99:201]), np.max(y[99:201]))
+
+    # descending axes give the same bins, in reverse.
+    reversed_pyramid = DecimationPyramid(x[::-1], y[::-1])
+    assert np.all(reversed_pyramid.display(0, 0, 1001)[0] == x)
+    assert np.array_equal(reversed_pyramid.display(0, 0, 1001)[1], y, equal_nan=True)
+
+    # lower and upper values, for bands.
+    band_pyramid = DecimationPyramid(x, y - 1., y + 1.)
+    band_x, low, high = band_pyramid.envelope(3, 0, 1001)
+    assert np.all(band_x == display_x[::2])
+    assert np.allclose(low, display_y[0::2] - 1., equal_nan=True)
+    assert np.allclose(high, display_y[1::2] + 1., equal_nan=True)
+
+
+def test_decimated_plot(qtbot, monkeypatch):
+    monkeypatch.setattr(items, 'DECIMATION_THRESHOLD', 1000)
+
+    size = 100000
+    flux = np.sin(np.linspace(0., 100., size))
+    spectrum = Spectrum1D(flux=flux * u.Jy,
+                          spectral_axis=np.linspace(4000., 5000., size) * u.AA)
+    data_item = DataItem("Test", identifier=uuid.uuid4(), data=spectrum)
+
+    plot_widget = pg.PlotWidget()
+    qtbot.addWidget(plot_widget)
+    plot_widget.resize(500, 300)
+
+    plot_data_item = PlotDataItem(data_item)
+    plot_widget.addItem(plot_data_item)
+
+    # drawn at full resolution while the pyramid is built.
+    assert len(plot_data_item.getData()[1]) == size
+
+    qtbot.waitUntil(lambda: plot_data_item._pyramid is not None)
+
+    # zoomed out, about one bin per pixel, over the whole data.
+    plot_widget.autoRange()
+    x, y = plot_data_item.getData()
+    assert len(y) < 4 * plot_widget.getViewBox().width()
+    assert np.isclose(y.max(), 1., atol=1e-3) and np.isclose(y.min(), -1., atol=1e-3)
+    assert plot_data_item.dataBounds(0) == (4000., 5000.)
+
+    # zoomed in, the same as full resolution around the view.
+    plot_widget.setXRange(4500., 4501., padding=0)
+    x, y = plot_data_item.getData()
+    start = np.flatnonzero(y[0] == flux)[0]
+    assert plot_data_item.opts['stepMode']
+    assert len(y) < size / 100
+    assert np.all(y == flux[start:start + len(y)])
+
+    data_item.set_data(spectrum)
+    assert pyramid_cache.get(data_item, 'flux', plot_data_item._units()) is None
+    pyramid_cache.wait()
@@ -0,0 +1,196 @@
+import uuid
+
+import astropy.units as u
+import numpy as np
+import pyqtgraph as pg
+import pytest
+from astropy.nddata import StdDevUncertainty
+from specutils import Spectrum1D
+
+from specviz.core import items
+from specviz.core.decimation import pyramid_cache
+from specviz.core.items import (ConversionCache, DataItem, PlotDataItem,
+                                UNCERTAINTY_BAND, UNCERTAINTY_ERROR_BARS,
+                                compatibility_cache, conversion_cache)
+
+
+def _data_item(size=100):
+    spectrum = Spectrum1D(flux=np.linspace(1., 2., size) * u.Jy,
+                          spectral_axis=np.linspace(4000., 5000., size) * u.AA,
+                          uncertainty=StdDevUncertainty(np.full(size, 0.1)))
+    return DataItem("Test", identifier=uuid.uuid4(), data=spectrum)
+
+
+def test_conversion_cache(qtbot):
+    data_item = _data_item()
+
+    # plot data items for the same data share converted arrays.
+    first = PlotDataItem(data_item)
+    second = PlotDataItem(data_item)
+    assert first.flux is second.flux
+    assert first.spectral_axis is second.spectral_axis
+    assert first.uncertainty is second.uncertainty
+
+    first.spectral_axis_unit = 'um'
+    first.data_unit = 'mJy'
+    assert np.allclose(first.spectral_axis, np.linspace(0.4, 0.5, 100))
+    assert np.allclose(first.flux, np.linspace(1000., 2000., 100))
+    assert np.allclose(first.uncertainty, 100.)
+    assert second.flux is not first.flux
+
+    # cached arrays can't be modified.
+    with pytest.raises(ValueError):
+        first.flux[0] = 0.
+
+    # the error bars do not modify the spectral axis.
+    spectral_axis = first.spectral_axis.copy()
+    first.error_bar_item
+    assert np.all(first.spectral_axis == spectral_axis)
+
+    # replacing the data invalidates the cached arrays.
+    version = data_item.version
+    data_item.set_data(Spectrum1D(flux=np.full(100, 3.) * u.Jy,
+                                  spectral_axis=np.linspace(4000., 5000., 100) * u.AA))
+    assert data_item.version == version + 1
+    assert np.allclose(first.flux, 3000.)
+    assert first.uncertainty is None
+
+    conversion_cache.invalidate(data_item.identifier)
+
+
+def test_conversion_cache_size(qtbot):
+    data_item = _data_item()
+    cache = ConversionCache(max_bytes=3 * 800)
+
+    # arrays of 100 doubles each.
+    for unit in ['Jy', 'mJy', 'uJy']:
+        cache.put(data_item, 'flux', unit, np.zeros(100))
+    assert cache.nbytes == 3 * 800
+    assert cache.contains(data_item, 'flux', 'Jy')
+
+    # the least recently used array goes first.
+    cache.get(data_item, 'flux', 'Jy', lambda: None)
+    cache.put(data_item, 'flux', 'nJy', np.zeros(100))
+    assert cache.nbytes == 3 * 800
+    assert cache.contains(data_item, 'flux', 'Jy')
+    assert not cache.contains(data_item, 'flux', 'mJy')
+
+    # arrays larger than the limit are kept on their own.
+    cache.put(data_item, 'flux', 'W / (m2 Hz)', np.zeros(1000))
+    assert cache.nbytes == 8000
+    assert cache.contains(data_item, 'flux', 'W / (m2 Hz)')
+
+    cache.max_bytes = 0
+    assert cache.nbytes == 8000
+
+    cache.invalidate(data_item.identifier)
+    assert cache.nbytes == 0
+
+
+def test_uncertainty_band(qtbot):
+    data_item = _data_item()
+
+    plot_widget = pg.PlotWidget()
+    qtbot.addWidget(plot_widget)
+
+    plot_data_item = PlotDataItem(data_item)
+    for item in (plot_data_item.band_item, plot_data_item.error_bar_item, plot_data_item):
+        plot_widget.addItem(item)
+    plot_widget.autoRange()
+
+    # error bars on every bin, by default.
+    assert plot_data_item.uncertainty_mode == UNCERTAINTY_ERROR_BARS
+    assert not plot_data_item.band_item.isVisible()
+    assert plot_data_item.error_bar_item.isVisible()
+    assert len(plot_data_item.error_bar_item.opts['x']) == 100
+    assert np.all(plot_data_item.error_bar_item.opts['top'] == 0.1)
+
+    # the band spans the uncertainties, with error bars on top.
+    plot_data_item.uncertainty_mode = UNCERTAINTY_BAND
+    assert plot_data_item.band_item.isVisible()
+    rect = plot_data_item.band_item.boundingRect()
+    assert np.isclose(rect.top(), 0.9) and np.isclose(rect.bottom(), 2.1)
+    assert np.isclose(rect.left(), 4000.) and np.isclose(rect.right(), 5000.)
+    assert plot_data_item.error_bar_item.isVisible()
+
+    # error bars show up only on a few bins.
+    plot_data_item.error_bar_points = 10
+    plot_widget.setXRange(4000., 4500., padding=0)
+    assert not plot_data_item.error_bar_item.isVisible()
+
+    plot_widget.setXRange(4100., 4150., padding=0)
+    assert plot_data_item.error_bar_item.isVisible()
+    assert 0 < len(plot_data_item.error_bar_item.opts['x']) <= 10
+
+    plot_data_item.uncertainty_mode = UNCERTAINTY_ERROR_BARS
+    assert not plot_data_item.band_item.isVisible()
+    assert len(plot_data_item.error_bar_item.opts['x']) == 100
+
+
+def test_decimated_uncertainty_band(qtbot, monkeypatch):
+    monkeypatch.setattr(items, 'DECIMATION_THRESHOLD', 1000)
+
+    data_item = _data_item(100000)
+
+    plot_widget = pg.PlotWidget()
+    qtbot.addWidget(plot_widget)
+    plot_widget.resize(500, 300)
+
+    plot_data_item = PlotDataItem(data_item)
+    plot_data_item.uncertainty_mode = UNCERTAINTY_BAND
+    for item in (plot_data_item.band_item, plot_data_item.error_bar_item, plot_data_item):
+        plot_widget.addItem(item)
+
+    qtbot.waitUntil(lambda: plot_data_item._band_pyramid is not None)
+    plot_widget.autoRange()
+
+    # the band is decimated over the same bins as the curve.
+    assert plot_data_item._band_window == plot_data_item._window
+    assert plot_data_item._window[0] > 0
+    assert not plot_data_item.error_bar_item.isVisible()
+
+    pyramid_cache.wait()
+
+
+def test_compatibility_cache(qtbot):
+    compatibility_cache.clear()
+
+    first = PlotDataItem(_data_item())
+    second = PlotDataItem(DataItem("Test", identifier=uuid.uuid4(), data=Spectrum1D(
+        flux=np.ones(10) * u.erg / u.s / u.cm ** 2 / u.AA,
+        spectral_axis=np.linspace(1., 2., 10) * u.GHz)))
+
+    # flux densities per unit wavelength and frequency, on wavelength
+    # and frequency axes, are all compatible.
+    assert first.are_units_compatible('um', 'erg / (s cm2 Hz)')
+    assert second.are_units_compatible('um', 'erg / (s cm2 Hz)')
+    assert first.are_units_compatible('Hz', 'mJy')
+    assert not first.are_units_compatible('s', 'mJy')
+    assert not first.is_data_unit_compatible('kg')
+    assert not first.is_data_unit_compatible(None)
+
+    # compatibility is evaluated once per class of data item and unit.
+    assert first.data_item.compatibility_class != second.data_item.compatibility_class
+    third = PlotDataItem(_data_item())
+    assert third.data_item.compatibility_class == first.data_item.compatibility_class
+
+    size = len(compatibility_cache._compatible)
+    assert third.are_units_compatible('Hz', 'mJy')
+    assert len(compatibility_cache._compatible) == size
+
+    # replacing the data may change the class.
+    third.data_item.set_data(Spectrum1D(flux=np.ones(10) * u.kg,
+                                        spectral_axis=np.linspace(1., 2., 10) * u.AA))
+    assert not third.is_data_unit_compatible('mJy')
+    assert third.is_data_unit_compatible('g')
+
+    # counts and ADU share a physical type, but are not compatible.
+    counts = PlotDataItem(DataItem("Test", identifier=uuid.uuid4(), data=Spectrum1D(
+        flux=np.ones(10) * u.ct, spectral_axis=np.linspace(1., 2., 10) * u.AA)))
+    adu = PlotDataItem(DataItem("Test", identifier=uuid.uuid4(), data=Spectrum1D(
+        flux=np.ones(10) * u.adu, spectral_axis=np.linspace(1., 2., 10) * u.AA)))
+    assert counts.data_item.compatibility_class != adu.data_item.compatibility_class
+    assert counts.is_data_unit_compatible('ct')
+    assert not adu.is_data_unit_compatible('ct')
+    assert adu.is_data_unit_compatible('adu')
+    assert not counts.is_data_unit_compatible('adu')
@@ -0,0 +1,447 @@
+import glob
+import re
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from astropy import units as u
+from astropy.io import ascii
+from astropy.units.core import UnitConversionError
+
+from specviz.core import linelist
+
+LINELIST_PATH = os.path.join(os.path.dirname(linelist.__file__),
+                             '..', 'data', 'linelists')
+
+
+def _read_yaml(name):
+    yaml_filename = os.path.join(LINELIST_PATH, name)
+    with open(yaml_filename, 'r') as yaml_file:
+        yaml_object = yaml.safe_load(yaml_file)
+    return yaml_filename, yaml_object
+
+
+def _assert_same_list(list1, list2):
+    assert list1.name == list2.name
+    assert list1.colnames == list2.colnames
+    assert list1.tooltips == list2.tooltips
+    assert list(list1.meta['comments']) == list(list2.meta['comments'])
+    for colname in list1.colnames:
+        assert list1[colname].unit == list2[colname].unit
+        assert list1[colname].dtype == list2[colname].dtype
+        assert np.all(list1[colname] == list2[colname])
+
+
+def test_disk_cache_round_trip(cache_path):
+    yaml_filename, yaml_object = _read_yaml('Reader-Corliss.yaml')
+    filename = os.path.join(LINELIST_PATH, yaml_object['filename'])
+
+    # cold start parses the file and creates the cache entry.
+    assert linelist._read_from_disk_cache(filename, yaml_object) is None
+    parsed = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+    assert len(os.listdir(cache_path)) == 1
+
+    # warm start is served from the cache.
+    cached = linelist._read_from_disk_cache(filename, yaml_object)
+    assert cached is not None
+    _assert_same_list(parsed, cached)
+
+
+def test_disk_cache_evicts_stale_entries(cache_path, tmpdir):
+    yaml_filename, yaml_object = _read_yaml('Common_stellar.yaml')
+    source = os.path.join(LINELIST_PATH, yaml_object['filename'])
+    local_source = str(tmpdir.join(yaml_object['filename']))
+    with open(source, 'r') as infile, open(local_source, 'w') as outfile:
+        outfile.write(infile.read())
+    local_yaml = str(tmpdir.join('Common_stellar.yaml'))
+    with open(local_yaml, 'w') as outfile:
+        yaml.safe_dump(yaml_object, outfile)
+
+    linelist.get_from_file(str(tmpdir), local_yaml)
+    entries = os.listdir(cache_path)
+    assert len(entries) == 1
+
+    # touching the source file invalidates the entry.
+    stat = os.stat(local_source)
+    os.utime(local_source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    linelist.get_from_file(str(tmpdir), local_yaml)
+    new_entries = os.listdir(cache_path)
+    assert len(new_entries) == 1
+    assert new_entries != entries
+
+
+def test_registry_is_lazy(cache_path, monkeypatch):
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+
+    # cold start: nothing is read until the summary is needed.
+    linelist.populate_linelists_cache()
+    assert not any(entry.is_loaded for entry in linelist._linelists_cache)
+    cold_descriptions = linelist.descriptions()
+
+    # warm start: summaries come from the disk cache.
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+    linelist.populate_linelists_cache()
+    warm_descriptions = linelist.descriptions()
+    assert warm_descriptions == cold_descriptions
+    assert not any(entry.is_loaded for entry in linelist._linelists_cache)
+
+    # the full list is read on first access.
+    line_list = linelist.get_from_cache(0)
+    assert linelist._linelists_cache[0].is_loaded
+    assert line_list.name == linelist._linelists_cache[0].summary['name']
+
+
+def test_parallel_ingestion(cache_path, monkeypatch):
+    filenames = [os.path.join(LINELIST_PATH, name)
+                 for name in ['SDSS.yaml', 'CO.yaml', 'H2.yaml']]
+
+    serial = linelist.get_from_files(filenames, parallel=False)
+    # the disk cache would bypass the worker pool.
+    monkeypatch.setattr(linelist, 'CACHE_PATH', cache_path + '_parallel')
+    parallel = linelist.get_from_files(filenames, parallel=True, max_workers=2)
+
+    assert [ll.name for ll in parallel] == ['SDSS', 'CO', 'H2']
+    for list1, list2 in zip(serial, parallel):
+        _assert_same_list(list1, list2)
+
+
+def test_parallel_registry_order(cache_path, monkeypatch):
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+    linelist.populate_linelists_cache(parallel=True, max_workers=2)
+    parallel_descriptions = linelist.descriptions()
+    monkeypatch.setattr(linelist, '_ingestion_options',
+                        {'parallel': False, 'max_workers': None})
+
+    names = [entry.summary['name'] for entry in linelist._linelists_cache]
+    assert all(entry.is_loaded for entry in linelist._linelists_cache)
+
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+    linelist.populate_linelists_cache()
+    assert [entry.summary['name'] for entry in linelist._linelists_cache] == names
+    assert linelist.descriptions() == parallel_descriptions
+
+
+@pytest.mark.parametrize('wrange', [(3000 * u.AA, 5000 * u.AA),
+                                    (0.3 * u.micron, 0.5 * u.micron),
+                                    (1e15 * u.Hz, 6e14 * u.Hz),
+                                    (6e14 * u.Hz, 1e15 * u.Hz),
+                                    (2.5 * u.eV, 4. * u.eV)])
+def test_extract_range(cache_path, wrange):
+    yaml_filename, _ = _read_yaml('Reader-Corliss.yaml')
+    line_list = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+
+    # brute force reference: convert every line to the range units.
+    wavelengths = line_list[linelist.WAVELENGTH_COLUMN].quantity.to(
+        wrange[0].unit, equivalencies=u.spectral()).value
+    wmin, wmax = sorted([wrange[0].value, wrange[1].to(
+        wrange[0].unit, equivalencies=u.spectral()).value])
+    expected = np.where((wavelengths >= wmin) & (wavelengths <= wmax))[0]
+
+    extracted = line_list.extract_range(wrange)
+
+    assert len(extracted) == len(expected) > 0
+    assert line_list.count_in_range(wrange) == len(expected)
+    assert extracted.name == line_list.name
+    assert list(extracted.meta['comments']) == list(line_list.meta['comments'])
+    assert np.all(extracted[linelist.WAVELENGTH_COLUMN] ==
+                  line_list[linelist.WAVELENGTH_COLUMN][expected])
+
+
+def test_extract_range_incompatible_units(cache_path):
+    yaml_filename, _ = _read_yaml('SDSS.yaml')
+    line_list = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+
+    with pytest.raises(UnitConversionError):
+        line_list.extract_range((1 * u.s, 2 * u.s))
+
+
+class _Index(object):
+    # stands in for a QModelIndex
+    def __init__(self, row):
+        self._row = row
+
+    def row(self):
+        return self._row
+
+
+def test_views_share_parent_buffers(cache_path):
+    yaml_filename, _ = _read_yaml('Reader-Corliss.yaml')
+    line_list = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+
+    view = line_list.extract_range((3000 * u.AA, 5000 * u.AA))
+    assert isinstance(view, linelist.LineListView)
+    assert view.parent is line_list
+    assert view.colnames == line_list.colnames
+
+    # sets of sets point straight to the original list.
+    subset = view.extract_rows([_Index(row) for row in [5, 2, 2, 9]])
+    assert subset.parent is line_list
+    assert list(subset.rows) == list(view.rows[[2, 5, 9]])
+
+    wavelengths = line_list[linelist.WAVELENGTH_COLUMN]
+    assert np.all(subset[linelist.WAVELENGTH_COLUMN] == wavelengths[subset.rows])
+    assert subset.extract_range((3000 * u.AA, 5000 * u.AA)).count_in_range(
+        (3000 * u.AA, 5000 * u.AA)) == 3
+
+    # materializing builds a real, independent list.
+    subset.setColor('red')
+    materialized = subset.materialize()
+    assert isinstance(materialized, linelist.LineList)
+    assert len(materialized) == 3
+    assert materialized.color == 'red'
+    _assert_same_list(materialized, linelist.LineListView(materialized, [0, 1, 2]).materialize())
+
+
+def test_compact_round_trip(cache_path):
+    yaml_filename, _ = _read_yaml('illss.yaml')
+    line_list = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+
+    compact = line_list.compact
+    assert isinstance(compact, linelist.CompactLineList)
+    assert len(compact) == len(line_list)
+    _assert_same_list(line_list, compact.to_table())
+
+    # masked cells render the same way astropy does.
+    for column, colname in enumerate(line_list.colnames):
+        for row in [0, 1, len(line_list) - 1]:
+            assert str(compact.cell(row, column)) == str(line_list[colname][row])
+
+    # strings are decoded once per distinct value.
+    species = compact.values('Element')
+    assert species.dtype == object
+    assert len(set(map(id, species))) == len(set(species))
+
+
+def test_compact_range_and_merge(cache_path):
+    yaml_filename, _ = _read_yaml('Reader-Corliss.yaml')
+    line_list = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+    compact = line_list.compact
+
+    wrange = (3000 * u.AA, 5000 * u.AA)
+    assert compact.count_in_range(wrange) == line_list.count_in_range(wrange)
+    assert list(compact.extract_range(wrange).rows) == list(line_list.extract_range(wrange).rows)
+
+    view = compact.extract_range(wrange)
+    assert view.compact.cell(0, 1) == view[linelist.ID_COLUMN][0]
+
+    merged = linelist.LineList.merge([compact.take(np.arange(10)), view], u.nm)
+    assert len(merged) == 10 + len(view)
+
+
+def test_merge(cache_path):
+    lists = []
+    for name, color, height in [('Reader-Corliss.yaml', 'red', 0.5),
+                                ('Common_stellar.yaml', 'blue', 0.75),
+                                ('SDSS.yaml', 'green', 0.9)]:
+        yaml_filename, _ = _read_yaml(name)
+        view = linelist.get_from_file(LINELIST_PATH, yaml_filename).extract_range(
+            (3000 * u.AA, 6000 * u.AA))
+        view.setColor(color)
+        view.setHeight(height)
+        lists.append(view)
+    lists[1].setRedshift(0.1, 'z')
+
+    sources = [lists[0].parent[linelist.WAVELENGTH_COLUMN].copy(), lists[0].parent.colnames[:]]
+
+    merged = linelist.LineList.merge(lists, u.micron)
+
+    # the inputs are left untouched.
+    assert lists[0].parent[linelist.WAVELENGTH_COLUMN].unit == sources[0].unit
+    assert np.all(lists[0].parent[linelist.WAVELENGTH_COLUMN] == sources[0])
+    assert lists[0].parent.colnames == sources[1]
+
+    # same lines as a stack-and-sort merge.
+    assert len(merged) == sum(len(view) for view in lists)
+    wavelengths = np.concatenate([
+        view[linelist.WAVELENGTH_COLUMN].quantity.to(u.micron).value for view in lists])
+    assert np.all(np.diff(merged[linelist.WAVELENGTH_COLUMN]) >= 0)
+    assert np.allclose(merged[linelist.WAVELENGTH_COLUMN], np.sort(wavelengths))
+
+    # per-list attributes, by group.
+    groups = merged.groups
+    assert len(groups) == len(merged)
+    assert merged.groups is groups
+    assert [np.count_nonzero(groups == k) for k in range(3)] == [len(view) for view in lists]
+    assert merged.group_colors == ['red', 'blue', 'green']
+    assert np.all(merged.group_heights[groups][groups == 0] == 0.5)
+    z = merged[linelist.REDSHIFTED_WAVELENGTH_COLUMN] / merged[linelist.WAVELENGTH_COLUMN]
+    assert np.allclose(z[groups == 1], 1.1)
+    assert np.allclose(z[groups != 1], 1.)
+
+    # species still belong to their lines.
+    species = merged[linelist.ID_COLUMN][groups == 2]
+    order = np.argsort(lists[2][linelist.WAVELENGTH_COLUMN], kind='mergesort')
+    assert list(species) == list(lists[2][linelist.ID_COLUMN][order])
+
+
+@pytest.mark.parametrize('name', sorted(os.path.basename(path) for path in
+                                        glob.glob(os.path.join(LINELIST_PATH, '*.yaml'))))
+def test_fast_reader(name):
+    _, yaml_object = _read_yaml(name)
+    filename = os.path.join(LINELIST_PATH, yaml_object['filename'])
+
+    columns = yaml_object['columns']
+    names = [column['name'] for column in columns]
+    starts = [column['start'] for column in columns]
+    ends = [column['end'] for column in columns]
+
+    fast = linelist._read_fixed_width_no_header(filename, names, starts, ends)
+    reference = ascii.read(filename, format=yaml_object['format'], names=names,
+                           col_starts=starts, col_ends=ends)
+
+    assert fast.colnames == reference.colnames
+    assert list(fast.meta['comments']) == list(reference.meta['comments'])
+    for colname in reference.colnames:
+        assert fast[colname].dtype == reference[colname].dtype
+        mask = np.ma.getmaskarray(reference[colname])
+        assert np.all(np.ma.getmaskarray(fast[colname]) == mask)
+        assert np.all(np.asarray(fast[colname])[~mask] == np.asarray(reference[colname])[~mask])
+
+
+def _assert_same_lines(list1, list2):
+    assert list1.colnames == list2.colnames
+    assert len(list1) == len(list2)
+    for colname in list1.colnames:
+        assert list1[colname].unit == list2[colname].unit
+        assert np.all(np.ma.getmaskarray(list1[colname]) == np.ma.getmaskarray(list2[colname]))
+        assert list(np.ma.filled(list1[colname].astype(str), '')) == \
+               list(np.ma.filled(list2[colname].astype(str), ''))
+
+
+def test_stream_from_file(cache_path):
+    yaml_filename, _ = _read_yaml('Reader-Corliss.yaml')
+    wrange = (0.3 * u.micron, 0.5 * u.micron)
+
+    fractions = []
+
+    def progress(fraction):
+        fractions.append(fraction)
+
+    streamed = linelist.stream_from_file(yaml_filename, wrange, chunk_size=64 * 1024,
+                                         progress=progress)
+    expected = linelist.get_from_file(LINELIST_PATH, yaml_filename).extract_range(wrange)
+
+    assert len(fractions) > 10
+    assert fractions == sorted(fractions) and fractions[-1] == 1.
+    assert streamed.name == expected.name
+    assert streamed.tooltips == expected.tooltips
+    assert list(streamed.meta['comments']) == list(expected.meta['comments'])
+    _assert_same_lines(streamed, expected.materialize())
+
+    # cancelling returns nothing.
+    assert linelist.stream_from_file(yaml_filename, wrange, chunk_size=64 * 1024,
+                                     progress=lambda fraction: False) is None
+
+
+def test_stream_from_ecsv_file(cache_path, tmpdir):
+    yaml_filename, _ = _read_yaml('illss.yaml')
+    source = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+    ecsv_filename = str(tmpdir.join('illss.ecsv'))
+    ascii.write(source.table, ecsv_filename, format='ecsv')
+
+    wrange = (5000 * u.AA, 6000 * u.AA)
+    streamed = linelist.stream_from_file(ecsv_filename, wrange, chunk_size=32 * 1024)
+
+    assert streamed.name == 'illss.ecsv'
+    _assert_same_lines(streamed, source.extract_range(wrange).materialize())
+
+
+def test_ingest_interval_index(cache_path, monkeypatch, tmpdir):
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+    monkeypatch.setattr(linelist, '_interval_index', None)
+    linelist.populate_linelists_cache()
+
+    for wrange in [(3000 * u.AA, 5000 * u.AA),
+                   (2 * u.micron, 0.9 * u.micron),
+                   (1e14 * u.Hz, 2e14 * u.Hz)]:
+        expected = []
+        for index in range(len(linelist._linelists_cache)):
+            view = linelist.get_from_cache(index).extract_range(wrange)
+            if len(view):
+                expected.append(view)
+
+        found = linelist.ingest(wrange)
+        assert [view.name for view in found] == [view.name for view in expected]
+        for view, expected_view in zip(found, expected):
+            assert view.parent is expected_view.parent
+            assert list(view.rows) == list(expected_view.rows)
+
+    # incompatible units are not an error, they just match nothing.
+    assert linelist.ingest((1 * u.s, 2 * u.s)) == []
+
+    # the index follows additions to the library.
+    index = linelist._interval_index
+    ecsv_filename = str(tmpdir.join('sdss.ecsv'))
+    ascii.write(linelist.get_from_cache(-2).table, ecsv_filename, format='ecsv')
+    linelist.get_from_file(str(tmpdir), ecsv_filename)
+    found = linelist.ingest((3000 * u.AA, 5000 * u.AA))
+    assert linelist._interval_index is not index
+    assert found[-1].name == 'sdss.ecsv' and found[-1].parent is linelist.get_from_cache(-1)
+
+
+def test_ingest_reads_overlapping_lists_only(cache_path, monkeypatch):
+    # summaries of all lists are in the disk cache.
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+    linelist.populate_linelists_cache()
+    linelist.descriptions()
+
+    monkeypatch.setattr(linelist, '_linelists_cache', [])
+    monkeypatch.setattr(linelist, '_interval_index', None)
+    linelist.populate_linelists_cache()
+
+    wrange = (6500 * u.AA, 6600 * u.AA)
+    found = linelist.ingest(wrange)
+    assert len(found) > 0
+
+    # lists that don't overlap the range are not read.
+    for entry in linelist._linelists_cache:
+        summary = entry.summary
+        overlaps = False
+        if summary['wmin'] is not None and summary['units'] is not None:
+            bounds = sorted(u.Quantity([summary['wmin'], summary['wmax']], summary['units'])
+                            .to(u.AA, equivalencies=u.spectral()).value)
+            overlaps = bounds[0] <= 6600 and bounds[1] >= 6500
+        assert entry.is_loaded == overlaps
+    assert not all(entry.is_loaded for entry in linelist._linelists_cache)
+
+
+def test_filter_mask(cache_path):
+    yaml_filename, _ = _read_yaml('Reader-Corliss.yaml')
+    line_list = linelist.get_from_file(LINELIST_PATH, yaml_filename)
+    compact = line_list.compact
+
+    species = np.array([str(value) for value in line_list[linelist.ID_COLUMN]])
+    wavelengths = np.asarray(line_list[linelist.WAVELENGTH_COLUMN])
+
+    mask = compact.filter_mask(species='fe')
+    assert np.all(mask == (np.char.find(np.char.lower(species), 'fe') >= 0))
+
+    mask = compact.filter_mask(species=r'^FE\s+I$', regex=True,
+                               wrange=(0.5 * u.micron, 0.4 * u.micron))
+    fe_i = np.array([value.split() == ['FE', 'I'] for value in species])
+    assert np.all(mask == (fe_i & (wavelengths >= 4000) & (wavelengths <= 5000)))
+    assert mask.any()
+
+    intensity = line_list['Intensity']
+    mask = compact.filter_mask(thresholds={'Intensity': (100, None)})
+    expected = np.ma.filled(intensity >= 100, False)
+    assert np.all(mask == expected)
+
+    with pytest.raises(re.error):
+        compact.filter_mask(species='Fe (', regex=True)
+
+
+def test_filter_mask_without_species_column(cache_path):
+    # the ILLSS list has no species column.
+    yaml_filename, _ = _read_yaml('illss.yaml')
+    compact = linelist.get_from_file(LINELIST_PATH, yaml_filename).compact
+    assert linelist.ID_COLUMN not in compact.colnames
+
+    mask = compact.filter_mask(species='fe')
+    assert len(mask) == len(compact)
+    assert not mask.any()
+
+    assert compact.filter_mask(species='').all()
@@ -4,6 +4,9 @@ from ...core.items import DataItem
 
 
 class ModelDataItem(DataItem):
+    # the flux is evaluated from the model every time it's read.
+    cacheable = False
+
     def __init__(self, model, *args, **kwargs):
         self._model_editor_model = model
 
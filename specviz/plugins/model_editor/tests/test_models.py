@@ -79,6 +79,37 @@ def test_model_fitting(specviz_gui):
     np.testing.assert_allclose(result.parameters, gg_fit.parameters)
 
 
+def test_model_redraw(specviz_gui):
+    hub = Hub(workspace=specviz_gui.current_workspace)
+
+    model_editor = specviz_gui.current_workspace._plugin_bars['Model Editor']
+
+    model_editor._on_create_new_model()
+    model_editor._add_fittable_model(models.Gaussian1D)
+    model_editor._add_fittable_model(models.Gaussian1D)
+
+    plot_data_item = hub.plot_item
+    model_editor_model = plot_data_item.data_item.model_editor_model
+    value_dict = {
+        'Gaussian1D': {'amplitude': '1', 'mean': '0', 'stddev': '0.1'},
+        'Gaussian1D1': {'amplitude': '2', 'mean': '0.5', 'stddev': '0.1'}
+    }
+    fill_in_models(model_editor_model, value_dict)
+    flux = np.array(plot_data_item.flux)
+
+    # editing a parameter changes the plotted flux.
+    value_dict['Gaussian1D1']['amplitude'] = '5'
+    fill_in_models(model_editor_model, value_dict)
+    assert not np.allclose(plot_data_item.flux, flux)
+    flux = np.array(plot_data_item.flux)
+
+    # and so does editing the equation.
+    model_editor_model.equation = "Gaussian1D"
+    plot_data_item.set_data()
+    assert not np.allclose(plot_data_item.flux, flux)
+    np.testing.assert_allclose(plot_data_item.getData()[1], plot_data_item.flux)
+
+
 def test_save_model(specviz_gui, tmpdir):
     hub = Hub(workspace=specviz_gui.current_workspace)
 
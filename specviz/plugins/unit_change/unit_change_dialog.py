@@ -254,9 +254,6 @@ class UnitChangeDialog(QDialog):
                     self.close()
                     return False
 
-            # Set new units
-            self.hub.plot_widget.data_unit = data_unit_formatted
-
         else:
             # Converts the data_unit to something that can be used by PlotWidget
             current_data_unit_in_u = \
@@ -271,9 +268,6 @@ class UnitChangeDialog(QDialog):
                     self.close()
                     return False
 
-            # Set new units
-            self.hub.plot_widget.data_unit = data_unit_formatted
-
         if self.ui.comboBox_spectral.currentText() == "Custom":
 
             # Try to enter the custom units
@@ -300,9 +294,6 @@ class UnitChangeDialog(QDialog):
                     self.close()
                     return False
 
-            # Set new units
-            self.hub.plot_widget.spectral_axis_unit = spectral_axis_unit_formatted
-
         else:
             # Converts the spectral_axis_unit to something that can be used by PlotWidget
             current_spectral_axis_unit_in_u = \
@@ -317,8 +308,10 @@ class UnitChangeDialog(QDialog):
                     self.close()
                     return False
 
-            # Set new units
-            self.hub.plot_widget.spectral_axis_unit = spectral_axis_unit_formatted
+        # Set new units, converting all plotted items at once
+        self.hub.plot_widget.set_units(data_unit=data_unit_formatted,
+                                       spectral_axis_unit=spectral_axis_unit_formatted,
+                                       parallel=True)
 
         self.close()
         return True
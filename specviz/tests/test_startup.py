@@ -7,3 +7,28 @@ def test_specviz_startup(qtbot):
     app = Application([], dev=True)
     qtbot.addWidget(app.current_workspace)
     qtbot.mouseClick(app.current_workspace, QtCore.Qt.LeftButton)
+
+
+def test_linelist_options(monkeypatch):
+    from click.testing import CliRunner
+    from specviz import app
+
+    # the options reach the application, which hands them to the
+    # line list library.
+    options = {}
+
+    class Application(object):
+        def __init__(self, *args, **kwargs):
+            options.update(kwargs)
+
+        def exec_(self):
+            return 0
+
+    monkeypatch.setattr(app, 'Application', Application)
+
+    result = CliRunner().invoke(app.start, ['--parallel_linelists', '--linelist_workers', '3'])
+    assert result.exit_code == 0
+    assert options['parallel_linelists'] and options['linelist_workers'] == 3
+
+    CliRunner().invoke(app.start, [])
+    assert not options['parallel_linelists'] and options['linelist_workers'] is None
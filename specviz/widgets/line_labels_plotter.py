@@ -1,10 +1,25 @@
 import numpy as np
 
-from qtpy.QtCore import QEvent, Qt, QThread, Signal, QMutex, QTime
+from qtpy.QtCore import Qt, QTimer
 
-from ..core.annotation import LineIDMarker, LineIDMarkerProxy
-from ..core.linelist import LineList, \
-    REDSHIFTED_WAVELENGTH_COLUMN, MARKER_COLUMN, ID_COLUMN, COLOR_COLUMN, HEIGHT_COLUMN
+from ..core.annotation import LineIDLabels, DATA_COORDINATES, VIEW_FRACTION, TICK_LENGTH
+from ..core.items import PlotDataItem
+from ..core.linelist import LineList, REDSHIFTED_WAVELENGTH_COLUMN, ID_COLUMN, INTENSITY_COLUMN
+
+# time, in milliseconds, over which zoom events are coalesced
+# into a single marker layout. About one frame.
+ZOOM_INTERVAL = 16
+
+# marker priorities for de-cluttering: the strongest lines first,
+# or the lines in the first line lists first. Lists with no
+# intensities rank last by intensity.
+PRIORITY_INTENSITY = 'intensity'
+PRIORITY_LIST = 'list'
+
+# marker heights: as set in each line list, in fractions of the
+# plot height, or following the flux of the plotted spectrum.
+HEIGHT_FIXED = 'fixed'
+HEIGHT_FLUX = 'flux'
 
 
 class LineLabelsPlotter(object):
@@ -23,20 +38,41 @@ class LineLabelsPlotter(object):
         self._linelists = caller.linelists
         self._plot_item = caller._plot_item
 
-        # create a new, empty list that will store and help track down
-        # which markers are actually being displayed at any time.
-        self._markers_on_screen = []
+        # the single graphics item that draws all markers.
+        self._labels_item = None
+
+        # markers that survive de-cluttering are picked in this order.
+        self.label_priority = PRIORITY_INTENSITY
+
+        # markers are drawn at fixed heights on screen, or on the
+        # spectrum.
+        self.label_height = HEIGHT_FIXED
+
+        self._zoom_timer = QTimer(self._caller)
+        self._zoom_timer.setSingleShot(True)
+        self._zoom_timer.setInterval(ZOOM_INTERVAL)
+        self._zoom_timer.timeout.connect(self._handle_zoom)
 
-        self._caller.mouse_enterexit.connect(self._handle_mouse_events)
         self._caller.dismiss_linelists_window.connect(self._dismiss_linelists_window)
         self._caller.erase_linelabels.connect(self._erase_linelabels)
 
-    # Buffering of zoom events.
-    def process_zoom_signal(self):
-        if hasattr(self, '_zoom_markers_thread') and self._zoom_markers_thread:
+    # Changes the way marker heights are computed, and re-draws the
+    # markers on display, if any.
+    def set_label_height(self, label_height):
+        self.label_height = label_height
+
+        if hasattr(self, '_merged_linelist') and self._labels_item is not None:
+            self._go_plot_markers(self._merged_linelist)
 
-            # for now, any object can be used as a zoom message.
-            self._zoom_event_buffer.put(1)
+    # Zoom events are coalesced: a burst of range changes (e.g. from
+    # dragging the mouse, or scrolling the wheel, or from code) starts a
+    # single-shot timer, unless it's already running. The markers are
+    # laid out once, for the range in effect when the timer fires, and
+    # the range changes in between are superseded by it. That makes for
+    # at most one layout per frame, and nothing runs while idle.
+    def process_zoom_signal(self, *args):
+        if hasattr(self, '_merged_linelist') and not self._zoom_timer.isActive():
+            self._zoom_timer.start()
 
 #--------  Slots.
 
@@ -58,7 +94,7 @@ class LineLabelsPlotter(object):
             self._remove_linelabels_from_plot()
             self._linelist_window.erasePlottedLines()
 
-            self._destroy_zoom_markers_thread()
+            self._zoom_timer.stop()
 
     # Main method for drawing line labels on the plot surface.
     def plot_linelists(self, table_views, panes, units, caller, **kwargs):
@@ -119,22 +155,8 @@ class LineLabelsPlotter(object):
         # Finally, plot labels.
         self._go_plot_markers(merged_linelist)
 
-        # Zooming the markers is a tricky business. On top of saving some plot
-        # time by having the plot being de-cluttered at every zoom step, we
-        # must control the rate at which the time-consuming zoom operation is
-        # run, to prevent the app to become unresponsive. We use a threaded
-        # mechanism to store zoom request events in a buffer, and then manage
-        # its size, and the speed at which its contents get consumed.
-        #
-        # Notice that we can't use the dispatch mechanism to manage the zoom
-        # thread and its signal-slot dependencies. Something in the dispatch
-        # code messes up with the timing relationships in the GUI and secondary
-        # threads, causing the “Timers cannot be started from another thread”
-        # warning, and eventual app crash. We have to manage signals with explicit
-        # code within the thread and in here.
-        self._zoom_event_buffer = ZoomEventBuffer()
-        self._zoom_markers_thread = ZoomMarkersThread(self, len(merged_linelist))
-        self._zoom_markers_thread.do_zoom.connect(self._handle_zoom)
+        # any zoom request still pending refers to the former markers.
+        self._zoom_timer.stop()
 
         # Populate the plotted lines pane in the line list window.
         if hasattr(self, '_linelist_window') and self._linelist_window:
@@ -144,345 +166,277 @@ class LineLabelsPlotter(object):
         # use in subsequent operations.
         self._merged_linelist = merged_linelist
 
-    # Turns time-consuming processing in the zoom thread on/off when
-    # mouse enter/leaves the plot. This enables other parts of the
-    # app to retain their full computational speed when the mouse
-    # pointer is outside the plot window.
-    def _handle_mouse_events(self, event_type):
-        if hasattr(self, '_zoom_markers_thread') and self._zoom_markers_thread:
-            is_processing = self._zoom_markers_thread.is_processing
-
-            # Detects when mouse entered the plot area but the thread is not processing yet.
-            if event_type == QEvent.Enter and not is_processing:
-                self._zoom_markers_thread.start_processing()
-                return
-
-            # Detects the complementary condition: mouse exited plot and thread still processing.
-            if event_type == QEvent.Leave and is_processing:
-                self._zoom_markers_thread.stop_processing()
-
 #--------  Private methods.
 
     def _go_plot_markers(self, merged_linelist):
-        # Code below is plotting all markers at a fixed height in
-        # the screen coordinate system. Still TBD how to do this in
-        # the generic case. Maybe derive heights from curve data
-        # instead? Make the markers follow the curve ups and downs?
-        #
-        # Ideally we would like to have the marker's X coordinate
-        # pinned down to the plot surface in data value, and the Y
-        # coordinate pinned down in screen value. This would make
-        # the markers to stay at the same height in the window even
-        # when the plot is zoomed. The elegant nice way to do this
-        # would be via the marker objects themselves to reposition
-        # themselves on screen. This did not work though. There seems
-        # to be a clash (maybe thread-related) in between the setPos
-        # method and the auto-range facility in pyqtgraph.
-        #
-        # We managed to get the pinning in Y by brute force: remove
-        # the markers and re-draw them in the new zoomed coordinates.
-        # Note that it's not enough to remove a marker, reset its position,
-        # and add it back to the plot. It's necessary to rebuild a new
-        # marker instance. This probably has to do with the affine
-        # transform objects that are stored inside each TextItem instance.
-        # These transforms do not behave as expected when we run everything
-        # with auto range turned on. Switching auto range on and off when
-        # necessary does not work either.
-        #
-        # Profiling experiments showed that almost all the cost is spent inside
-        # the pyqtgraph TextItem constructor. The total cost of this re-build
-        # approach amounts to about 15-20% of the CPU time spent in zooming.
-        # This is now being handled by a proxy instantiation mechanism. Profiling
-        # experiments with the proxy mechanism in place show that the time taken
-        # by the TextItem constructor drops to 4% of total CPU time.
+        # Markers are plotted at a fixed height in the screen coordinate
+        # system, and their X coordinate is pinned down to the plot surface
+        # in data value. This used to require one pyqtgraph TextItem per
+        # marker, which had to be rebuilt (not just repositioned) at every
+        # zoom step. Profiling experiments showed that almost all the cost
+        # was spent inside the TextItem constructor, and in the addItem and
+        # removeItem calls.
         #
-        # The pinning of the Y coordinate is handled by the handle_zoom method
-        # that in turn relies in the storage of marker instances row-wise in the
-        # line list table.
+        # Now all markers are drawn by a single LineIDLabels item, added
+        # once to the plot. Plotting and zooming just hand it arrays with
+        # the positions, texts, and colors, of the markers on display.
+        # Heights are given in fractions of the view height, which the
+        # item maps to data values when painting, so zooming and panning
+        # don't have to touch them.
         plot_item = self._plot_item
 
-        height = self._compute_height(merged_linelist, plot_item)
-
         # column names are defined in the YAML files
         # or by constants elsewhere.
-        wave_column = merged_linelist.columns[REDSHIFTED_WAVELENGTH_COLUMN]
-        id_column = merged_linelist.columns[ID_COLUMN]
-        color_column = merged_linelist[COLOR_COLUMN]
-
-        # To enable marker removal from plot, markers are stored
-        # row-wise so as to match row selections in table views.
-        markers = merged_linelist[MARKER_COLUMN]
-
-        for row_index in range(len(wave_column)):
-
-            # tool tip contains all info in table.
+        self._marker_x = np.asarray(merged_linelist.columns[REDSHIFTED_WAVELENGTH_COLUMN], dtype=float)
+        self._marker_text = merged_linelist.compact.values(ID_COLUMN)
+
+        # tool tips are built when the mouse hovers over a marker,
+        # not up front for every line.
+        self._marker_compact = merged_linelist.compact
+        self._tooltip_cache = {}
+
+        # heights are computed once per draw. Zooming and panning
+        # leave them alone.
+        (self._marker_height,
+         self._marker_y_coordinates,
+         self._marker_offset) = self._compute_height(merged_linelist)
+
+        # the markers that show up at each zoom level are
+        # pre-computed, once per draw.
+        self._declutter_index = DeclutterIndex(self._marker_x,
+                                               _marker_priority(merged_linelist, self.label_priority))
+
+        if self._labels_item is None:
+            self._labels_item = LineIDLabels()
+            plot_item.addItem(self._labels_item, ignoreBounds=True)
+
+        self._update_markers(merged_linelist)
+
+    # Hands the markers that survive de-cluttering, at their
+    # current heights, to the labels item.
+    def _update_markers(self, merged_linelist):
+        height = self._marker_height
+
+        rows = self._declutter()
+
+        self._labels_item.setData(self._marker_x[rows],
+                                  height[rows],
+                                  [self._marker_text[row] for row in rows],
+                                  color_index=merged_linelist.groups[rows],
+                                  palette=merged_linelist.group_colors,
+                                  tooltips=lambda index: self._marker_tooltip(rows[index]),
+                                  y_coordinates=self._marker_y_coordinates,
+                                  offset=self._marker_offset)
+
+    # tool tip contains all info in table.
+    def _marker_tooltip(self, row):
+        tool_tip = self._tooltip_cache.get(row)
+        if tool_tip is None:
+            compact = self._marker_compact
             tool_tip = ""
-            for col_index in range(len(merged_linelist.columns)):
-                col_name = merged_linelist.colnames[col_index]
-                if not col_name in [COLOR_COLUMN]:
-                    value = merged_linelist.columns[col_index][row_index]
-                    tool_tip += col_name + '=' + str(value) + ', '
-
-            # For now, use proxy markers to speed up processing.
-            marker = LineIDMarkerProxy(wave_column[row_index],
-                                       height[row_index],
-                                       text=id_column[row_index],
-                                       plot_item=plot_item,
-                                       tip=tool_tip,
-                                       color=color_column[row_index],
-                                       orientation='vertical')
-
-            markers[row_index] = marker
-
-        # after all markers are created, check their positions
-        # and disable some to de-clutter the plot.
-        new_markers = self._declutter(markers)
-
-        # place markers on screen
-        for marker_proxy in new_markers:
-            if marker_proxy:
-                # build eal, full-fledged marker from proxy.
-                real_marker = LineIDMarker(marker_proxy)
-                real_marker.setPos(real_marker.x0, real_marker.y0)
-
-                self._plot_item.addItem(real_marker)
-                self._markers_on_screen.append(real_marker)
-
-        plot_item.update()
-
-    # Slot called by the zoom control thread.
+            for col_index, col_name in enumerate(compact.colnames):
+                tool_tip += col_name + '=' + str(compact.cell(row, col_index)) + ', '
+            self._tooltip_cache[row] = tool_tip
+        return tool_tip
+
+    # Slot called by the zoom timer.
     def _handle_zoom(self):
         # this method may be called by zoom signals that can be emitted
         # when a merged line list is not available yet.
-        if hasattr(self, '_merged_linelist'):
-
-            # Experiments with timing
-            # self.Cron = QTime(0,0,0,0)
-            # self.Cron.start()
-
-            # update height column in line list based on
-            # the new, zoomed coordinates.
-            height_array = self._compute_height(self._merged_linelist, self._plot_item)
-
-            # remove markers that are displaying right now
-            for index in range(len(self._markers_on_screen)):
-                marker = self._markers_on_screen[index]
-                self._plot_item.removeItem(marker)
-            self._markers_on_screen = []
-
-            # update markers based on what is stored in the
-            # marker_list table column.
-            marker_list = self._merged_linelist[MARKER_COLUMN]
-            for index in range(len(marker_list)):
-                marker = marker_list[index]
-
-                # New marker is built with same parameters as older marker that was
-                # just removed, but for the new Y position.
-                #
-                # Note that it's not enough to remove a marker, reset its position,
-                # and add it back to the plot. It's necessary to rebuild a new marker
-                # instance. This probably has to do with the affine transform objects
-                # that are stored inside each TextItem instance. These transforms do not
-                # behave as expected when we run everything with auto range turned on.
-                # Switching auto range on and off when necessary does not work either.
-                #
-                # Profiling experiments showed that almost all the cost is spent inside
-                # the pyqtgraph TextItem constructor. The total cost of this re-build
-                # approach amounts to about 15-20% of the CPU time spent in zooming.
-                # This is now being handled by a proxy instantiation mechanism. Profiling
-                # experiments with the proxy mechanism in place show that the time taken
-                # by the TextItem constructor drops to 4% of total CPU time.
-
-                new_marker = LineIDMarkerProxy(marker.x0, height_array[index], proxy=marker)
-
-                # Replace old marker with new.
-                marker_list[index] = new_marker
-
-            # after all markers are created, check their relative positions
-            # on screen and disable some to de-clutter the plot.
-            decluttered_list = self._declutter(marker_list)
-
-            # Finally, add the de-cluttered new markers to the plot.
-            for marker_proxy in decluttered_list:
-                if marker_proxy:
-                    # build real, full-fledged marker from proxy.
-                    real_marker = LineIDMarker(marker_proxy)
-                    real_marker.setPos(real_marker.x0, real_marker.y0)
-
-                    self._plot_item.addItem(real_marker)
-                    self._markers_on_screen.append(real_marker)
-
-            self._plot_item.update()
-
-            # took = self.Cron.elapsed()
-            # print("took: {0} msec" .format(str(took)))
-
-            self._zoom_markers_thread.zoom_end.emit()
-
-    # compute height to display each marker
-    def _compute_height(self, merged_linelist, plot_item):
-        data_range = plot_item.viewRange()
-        ymin = data_range[1][0]
-        ymax = data_range[1][1]
-
-        return (ymax - ymin) * merged_linelist.columns[HEIGHT_COLUMN] + ymin
-
-    # Returns a new list with proxy marker instances to be plotted.
-    # This list is a (shallow) copy of the input list, where object
-    # references are set to None whenever their distance in X+Y pixels
-    # to the next neighbor is smaller than a given threshold.
-    #
-    # Using both X and Y as a distance criterion ensures that markers
-    # displayed at different heights are not removed from the plot,
-    # even when their X coordinate places them too close to each other.
-    #
-    # NOTE: However, using the sum of X and Y distances causes a lot more
-    # markers to be displayed when separate data sets, both with large number
-    # of lines, are displayed at different heights on screen. In a way, it
-    # defeats the purpose of de-cluttering. And makes the code run slower:
-    # right now, the CPU bottleneck is in the np.array() constructors that
-    # build the X and Y arrays. Temporarily, we remove the Y array entirely.
-    # In case this needs more work, users will give us feedback eventually.
+        if hasattr(self, '_merged_linelist') and self._labels_item is not None:
+
+            # marker heights take care of themselves. Just
+            # de-clutter the plot for the new range.
+            self._update_markers(self._merged_linelist)
+
+    # compute height to display each marker, and the coordinate
+    # system it is given in.
+    def _compute_height(self, merged_linelist):
+        if self.label_height == HEIGHT_FLUX:
+            flux = self._flux_at(self._marker_x)
+            if flux is not None:
+                # markers sit on the curve, with their ticks
+                # reaching down to it.
+                return flux, DATA_COORDINATES, TICK_LENGTH
+
+        # heights are defined per input list (group), as fractions
+        # of the view height. These are pinned down to the screen.
+        heights = merged_linelist.group_heights[merged_linelist.groups]
+
+        return heights, VIEW_FRACTION, 0.
+
+    # flux of the first curve in the plot, interpolated at given
+    # wavelengths. None if there are no curves. Spectra are
+    # interpolated at full resolution: what they display may be
+    # decimated, and clipped to the view.
+    def _flux_at(self, x):
+        for item in self._plot_item.listDataItems():
+            if isinstance(item, PlotDataItem):
+                curve_x, curve_y = item.spectral_axis, item.flux
+            else:
+                curve_x, curve_y = item.getData()
+            if curve_x is None or curve_y is None or len(curve_y) == 0:
+                continue
+
+            # step mode curves have one more x value than y values.
+            curve_x = np.asarray(curve_x[:len(curve_y)], dtype=float)
+            curve_y = np.asarray(curve_y, dtype=float)
+
+            finite = np.isfinite(curve_x) & np.isfinite(curve_y)
+            curve_x = curve_x[finite]
+            curve_y = curve_y[finite]
+            if len(curve_x) == 0:
+                continue
+
+            order = np.argsort(curve_x, kind='mergesort')
+            return np.interp(x, curve_x[order], curve_y[order])
+
+        return None
+
+    # Returns the rows of the markers to be plotted. These are the
+    # markers in the wave range on display that are farther away, in
+    # X pixels, from any marker with higher priority than a threshold.
+    # The threshold is the horizontal extent of a (vertical) label, so
+    # the labels on display do not overlap.
     #
-    # With these optimizations in place, about 7% of the CPU time spent
-    # in zooming is due to the _declutter method. Almost all of it is in
-    # line 341 (list comprehension + np.array() constructor).
-
-    def _declutter(self, marker_list):
-        if len(marker_list) > 10:
-            threshold = 5
-
-            data_range = self._plot_item.viewRange()
-            x_pixels = self._plot_item.sceneBoundingRect().width()
-            # y_pixels = self._plot_item.sceneBoundingRect().height()
-            xmin = data_range[0][0]
-            xmax = data_range[0][1]
-            # ymin = data_range[1][0]
-            # ymax = data_range[1][1]
-
-            # compute X and Y distances in between markers, in screen pixels
-            x = np.array([marker.x0 for marker in marker_list])
-            xdist = np.diff(x)
-            xdist *= x_pixels / (xmax - xmin)
-            # y = np.array([marker.y0 for marker in marker_list])
-            # ydist = np.diff(y)
-            # ydist *= y_pixels / (ymax - ymin)
-
-            # replace cluttered markers with None
-            # new_array = np.where((xdist + ydist) < threshold, None, np.array(marker_list[1:]))
-            new_array = np.where(xdist < threshold, None, np.array(marker_list[1:]))
-
-            # replace markers currently outside the wave range with None
-            new_array_2 = np.where(x[1:] < xmin, None, new_array)
-            new_array_3 = np.where(x[1:] > xmax, None, new_array_2)
-            new_list = new_array_3.tolist()
-
-            # make sure at least a few markers show
-            if new_list.count(None) >= len(new_list) - 3:
-                mid = int(len(new_list) / 2)
-                mid_1 = int(max(0, mid - 8))
-                mid_2 = int(min(mid + 8, len(new_list)-1))
-                new_list[mid] = marker_list[mid]
-                new_list[mid_1] = marker_list[mid_1]
-                new_list[mid_2] = marker_list[mid_2]
-
-            return new_list
-        else:
-            return marker_list
+    # Using Y as well as X as a distance criterion would ensure that
+    # markers displayed at different heights are not removed from the
+    # plot, even when their X coordinate places them too close to each
+    # other. However, it causes a lot more markers to be displayed when
+    # separate data sets, both with large number of lines, are displayed
+    # at different heights on screen. In a way, it defeats the purpose of
+    # de-cluttering. In case this needs more work, users will give us
+    # feedback eventually.
+
+    def _declutter(self):
+        data_range = self._plot_item.viewRange()
+        xmin = data_range[0][0]
+        xmax = data_range[0][1]
+
+        x_pixels = self._plot_item.getViewBox().sceneBoundingRect().width()
+
+        # nothing shows up before the view box is laid out, or
+        # while it's hidden.
+        if x_pixels <= 0 or xmax <= xmin:
+            return np.array([], dtype=int)
+
+        return self._declutter_index.visible(xmin, xmax, (xmax - xmin) / x_pixels,
+                                             self._labels_item.text_height())
 
     def _remove_linelabels_from_plot(self):
-        if hasattr(self, '_merged_linelist'):
-            markers = self._markers_on_screen
-            for index in range(len(markers)):
-                self._plot_item.removeItem(markers[index])
+        if self._labels_item is not None:
+            self._plot_item.removeItem(self._labels_item)
             self._plot_item.update()
-            self._markers_on_screen = []
-
-    def _destroy_zoom_markers_thread(self):
-        if hasattr(self, '_zoom_markers_thread') and self._zoom_markers_thread:
-            self._zoom_markers_thread.stop_processing()
-            self._zoom_markers_thread = None
-
-
-class ZoomMarkersThread(QThread):
-
-    # Notice that we can't use the dispatch mechanism to manage the zoom
-    # thread and its signal-slot dependencies. Something in the dispatch
-    # code messes up with the timing relationships in the GUI and secondary
-    # threads, causing the “Timers cannot be started from another thread”
-    # warning, and eventual app crash. We have to manage locally-defined
-    # signals instead, explicitly connecting them with their slots
-
-    do_zoom = Signal()
-    zoom_end = Signal()
-
-    def __init__(self, caller, npoints):
-        super(ZoomMarkersThread, self).__init__()
-        self.buffer = caller._zoom_event_buffer
-        self.npoints = npoints
-        self.is_processing = False
-        self.is_zooming = False
-
-        self.zoom_end.connect(self.zoom_finished)
-
-    def run(self):
-        while(self.is_processing):
-
-            value = self.buffer.get()
-            if value:
-                self.do_zoom.emit()
-
-                self.is_zooming = True
-
-                # wait for zoom to finish.
-                while(self.is_zooming):
-                    QThread.msleep(10)
-
-            # one more, to prevent hiccups.
-            QThread.msleep(10)
+            self._labels_item = None
 
-    def zoom_finished(self):
-        self.is_zooming = False
 
-    def start_processing(self):
-        self.is_processing = True
-        self.start()
-
-    def stop_processing(self):
-        self.is_processing = False
-        self.buffer.clear()
-
-
-class ZoomEventBuffer(object):
-
-    # A mutex-lockable buffer that stores zoom request events.
-
-    def __init__(self):
-        self.buffer = []
-        self.mutex = QMutex()
-
-    def clear(self):
-        self.mutex.lock()
-        self.buffer = []
-        self.mutex.unlock()
-
-    def put(self, value):
-        self.mutex.lock()
-
-        # Don't let the buffer fill up too much.
-        # Keep just the most recent zoom events.
-        while len(self.buffer) > 5:
-            self.buffer.pop()
-
-        self.buffer.insert(0, value)
-
-        self.mutex.unlock()
-
-    def get(self):
-        self.mutex.lock()
-        if len(self.buffer) > 0:
-            value = self.buffer.pop()
-        else:
-            value = None
-        self.mutex.unlock()
-        return value
+class DeclutterIndex(object):
+    """
+    Multi-resolution index that tells which line markers should
+    show up at any zoom level.
+
+    Each marker is assigned the distance, in data units, to the
+    nearest marker with higher priority. A marker shows up when
+    that distance, in pixels, is above a threshold. As the plot is
+    zoomed in, more markers show up, and the ones already showing
+    stay. Markers closer to each other than the threshold never
+    show up together. The marker with highest priority among the
+    ones in range always shows up, even if a marker with higher
+    priority sits just out of range: no marker in range can be
+    closer to it than to that one.
+
+    Parameters
+    ----------
+    x: array
+        marker positions
+    priority: array
+        marker ranks; lower ranks have higher priority
+    """
+    def __init__(self, x, priority):
+        self._order = np.argsort(x, kind='mergesort')
+        self._x = np.asarray(x, dtype=float)[self._order]
+        self._rank = np.asarray(priority)[self._order]
+        self._distance = _nearest_higher_priority(self._x, self._rank)
+
+    def visible(self, xmin, xmax, units_per_pixel, threshold):
+        """
+        Rows of the markers that show up in between 'xmin' and
+        'xmax', given a scale and a threshold distance in pixels.
+        """
+        start = np.searchsorted(self._x, xmin, side='left')
+        end = np.searchsorted(self._x, xmax, side='right')
+
+        visible = self._distance[start:end] >= threshold * units_per_pixel
+        if end > start:
+            visible[np.argmin(self._rank[start:end])] = True
+
+        return self._order[start:end][visible]
+
+
+def _nearest_higher_priority(x, rank):
+    # distance from each position in a sorted array to the nearest
+    # position with lower rank, on either side.
+    n = len(x)
+    distance = np.full(n, np.inf)
+
+    left = _nearest_lower_rank(rank)
+    found = left >= 0
+    distance[found] = x[found] - x[left[found]]
+
+    right = _nearest_lower_rank(rank[::-1])[::-1]
+    found = right >= 0
+    right = n - 1 - right
+    distance[found] = np.minimum(distance[found], x[right[found]] - x[found])
+
+    return distance
+
+
+def _nearest_lower_rank(rank):
+    # index of the nearest position to the left of each position with
+    # a lower rank, or -1. Found for all positions at once by binary
+    # lifting over a table with the minimum rank of blocks of 2**k
+    # positions. The table takes O(n log n) memory, ranks are kept
+    # in 32 bits to halve it: about 80 MB for a million markers.
+    n = len(rank)
+    rank = np.asarray(rank, dtype=np.int32)
+
+    levels = [rank]
+    width = 1
+    while 2 * width <= n:
+        levels.append(np.minimum(levels[-1][:-width], levels[-1][width:]))
+        width *= 2
+
+    # each position moves its left end past blocks where all ranks
+    # are higher than its own, largest blocks first.
+    end = np.arange(n)
+    for k in range(len(levels) - 1, -1, -1):
+        start = end - (1 << k)
+        valid = start >= 0
+        skip = valid & (levels[k][np.where(valid, start, 0)] > rank)
+        end = np.where(skip, start, end)
+
+    return end - 1
+
+
+def _marker_priority(merged_linelist, priority):
+    # ranks of the lines in a merged list, by intensity (strongest
+    # first) or by list order, each one breaking ties of the other.
+    groups = merged_linelist.groups
+
+    compact = merged_linelist.compact
+    if INTENSITY_COLUMN in compact.colnames and compact.values(INTENSITY_COLUMN).dtype.kind in 'iuf':
+        intensity = -compact.values(INTENSITY_COLUMN).astype(float)
+        mask = compact.mask(INTENSITY_COLUMN)
+        if mask is not None:
+            intensity[mask] = np.inf
+    else:
+        intensity = np.zeros(len(groups))
+
+    if priority == PRIORITY_LIST:
+        order = np.lexsort((intensity, groups))
+    else:
+        order = np.lexsort((groups, intensity))
+
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    return rank
@@ -2,27 +2,36 @@
 Define all the line list-based windows and dialogs
 """
 import os
+import re
+import logging
+from collections import OrderedDict
+
+import numpy as np
 
 from qtpy.QtWidgets import (QWidget, QGridLayout, QHBoxLayout, QLabel,
                             QPushButton, QTabWidget, QVBoxLayout, QSpacerItem,
                             QSizePolicy, QToolBar, QLineEdit, QTabBar,
                             QAction, QTableView, QMainWindow, QHeaderView,
                             QAbstractItemView, QLayout, QTextBrowser, QComboBox,
-                            QDialog, QErrorMessage)
+                            QDialog, QErrorMessage, QProgressDialog, QCheckBox,
+                            QProgressBar)
 from qtpy.QtGui import QIcon, QColor, QStandardItem, \
                        QDoubleValidator, QFont
 from qtpy.QtCore import (Signal, QSize, QCoreApplication, QMetaObject, Qt,
-                         QAbstractTableModel, QVariant, QSortFilterProxyModel)
+                         QAbstractTableModel, QVariant, QTimer, QThread,
+                         QModelIndex)
 from qtpy import compat
 from qtpy.uic import loadUi
 
 from astropy.units import Quantity
 from astropy.units.core import UnitConversionError
 from astropy.io import ascii
+from astropy.table import Table
 
 from ..core import linelist
-from ..core.linelist import WAVELENGTH_COLUMN, ERROR_COLUMN, DEFAULT_HEIGHT
+from ..core.linelist import WAVELENGTH_COLUMN, ERROR_COLUMN, COLOR_COLUMN, DEFAULT_HEIGHT, ID_COLUMN
 from ..core.linelist import columns_to_remove
+from .line_labels_plotter import HEIGHT_FIXED, HEIGHT_FLUX
 
 ICON_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
                                          '..', 'data', 'qt', 'resources'))
@@ -44,23 +53,53 @@ ID_COLORS = {
 PLOTTED = "Plotted"
 NLINES_WARN = 150
 
+# number of formatted rows kept by a table model. A few
+# screenfuls, regardless of the size of the line list.
+ROW_CACHE_SIZE = 256
+
+# delay, in milliseconds, before filter edits are applied.
+FILTER_DELAY = 300
+
 # Function that creates one single tabbed pane with one single view of a line list.
 
-def _createLineListPane(linelist, table_model, caller):
+def _sample_column_widths(linelist):
+    """
+    Estimates the width, in characters, of each column in a compact
+    line list, from its header and a sample of evenly spaced rows.
+    This doesn't touch any GUI object, thus it's safe to run in a
+    worker thread.
+    """
+    nrows = len(linelist)
+    rows = np.unique(np.linspace(0, max(nrows - 1, 0), min(nrows, ROW_CACHE_SIZE)).astype(int))
+
+    widths = []
+    for column, colname in enumerate(linelist.colnames):
+        width = len(colname)
+        for row in rows:
+            width = max(width, len(str(linelist.cell(row, column))))
+        widths.append(width)
+
+    return widths
+
+
+def _set_column_widths(table_view, column_widths):
+    # character counts are turned into pixels with the metrics
+    # of the view's font, plus some room for the cell margins.
+    metrics = table_view.fontMetrics()
+    char_width = max(metrics.averageCharWidth(), metrics.width('0'))
+    for column, width in enumerate(column_widths):
+        table_view.setColumnWidth(column, char_width * width + 2 * char_width)
+
+
+def _createLineListPane(linelist, table_model, caller, column_widths=None):
 
     table_view = QTableView()
 
-    # disabling sorting will significantly speed up the rendering,
-    # in particular of large line lists. These lists are often jumbled
-    # in wavelength, and consequently difficult to read and use, so
-    # having a sorting option is useful indeed. It remains to be seen
-    # what would be the approach users will favor. We might add a toggle
-    # that users can set/reset depending on their preferences.
-    table_view.setSortingEnabled(False)
-    sort_proxy = SortModel(table_model.getName())
-    sort_proxy.setSourceModel(table_model)
-
-    table_view.setModel(sort_proxy)
+    # Large line lists are often jumbled in wavelength, and consequently
+    # difficult to read and use, so having a sorting option is useful
+    # indeed. The table model sorts itself, with one vectorized argsort
+    # per column, so sorting stays fast even for the largest lists.
+    table_view.setModel(table_model)
     table_view.setSortingEnabled(True)
     table_view.horizontalHeader().setStretchLastSection(True)
 
@@ -73,15 +112,22 @@ def _createLineListPane(linelist, table_model, caller):
     # table_view.verticalHeader().setStretchLastSection(False)
     table_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
     table_view.setSelectionBehavior(QAbstractItemView.SelectRows)
-    table_view.resizeColumnsToContents()
+
+    # column widths are computed from a sample of rows that fits
+    # in the model's row cache, instead of from the entire list.
+    # Or, they come already estimated, in characters.
+    if column_widths is None:
+        table_view.horizontalHeader().setResizeContentsPrecision(ROW_CACHE_SIZE)
+        table_view.resizeColumnsToContents()
+    else:
+        _set_column_widths(table_view, column_widths)
 
     # this preserves the original sorting state of the list. Use zero
-    # to sort by wavelength on load. Doesn't seem to affect performance
-    # by much tough.
-    sort_proxy.sort(-1, Qt.AscendingOrder)
+    # to sort by wavelength on load.
+    table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
 
     # table selections will change the total count of lines selected.
-    pane = LineListPane(table_view, linelist, sort_proxy, caller)
+    pane = LineListPane(table_view, linelist, table_model, caller)
 
     return pane, table_view
 
@@ -112,6 +158,10 @@ class LineListsWindow(ClosableMainWindow):
 
         self.wave_range = (None, None)
 
+        # workers that are building views, or reading very large
+        # line lists, in the background.
+        self._view_builders = []
+
         loadUi(os.path.join(os.path.dirname(__file__), "ui", "linelists_window.ui"), self)
         self.setWindowTitle(str(self.plot_window._title))
 
@@ -120,6 +170,12 @@ class LineListsWindow(ClosableMainWindow):
         self.line_list_selector.setToolTip("Select line list from internal library")
         self.mainToolBar.addWidget(self.line_list_selector)
 
+        self.label_height_selector = QComboBox()
+        self.label_height_selector.setToolTip("Height of the line labels in the plot")
+        self.label_height_selector.addItem("Fixed heights", HEIGHT_FIXED)
+        self.label_height_selector.addItem("Heights follow flux", HEIGHT_FLUX)
+        self.mainToolBar.addWidget(self.label_height_selector)
+
         # QtDesigner creates tabbed widgets with 2 tabs, and doesn't allow
         # removing then in the designer itself. Remove in here then.
         while self.tabWidget.count() > 0:
@@ -175,6 +231,9 @@ class LineListsWindow(ClosableMainWindow):
         self.actionOpen.triggered.connect(lambda:self._open_linelist_file(file_name=None))
         self.actionExport.triggered.connect(lambda:self._export_to_file(file_name=None))
         self.line_list_selector.currentIndexChanged.connect(self._lineList_selection_change)
+        self.label_height_selector.currentIndexChanged.connect(
+            lambda index: self.plot_window.line_labels_plotter.set_label_height(
+                self.label_height_selector.itemData(index)))
         self.tabWidget.tabCloseRequested.connect(self.tab_close)
 
     def _get_waverange_from_dialog(self, line_list):
@@ -197,16 +256,65 @@ class LineListsWindow(ClosableMainWindow):
 
             # For now, lets assume both the line list itself, and its
             # associated YAML descriptor file, live in the same directory.
-            # Not an issue for self-contained ecsv files.
+            # Not an issue for self-contained ecsv files. When several
+            # files are picked at once, they can be parsed in parallel.
             if file_name is not None and len(file_name) > 0:
-                name = file_name[0]
-                line_list = linelist.get_from_file(os.path.dirname(name), name)
-
-                if line_list:
-                    self._get_waverange_from_dialog(line_list)
-                    if self.wave_range[0] and self.wave_range[1]:
-                        line_list = self._build_view(line_list, 0, waverange=self.wave_range)
-                        self.plot_window.linelists.append(line_list)
+                # very large files are streamed instead, see below.
+                large_files = [name for name in file_name
+                               if linelist.source_size(name) > linelist.STREAMING_THRESHOLD]
+                file_name = [name for name in file_name if name not in large_files]
+
+                line_lists = linelist.get_from_files(file_name)
+
+                for line_list in line_lists:
+                    if line_list:
+                        self._get_waverange_from_dialog(line_list)
+                        if self.wave_range[0] and self.wave_range[1]:
+                            self._build_view(line_list, 0, waverange=self.wave_range,
+                                             append_to_plot=True)
+
+                for name in large_files:
+                    self._stream_linelist_file(name)
+
+    # Very large line lists (e.g. full atomic databases) are not read
+    # whole. The wavelength range is asked for up front, and the file
+    # is read in chunks, keeping only the lines within range. Reading
+    # takes place in a worker thread, while a progress dialog lets the
+    # user cancel it.
+    def _stream_linelist_file(self, file_name):
+        self._get_waverange_from_dialog(None)
+        if not (self.wave_range[0] and self.wave_range[1]):
+            return
+
+        progress_dialog = QProgressDialog("Reading " + os.path.basename(file_name),
+                                          "Cancel", 0, 100, self)
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+
+        streamer = LineListStreamer(file_name, self.wave_range)
+        streamer.progress.connect(progress_dialog.setValue)
+        streamer.ready.connect(lambda line_list: self._finish_stream(progress_dialog, line_list))
+        streamer.failed.connect(lambda message: self._fail_stream(progress_dialog, message))
+        progress_dialog.canceled.connect(streamer.cancel)
+
+        # a reference must be kept for as long as the thread runs.
+        self._view_builders.append(streamer)
+        streamer.finished.connect(lambda: self._view_builders.remove(streamer))
+
+        streamer.start()
+
+    def _finish_stream(self, progress_dialog, line_list):
+        progress_dialog.close()
+
+        if line_list:
+            self._build_view(line_list, 0, append_to_plot=True)
+
+    def _fail_stream(self, progress_dialog, message):
+        progress_dialog.close()
+
+        error_dialog = QErrorMessage()
+        error_dialog.showMessage(message)
+        error_dialog.exec_()
 
     def _export_to_file(self, file_name=None):
         if file_name is None:
@@ -219,7 +327,9 @@ class LineListsWindow(ClosableMainWindow):
                 if not file_name.endswith('.ecsv'):
                     file_name += '.ecsv'
 
-                output_table = self._plotted_lines_pane.plotted_lines.table
+                # the output table shares its columns with the plotted
+                # list, which is left untouched.
+                output_table = Table(self._plotted_lines_pane.plotted_lines.table, copy=False)
 
                 for colum_name in columns_to_remove:
                     if colum_name in output_table.colnames:
@@ -294,15 +404,21 @@ class LineListsWindow(ClosableMainWindow):
     # computes how many lines in the supplied list
     # fall within the supplied wavelength range. The
     # result populates the supplied label. Or, it
-    # builds a fresh QLabel with the result.
+    # builds a fresh QLabel with the result. The count
+    # comes from a binary search over the sorted list,
+    # so nothing is extracted. Lists being streamed
+    # are not available yet, so they can't be counted.
     def _compute_nlines_in_waverange(self, line_list, min_text, max_text, label):
 
+        if line_list is None:
+            label.setText('?')
+            return label
+
         amin, amax = self._get_range_from_textfields(min_text, max_text)
 
         if amin != None or amax != None:
             r = (amin, amax)
-            extracted = line_list.extract_range(r)
-            nlines = len(extracted[WAVELENGTH_COLUMN].data)
+            nlines = line_list.count_in_range(r)
 
             label.setText(str(nlines))
             color = 'black' if nlines < NLINES_WARN else 'red'
@@ -310,10 +426,41 @@ class LineListsWindow(ClosableMainWindow):
 
         return label
 
-    def _build_view(self, line_list, index, waverange=(None,None)):
+    # Building a view on a large list takes time. The range extraction,
+    # the column arrays, and the column widths are prepared in a worker
+    # thread, while a loading pane takes the place of the view in the
+    # tabbed pane. The GUI thread just puts the pieces together at the
+    # end. Meanwhile, the app remains responsive.
+    def _build_view(self, line_list, index, waverange=(None,None), append_to_plot=False):
+
+        loading_pane = LoadingPane(line_list.name, LineListViewBuilder.NSTEPS)
+        self.tabWidget.insertTab(index, loading_pane, str(line_list.name))
+        self.tabWidget.setCurrentIndex(index)
+
+        builder = LineListViewBuilder(line_list, waverange)
+        builder.progress.connect(loading_pane.progress_bar.setValue)
+        builder.ready.connect(
+            lambda result: self._finish_view(loading_pane, result, append_to_plot))
+        builder.failed.connect(lambda message: self._fail_view(loading_pane, message))
+        loading_pane.cancel_button.clicked.connect(
+            lambda: self._cancel_view(loading_pane, builder))
 
-        if waverange[0] and waverange[1]:
-            line_list = line_list.extract_range(waverange)
+        # a reference must be kept for as long as the thread runs.
+        self._view_builders.append(builder)
+        builder.finished.connect(lambda: self._view_builders.remove(builder))
+
+        builder.start()
+
+    def _finish_view(self, loading_pane, result, append_to_plot):
+        index = self.tabWidget.indexOf(loading_pane)
+        if index < 0:
+            # closed while loading.
+            return
+
+        line_list, column_widths = result
+
+        self.tabWidget.removeTab(index)
+        loading_pane.deleteLater()
 
         table_model = LineListTableModel(line_list)
 
@@ -324,7 +471,8 @@ class LineListsWindow(ClosableMainWindow):
             lineset_tabbed_pane = QTabWidget()
             lineset_tabbed_pane.setTabsClosable(True)
 
-            pane, table_view = _createLineListPane(line_list, table_model, self)
+            pane, table_view = _createLineListPane(line_list, table_model, self,
+                                                   column_widths=column_widths)
             lineset_tabbed_pane.addTab(pane, "Original")
             pane.setLineSetsTabbedPane(lineset_tabbed_pane)
 
@@ -337,13 +485,28 @@ class LineListsWindow(ClosableMainWindow):
             self.tabWidget.insertTab(index, lineset_tabbed_pane, table_model.getName())
             self.tabWidget.setCurrentIndex(index)
 
-            # store for use down stream.
-            # self.table_views.append(table_view)
-            # self.set_tabbed_panes.append(set_tabbed_pane)
-            # self.tab_count.append(0)
-            # self.panes.append(pane)
+            if append_to_plot:
+                self.plot_window.linelists.append(line_list)
+
+    def _fail_view(self, loading_pane, message):
+        index = self.tabWidget.indexOf(loading_pane)
+        if index >= 0:
+            self.tabWidget.removeTab(index)
+            loading_pane.deleteLater()
+
+            error_dialog = QErrorMessage()
+            error_dialog.showMessage(message)
+            error_dialog.exec_()
+
+    def _cancel_view(self, loading_pane, builder):
+        # the worker can't be interrupted in the middle of a step;
+        # its results are just discarded.
+        builder.cancel()
 
-            return line_list
+        index = self.tabWidget.indexOf(loading_pane)
+        if index >= 0:
+            self.tabWidget.removeTab(index)
+            loading_pane.deleteLater()
 
     def _buildViews(self, plot_window):
         window_linelists = plot_window.linelists
@@ -360,6 +523,13 @@ class LineListsWindow(ClosableMainWindow):
         self.tabWidget.removeTab(index)
 
     def displayPlottedLines(self, linelist):
+        # the plotted lines pane is built once, and then updated
+        # in place on every subsequent draw.
+        pane = getattr(self, '_plotted_lines_pane', None)
+        if pane is not None and self.tabWidget.indexOf(pane) >= 0:
+            pane.update_lines(linelist)
+            return
+
         self._plotted_lines_pane = PlottedLinesPane(linelist)
 
         for index in range(self.tabWidget.count()):
@@ -409,16 +579,240 @@ class LineListsWindow(ClosableMainWindow):
         return result
 
 
+class LoadingPane(QWidget):
+
+    # Stands in for a line list pane while it's being built.
+
+    def __init__(self, name, nsteps, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, nsteps)
+        self.progress_bar.setValue(0)
+
+        self.cancel_button = QPushButton("Cancel")
+
+        layout.addStretch()
+        layout.addWidget(QLabel("Loading " + str(name) + "..."), alignment=Qt.AlignCenter)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.cancel_button, alignment=Qt.AlignCenter)
+        layout.addStretch()
+
+
+class LineListViewBuilder(QThread):
+
+    # Prepares, in a worker thread, what's needed to display a line
+    # list in a pane: the lines in the wavelength range, the compact
+    # column arrays that back the table model, and the column widths.
+    # Everything here must stay clear of GUI objects.
+
+    NSTEPS = 3
+
+    progress = Signal(int)
+    ready = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, line_list, waverange):
+        super(LineListViewBuilder, self).__init__()
+
+        self._line_list = line_list
+        self._waverange = waverange
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            line_list = self._line_list
+            if self._waverange[0] is not None and self._waverange[1] is not None:
+                line_list = line_list.extract_range(self._waverange)
+            self.progress.emit(1)
+
+            if self._cancelled:
+                return
+            compact = line_list.compact
+            self.progress.emit(2)
+
+            if self._cancelled:
+                return
+            column_widths = _sample_column_widths(compact)
+            self.progress.emit(3)
+
+            if not self._cancelled:
+                self.ready.emit((line_list, column_widths))
+
+        except UnitConversionError as err:
+            self.failed.emit('Units conversion not possible.')
+        except Exception as err:
+            logging.warning("Could not build view on line list '%s': %s", self._line_list.name, err)
+            self.failed.emit(str(err))
+
+
+class LineListStreamer(QThread):
+
+    # Reads a very large line list file in a worker thread, keeping
+    # only the lines within a wavelength range. Progress is reported
+    # in percent of the file read.
+
+    progress = Signal(int)
+    ready = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, file_name, waverange):
+        super(LineListStreamer, self).__init__()
+
+        self._file_name = file_name
+        self._waverange = waverange
+        self._cancelled = False
+
+    def cancel(self):
+        # reading stops after the chunk at hand.
+        self._cancelled = True
+
+    def _progress(self, fraction):
+        self.progress.emit(int(fraction * 100))
+        return not self._cancelled
+
+    def run(self):
+        try:
+            line_list = linelist.stream_from_file(self._file_name, self._waverange,
+                                                  progress=self._progress)
+
+            if not self._cancelled:
+                self.ready.emit(line_list)
+
+        except UnitConversionError as err:
+            self.failed.emit('Units conversion not possible.')
+        except Exception as err:
+            logging.warning("Could not read line list '%s': %s", self._file_name, err)
+            self.failed.emit(str(err))
+
+
+class LineListFilterBar(QWidget):
+
+    # Filter criteria for the lines displayed in a line list pane.
+    # Criteria are evaluated as boolean masks over the column arrays,
+    # after a short pause in the user's typing.
+
+    filter_changed = Signal()
+
+    def __init__(self, linelist, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.species_text = QLineEdit()
+        self.species_text.setPlaceholderText("Species")
+        self.species_text.setToolTip("Text to look for in the species column")
+        self.regex_checkbox = QCheckBox("regex")
+        self.regex_checkbox.setToolTip("Species text is a regular expression")
+
+        # wavelengths, and other numeric thresholds, are given in the
+        # units of the list itself.
+        unit = linelist.compact.unit(WAVELENGTH_COLUMN)
+        self.wmin_text = self._number_text("min", "Minimum wavelength ({})".format(unit))
+        self.wmax_text = self._number_text("max", "Maximum wavelength ({})".format(unit))
+
+        self.column_selector = QComboBox()
+        self.column_selector.setToolTip("Column to apply thresholds to")
+        compact = linelist.compact
+        for colname in compact.colnames:
+            if colname != WAVELENGTH_COLUMN and compact.values(colname).dtype.kind in 'iuf':
+                self.column_selector.addItem(colname)
+        self.vmin_text = self._number_text("min", "Minimum value")
+        self.vmax_text = self._number_text("max", "Maximum value")
+
+        self.select_button = QPushButton("Select filtered")
+        self.select_button.setToolTip("Select all lines that pass the filter, for plotting")
+
+        # not all lists carry a species column.
+        if ID_COLUMN in linelist.compact.colnames:
+            layout.addWidget(self.species_text)
+            layout.addWidget(self.regex_checkbox)
+        else:
+            self.species_text.setEnabled(False)
+            self.regex_checkbox.setEnabled(False)
+        layout.addWidget(QLabel(WAVELENGTH_COLUMN))
+        layout.addWidget(self.wmin_text)
+        layout.addWidget(self.wmax_text)
+        if self.column_selector.count() > 0:
+            layout.addWidget(self.column_selector)
+            layout.addWidget(self.vmin_text)
+            layout.addWidget(self.vmax_text)
+        layout.addWidget(self.select_button)
+
+        # debounce edits.
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FILTER_DELAY)
+        self._timer.timeout.connect(self.filter_changed.emit)
+
+        # the signal arguments must not reach QTimer.start(msec).
+        for text in [self.species_text, self.wmin_text, self.wmax_text,
+                     self.vmin_text, self.vmax_text]:
+            text.textChanged.connect(lambda *args: self._timer.start())
+        self.regex_checkbox.toggled.connect(lambda *args: self._timer.start())
+        self.column_selector.currentIndexChanged.connect(lambda *args: self._timer.start())
+
+    @staticmethod
+    def _number_text(placeholder, tooltip):
+        text = QLineEdit()
+        text.setPlaceholderText(placeholder)
+        text.setToolTip(tooltip)
+        text.setValidator(QDoubleValidator())
+        text.setMaximumWidth(90)
+        return text
+
+    @staticmethod
+    def _number(text):
+        if text.text() and text.hasAcceptableInput():
+            return float(text.text())
+
+    def criteria(self):
+        """
+        The filter criteria, as arguments to `LineListTableModel.filter_mask`.
+        """
+        thresholds = {WAVELENGTH_COLUMN: (self._number(self.wmin_text),
+                                          self._number(self.wmax_text))}
+        if self.column_selector.count() > 0:
+            thresholds[self.column_selector.currentText()] = (self._number(self.vmin_text),
+                                                              self._number(self.vmax_text))
+
+        return {'species': self.species_text.text(),
+                'regex': self.regex_checkbox.isChecked(),
+                'thresholds': thresholds}
+
+    def is_empty(self):
+        criteria = self.criteria()
+        return not criteria['species'] and \
+               all(vmin is None and vmax is None for vmin, vmax in criteria['thresholds'].values())
+
+    def show_error(self, error):
+        # flags invalid regular expressions.
+        if error:
+            self.species_text.setStyleSheet("color: red")
+            self.species_text.setToolTip(str(error))
+        else:
+            self.species_text.setStyleSheet("")
+            self.species_text.setToolTip("Text to look for in the species column")
+
+
 class LineListPane(QWidget):
 
     # this builds a single pane dedicated to a single list.
 
-    def __init__(self, table_view, linelist, sort_proxy, caller, *args, **kwargs):
+    def __init__(self, table_view, linelist, table_model, caller, *args, **kwargs):
         super().__init__(None, *args, **kwargs)
 
         self.table_view = table_view
         self.linelist = linelist
-        self._sort_proxy = sort_proxy
+        self._table_model = table_model
         self._caller = caller
 
         self._build_GUI(linelist, table_view)
@@ -464,8 +858,14 @@ class LineListPane(QWidget):
             item = QStandardItem(uname)
             model.appendRow(item)
 
+        # filter bar.
+        self.filter_bar = LineListFilterBar(linelist)
+        self.filter_bar.filter_changed.connect(self._apply_filter)
+        self.filter_bar.select_button.clicked.connect(table_view.selectAll)
+
         # put it all together
         panel_layout.addWidget(info)
+        panel_layout.addWidget(self.filter_bar)
         panel_layout.addWidget(table_view)
         panel_layout.addWidget(self.button_pane)
 
@@ -484,7 +884,7 @@ class LineListPane(QWidget):
         # build list with only the selected rows. These must be model
         # rows, not view rows!
         selected_view_rows = self.table_view.selectionModel().selectedRows()
-        selected_model_rows = [self._sort_proxy.mapToSource(x) for x in selected_view_rows]
+        selected_model_rows = [self._table_model.mapToSource(x) for x in selected_view_rows]
 
         if len(selected_model_rows) > 0:
             r = [x for x in selected_model_rows]
@@ -502,6 +902,22 @@ class LineListPane(QWidget):
 
             self._sets_tabbed_pane.addTab(pane, str(self._sets_tabbed_pane.count()))
 
+    def _apply_filter(self):
+        if self.filter_bar.is_empty():
+            mask = None
+        else:
+            try:
+                mask = self._table_model.filter_mask(**self.filter_bar.criteria())
+            except re.error as err:
+                self.filter_bar.show_error(err)
+                return
+        self.filter_bar.show_error(None)
+
+        # filtering clears the selection.
+        self._table_model.set_filter(mask)
+        self._caller._countSelections()
+        self.handle_button_activation()
+
     def tab_close(self, index):
         self._sets_tabbed_pane.removeTab(index)
 
@@ -514,27 +930,23 @@ class PlottedLinesPane(QWidget):
 
     # This holds the list with the currently plotted lines.
     #
-    # This view is re-built every time a new set of markers
-    # is plotted. The list view build here ends up being the
-    # main bottleneck in terms of execution time perceived by
-    # the user (found this using cProfile). The time to build
-    # the list is about the same as the time spent in the
-    # paint() methods of all components in the plot, for a set
-    # of a couple hundred markers. Most of that time in turn is
-    # spent in the column resizing method in the table view. If
-    # sorting is enabled for this view, times will increase
-    # dramatically.
+    # This view used to be re-built every time a new set of markers
+    # was plotted, and that ended up being the main bottleneck in
+    # terms of execution time perceived by the user (found this using
+    # cProfile): about the same as the time spent in the paint()
+    # methods of all components in the plot, for a set of a couple
+    # hundred markers. Most of that time in turn was spent in the
+    # column resizing method in the table view.
+    #
+    # Now the pane, its table view, and its model, are built once
+    # and persist across draws. Each draw just tells the model what
+    # rows were added or removed, and column widths are estimated
+    # from a bounded sample of rows.
     #
     # This plotted lines pane represents one of the possible
     # implementations of the last requirement in Tony Marston's
     # line list document (option to show line information for
-    # lines shown in the plot). Given the slowness of it, it
-    # would be good to have feedback on this in order to try
-    # alternate implementation approaches (a simple ASCII table
-    # might suffice, perhaps). An alternate approach would be to
-    # use some timing algorithm that will prevent the view to be
-    # rebuilt rigth after a previous rebuilt. A time delay of sorts
-    # could take care of that.
+    # lines shown in the plot).
 
     def __init__(self, plotted_lines, *args, **kwargs):
         super().__init__(None, *args, **kwargs)
@@ -545,28 +957,28 @@ class PlottedLinesPane(QWidget):
         layout.setSizeConstraint(QLayout.SetMaximumSize)
         self.setLayout(layout)
 
-        table_model = LineListTableModel(plotted_lines)
-        if table_model.rowCount() > 0:
-            table_view = QTableView()
+        self.table_model = PlottedLinesTableModel(plotted_lines)
+
+        self.table_view = QTableView()
+        self.table_view.setModel(self.table_model)
+        self.table_view.setSortingEnabled(True)
+        self.table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
 
-            # disabling sorting will significantly speed up theWidget
-            # plot. This is because the table view must be re-built
-            # every time a new set of markers is drawn on the plot
-            # surface. Alternate approaches are worth examining. It
-            # remains to be seen what would be the approach users
-            # will favor.
+        self.table_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.table_view.horizontalHeader().setStretchLastSection(True)
+        _set_column_widths(self.table_view, _sample_column_widths(plotted_lines.compact))
 
-            table_view.setSortingEnabled(False)
-            proxy = SortModel(table_model.getName())
-            proxy.setSourceModel(table_model)
-            table_view.setModel(proxy)
-            table_view.setSortingEnabled(True)
+        layout.addWidget(self.table_view)
 
-            table_view.setSelectionMode(QAbstractItemView.NoSelection)
-            table_view.horizontalHeader().setStretchLastSection(True)
-            table_view.resizeColumnsToContents()
+    def update_lines(self, plotted_lines):
+        """
+        Displays a new set of plotted lines.
+        """
+        self.plotted_lines = plotted_lines
+
+        self.table_model.update_lines(plotted_lines)
 
-            layout.addWidget(table_view)
+        _set_column_widths(self.table_view, _sample_column_widths(plotted_lines.compact))
 
 
 class LineListTableModel(QAbstractTableModel):
@@ -575,67 +987,81 @@ class LineListTableModel(QAbstractTableModel):
 
         QAbstractTableModel.__init__(self, parent, *args)
 
+        # The model sorts and filters itself. The rows on display are
+        # given by a row map (view row -> list row), built from an
+        # argsort of the column arrays that is computed once per column,
+        # and from a boolean filter mask. None stands for all rows, in
+        # the original order.
+        self._sort_column = -1
+        self._sort_direction = Qt.AscendingOrder
+        self._filter_mask = None
+
+        self._set_linelist(linelist)
+        self._update_row_map()
+
+    def _set_linelist(self, linelist):
+        # sets up the model data from a line list. Sort and filter
+        # settings are left alone, but the row map must be updated.
         self._linelist = linelist
 
-        #TODO move entire table contents to an array of QVector
-        # instances that will store the columns. This should
-        # speed up the sorting (as far as some indications in
-        # the net suggest:
-        # http://www.qtforum.org/article/30638/qsortfilterproxymodel-qtreeview-sort-performance.html).
-        # Bummer... this is C++ only; PyQt never went to the trouble
-        # of converting QVector to python.
-        #
-        # get rid entirely of astropy table and store its contents in
-        # a 2-D list of lists. By using python lists instead of an
-        # astropy table, and storing the QVariant instances instead
-        # of the raw content, we can speed up sorting by a factor > 10X.
+        # Cells are read straight from the compact, column-oriented
+        # representation of the list (contiguous numpy arrays, with
+        # strings already decoded). Nothing is built per row up front,
+        # so building the model takes the same time whatever the size
+        # of the list. Cell text is formatted on demand, one row at a
+        # time, and kept only for the most recently displayed rows.
+        self._row_cache = OrderedDict()
 
         # we have to do this here because some lists may
         # have no lines at all.
         self._nrows = 0
         self._ncols = 0
 
-        self._row_cells = []
-
-        for row in self._linelist:
-            cells = []
-            for rindex in range(len(row)):
-                cell = row[rindex]
-
-                # handling of a color object can be tricky. Color names
-                # returned by QColor.colorNames() are inconsistent with
-                # color names in Qt.GlobalColor. We just go to the basics
-                # and compare color equality (or closeness) using a distance
-                # criterion in r,g,b coordinates.
-                # Although costly, this would be a CPU burden only when
-                # sorting columns with color information. For now, only
-                # the Plotted Lines line list has such information, and
-                # the number of actually plotted lines tends to be small
-                # anyway.
-                if isinstance(cell, QColor):
-                    r = cell.red()
-                    g = cell.green()
-                    b = cell.blue()
-                    min_dist = 100000
-                    result = cell
-                    for color_name, orig_color in ID_COLORS.items():
-                        orig_rgb = QColor(orig_color)
-                        dist = abs(orig_rgb.red() - r) + abs(orig_rgb.green() - g) + abs(orig_rgb.blue() - b)
-                        if dist < min_dist:
-                            min_dist = dist
-                            result = orig_color
-
-                    key = [k for k,value in ID_COLORS.items() if value == result][0]
-
-                    cells.append(QVariant(key))
+        self._compact = linelist.compact
+        self._colnames = list(self._compact.colnames)
+        self._units = [self._compact.unit(colname) for colname in self._colnames]
+
+        # merged lists carry their colors per input list (group),
+        # not per line. They are displayed in an extra column.
+        self._groups = getattr(linelist, 'groups', None)
+        if self._groups is not None:
+            self._group_color_names = [self._color_name(color) for color in linelist.group_colors]
+            self._colnames.append(COLOR_COLUMN)
+            self._units.append(None)
+
+        self._nlines = len(self._compact)
+        if self._nlines > 0:
+            self._nrows = self._nlines
+            self._ncols = len(self._colnames)
+
+        self._row_map = None
+        self._inverse_row_map = None
+        self._sort_orders = {}
+
+    @staticmethod
+    def _color_name(color):
+        # handling of a color object can be tricky. Color names
+        # returned by QColor.colorNames() are inconsistent with
+        # color names in Qt.GlobalColor. We just go to the basics
+        # and compare color equality (or closeness) using a distance
+        # criterion in r,g,b coordinates.
+        # This runs once per plotted line list, not once per cell.
+        if not isinstance(color, QColor):
+            return str(color)
+
+        r = color.red()
+        g = color.green()
+        b = color.blue()
+        min_dist = 100000
+        result = None
+        for color_name, orig_color in ID_COLORS.items():
+            orig_rgb = QColor(orig_color)
+            dist = abs(orig_rgb.red() - r) + abs(orig_rgb.green() - g) + abs(orig_rgb.blue() - b)
+            if dist < min_dist:
+                min_dist = dist
+                result = color_name
 
-                else:
-                    cells.append(QVariant(str(cell)))
-
-            self._row_cells.append(cells)
-
-            self._nrows = len(self._row_cells)
-            self._ncols = len(self._row_cells[0])
+        return result
 
     def rowCount(self, parent=None, *args, **kwargs):
         # this has to use a pre-computed number of rows,
@@ -646,33 +1072,160 @@ class LineListTableModel(QAbstractTableModel):
     def columnCount(self, parent=None, *args, **kwargs):
         return self._ncols
 
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+
+        # selections and other persistent indices follow their rows.
+        persistent = self.persistentIndexList()
+        rows = [self.source_row(index.row()) for index in persistent]
+
+        self._sort_column = column
+        self._sort_direction = order
+        self._update_row_map()
+
+        self.changePersistentIndexList(persistent,
+            [self.index(self.view_row(row), index.column()) for row, index in zip(rows, persistent)])
+
+        self.layoutChanged.emit()
+
+    def set_filter(self, mask):
+        """
+        Displays only the lines flagged in a boolean mask over
+        the line list rows. None displays all lines.
+        """
+        self.beginResetModel()
+
+        self._filter_mask = mask
+        self._update_row_map()
+
+        self.endResetModel()
+
+    def filter_mask(self, **criteria):
+        """
+        Evaluates filter criteria on the line list. See
+        `~specviz.core.linelist.CompactLineList.filter_mask`.
+        """
+        return self._compact.filter_mask(**criteria)
+
+    def _update_row_map(self):
+        row_map = None
+
+        if 0 <= self._sort_column < self._ncols:
+            ascending, masked = self._sort_order(self._sort_column)
+            if self._sort_direction == Qt.DescendingOrder:
+                ascending = ascending[::-1]
+
+            # masked cells go last, whatever the order.
+            row_map = np.concatenate((ascending, masked))
+
+        if self._filter_mask is not None:
+            if row_map is None:
+                row_map = np.flatnonzero(self._filter_mask)
+            else:
+                row_map = row_map[self._filter_mask[row_map]]
+
+        self._row_map = row_map
+
+        if row_map is None:
+            self._inverse_row_map = None
+            self._nrows = self._nlines if self._ncols else 0
+        else:
+            # rows that are filtered out map to -1.
+            self._inverse_row_map = np.full(self._nlines, -1, dtype=np.intp)
+            self._inverse_row_map[row_map] = np.arange(len(row_map))
+            self._nrows = len(row_map)
+
+    def _sort_order(self, column):
+        # list rows sorted by the values in a column, split in
+        # (unmasked rows in ascending order, masked rows).
+        if column not in self._sort_orders:
+            if column < len(self._compact.colnames):
+                values = self._compact.values(self._compact.colnames[column])
+                mask = self._compact.mask(self._compact.colnames[column])
+            else:
+                values = np.array(self._group_color_names)[self._groups]
+                mask = None
+
+            # strings are sorted as fixed width unicode arrays,
+            # numbers on their native type.
+            if values.dtype.kind == 'O':
+                values = values.astype(str)
+
+            if mask is None:
+                ascending = np.argsort(values, kind='mergesort')
+                masked = np.zeros(0, dtype=ascending.dtype)
+            else:
+                unmasked = np.flatnonzero(~mask)
+                ascending = unmasked[np.argsort(values[unmasked], kind='mergesort')]
+                masked = np.flatnonzero(mask)
+
+            self._sort_orders[column] = (ascending, masked)
+
+        return self._sort_orders[column]
+
+    def source_row(self, row):
+        """
+        The row in the line list that is displayed at a given row.
+        """
+        if self._row_map is None:
+            return row
+        return int(self._row_map[row])
+
+    def view_row(self, row):
+        """
+        The row where a given row in the line list is displayed.
+        """
+        if self._inverse_row_map is None:
+            return row
+        return int(self._inverse_row_map[row])
+
+    def mapToSource(self, index):
+        # Same as in QSortFilterProxyModel. The row of the returned
+        # index is the row in the line list, which may be out of the
+        # range of displayed rows when the list is filtered.
+        return self.createIndex(self.source_row(index.row()), index.column())
+
     def data(self, index, role=None):
         if role != Qt.DisplayRole:
             return QVariant()
 
-        # This is the main bottleneck for sorting. Profiling experiments
-        # show that the main culprit is the .columns[][] accessor in the
-        # astropy table. The index.column() and index.row() calls cause
-        # negligible CPU load.
-        #
-        # return self._linelist.columns[index.column()][index.row()]
-        #
-        # going from an astropy table to a list of rows, the bottleneck
-        # narrows down to the astropy code that gets a cell value from a
-        # Row instance.
-        return self._row_cells[index.row()][index.column()]
+        # The .columns[][] accessor in the astropy table, and the
+        # astropy code that gets a cell value from a Row instance,
+        # used to be the main bottlenecks here. The compact list
+        # gives direct array access instead.
+        row = self.source_row(index.row())
+
+        cells = self._row_cache.get(row)
+        if cells is None:
+            cells = self._format_row(row)
+            self._row_cache[row] = cells
+            if len(self._row_cache) > ROW_CACHE_SIZE:
+                self._row_cache.popitem(last=False)
+        else:
+            self._row_cache.move_to_end(row)
+
+        return QVariant(cells[index.column()])
+
+    def _format_row(self, row):
+        cells = [str(self._compact.cell(row, column))
+                 for column in range(len(self._compact.colnames))]
+
+        if self._groups is not None:
+            cells.append(self._group_color_names[self._groups[row]])
+
+        return cells
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
         if role == Qt.DisplayRole and orientation == Qt.Horizontal:
-            return self._linelist.colnames[section]
+            return self._colnames[section]
 
         # This generates tooltips for header cells
         if role == Qt.ToolTipRole and orientation == Qt.Horizontal:
-            if self._linelist.colnames[section] in [WAVELENGTH_COLUMN, ERROR_COLUMN]:
-                result = self._linelist.columns[section].unit
+            if self._colnames[section] in [WAVELENGTH_COLUMN, ERROR_COLUMN]:
+                result = self._units[section]
             else:
                 # this captures glitches that generate None tooltips
-                if self._linelist.tooltips:
+                if self._linelist.tooltips and section < len(self._linelist.tooltips):
                     result = self._linelist.tooltips[section]
                 else:
                     result = ''
@@ -684,30 +1237,119 @@ class LineListTableModel(QAbstractTableModel):
         return self._linelist.name
 
 
-class SortModel(QSortFilterProxyModel):
-
-    def __init__(self, name):
-        super(SortModel, self).__init__()
-
-        self._name = name
-
-    def lessThan(self, left, right):
-        left_data = left.data()
-        right_data = right.data()
-
-        # it's enough to find type using just one of the parameters,
-        # since they both necessarily come from the same table column.
-        try:
-            l = float(left_data)
-            r = float(right_data)
-            return l < r
-        except:
-            # Lexicographic string comparison. The parameters passed
-            # to this method from a sortable table model are stored
-            # in QtCore.QModelIndex instances.
-            return str(left_data) < str(right_data)
-
-    def getName(self):
-        return self._name
-
-
+class PlottedLinesTableModel(LineListTableModel):
+
+    # A table model that can replace its line list with another one,
+    # telling the views just which rows were removed and added. The
+    # views keep their state (scroll position, sort order, column
+    # widths) and only repaint what changed.
+
+    def update_lines(self, linelist):
+        """
+        Replaces the line list, as a diff against the current one.
+
+        A line is identified by its list of origin, its ID, and its
+        wavelength. When the column set changes, or the lines that
+        persist change their relative order, the model is just reset.
+        """
+        old_keys = self._row_keys()
+        old_order = self._view_order()
+
+        # the new list, in the order it will be displayed.
+        new_model = PlottedLinesTableModel(linelist)
+        new_model._sort_column = self._sort_column
+        new_model._sort_direction = self._sort_direction
+        new_model._update_row_map()
+        new_keys = new_model._row_keys()
+        new_order = new_model._view_order()
+
+        old_view_keys = [old_keys[row] for row in old_order]
+        new_view_keys = [new_keys[row] for row in new_order]
+        old_key_set = set(old_view_keys)
+        new_key_set = set(new_view_keys)
+
+        kept_old = np.array([key in new_key_set for key in old_view_keys], dtype=bool)
+        kept_new = np.array([key in old_key_set for key in new_view_keys], dtype=bool)
+
+        if (new_model._colnames != self._colnames or
+            [key for key in old_view_keys if key in new_key_set] !=
+            [key for key in new_view_keys if key in old_key_set]):
+
+            self.beginResetModel()
+            self._set_linelist(linelist)
+            self._update_row_map()
+            self.endResetModel()
+            return
+
+        # remove rows from the bottom up, so the view rows in the
+        # remaining runs are not shifted.
+        present = np.ones(len(old_order), dtype=bool)
+        for start, end in reversed(_runs(~kept_old)):
+            self.beginRemoveRows(QModelIndex(), start, end)
+            present[start:end+1] = False
+            self._row_map = old_order[present]
+            self._nrows = len(self._row_map)
+            self.endRemoveRows()
+
+        # the rows left are the same in both lists, and in the same
+        # order. The model can switch to the new list at this point.
+        self._set_linelist(linelist)
+        self._sort_orders = new_model._sort_orders
+        self._row_map = new_order[kept_new]
+        self._inverse_row_map = None
+        self._nrows = len(self._row_map)
+
+        # insert rows from the top down. Once the previous runs are
+        # inserted, a run sits at the same view rows as in the new list.
+        present = kept_new.copy()
+        for start, end in _runs(~kept_new):
+            self.beginInsertRows(QModelIndex(), start, end)
+            present[start:end+1] = True
+            self._row_map = new_order[present]
+            self._nrows = len(self._row_map)
+            self.endInsertRows()
+
+        self._update_row_map()
+
+        # rows that persist may still display different values
+        # (e.g. redshift or color).
+        if self._nrows > 0 and self._ncols > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(self._nrows - 1, self._ncols - 1))
+
+    def _view_order(self):
+        # list rows, in the order they are displayed.
+        if self._row_map is None:
+            return np.arange(self._nrows)
+        return self._row_map
+
+    def _row_keys(self):
+        # a hashable key per list row. Repeated lines get a counter
+        # appended, so all keys are unique.
+        nlines = self._nlines
+        if self._groups is not None:
+            names = np.array(self._linelist.group_names, dtype=object)[self._groups]
+        else:
+            names = [self._linelist.name] * nlines
+
+        if ID_COLUMN in self._compact.colnames:
+            ids = self._compact.values(ID_COLUMN)
+        else:
+            ids = [None] * nlines
+        wavelengths = self._compact.values(WAVELENGTH_COLUMN)
+
+        keys = []
+        counts = {}
+        for key in zip(names, ids, wavelengths.tolist()):
+            count = counts.get(key, 0)
+            counts[key] = count + 1
+            keys.append(key + (count,))
+
+        return keys
+
+
+def _runs(flags):
+    # (start, end) index pairs, inclusive, of the runs of
+    # True values in a boolean array.
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return [(start, end - 1) for start, end in zip(edges[::2], edges[1::2])]
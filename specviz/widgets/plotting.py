@@ -1,12 +1,14 @@
 import sys
 import os
 import logging
+import concurrent.futures
+from collections import OrderedDict
 
 import astropy.units as u
 import numpy as np
 import pyqtgraph as pg
 import qtawesome as qta
-from qtpy.QtCore import Signal, QEvent
+from qtpy.QtCore import Signal
 from qtpy.QtWidgets import (QColorDialog, QMainWindow, QMdiSubWindow,
                             QMessageBox, QErrorMessage, QWidget)
 from qtpy.uic import loadUi
@@ -14,7 +16,8 @@ from qtpy.uic import loadUi
 from astropy.units import Quantity
 
 from .custom import LinearRegionItem
-from ..core.items import PlotDataItem
+from ..core.items import (PlotDataItem, UNCERTAINTY_BAND, UNCERTAINTY_ERROR_BARS,
+                          conversion_cache, convert)
 from ..core.models import PlotProxyModel
 
 from .linelists_window import LineListsWindow
@@ -58,6 +61,8 @@ class PlotWindow(QMdiSubWindow):
             self._on_change_color)
         self._central_widget.line_labels_action.triggered.connect(
             self._on_line_labels)
+        self._central_widget.uncertainty_band_action.triggered.connect(
+            self._on_uncertainty_band)
 
         self._central_widget.reset_view_action.triggered.connect(
             lambda: self.plot_widget.autoRange())
@@ -105,6 +110,27 @@ class PlotWindow(QMdiSubWindow):
         if color.isValid():
             self.current_item.color = color.name()
 
+    def _on_uncertainty_band(self):
+        """
+        Switches the uncertainty display of the currently selected item
+        in the data list view between error bars and a filled band.
+        """
+        if self.current_item is None:
+            message_box = QMessageBox()
+            message_box.setText("No item selected, cannot change uncertainty display.")
+            message_box.setIcon(QMessageBox.Warning)
+            message_box.setInformativeText(
+                "There is currently no item selected. Please select an item "
+                "before changing its uncertainty display.")
+
+            message_box.exec()
+            return
+
+        if self.current_item.uncertainty_mode == UNCERTAINTY_BAND:
+            self.current_item.uncertainty_mode = UNCERTAINTY_ERROR_BARS
+        else:
+            self.current_item.uncertainty_mode = UNCERTAINTY_BAND
+
     def _on_line_labels(self):
         self._plot_widget._show_linelists_window()
 
@@ -147,7 +173,6 @@ class PlotWidget(pg.PlotWidget):
     roi_moved = Signal(u.Quantity)
     roi_removed = Signal(LinearRegionItem)
 
-    mouse_enterexit = Signal(QEvent.Type)
     dismiss_linelists_window = Signal(bool)
     erase_linelabels = Signal(pg.PlotWidget)
 
@@ -219,40 +244,95 @@ class PlotWidget(pg.PlotWidget):
 
     @data_unit.setter
     def data_unit(self, value):
-        for plot_data_item in self.listDataItems():
-            if plot_data_item.is_data_unit_compatible(value):
-                plot_data_item.data_unit = value
-
-                # Re-initialize plot to update the displayed values and
-                # adjust ranges of the displayed axes
-                # TODO: Changed this to data_unit from spectral_axis_unit
-                self.initialize_plot(data_unit=value)
-            else:
-                # Technically, this should not occur, but in the unforseen
-                # case that it does, remove the plot and log an error
-                self.remove_plot(item=plot_data_item)
-                logging.error("Removing plot '%s' due to incompatible units "
-                              "('%s' and '%s').",
-                              plot_data_item.data_item.name,
-                              plot_data_item.data_unit, value)
+        self.set_units(data_unit=value)
 
     @spectral_axis_unit.setter
     def spectral_axis_unit(self, value):
+        self.set_units(spectral_axis_unit=value)
+
+    def set_units(self, data_unit=None, spectral_axis_unit=None,
+                  parallel=False, max_workers=None):
+        """
+        Changes the units of all plotted items in a single transaction.
+
+        The data of all items is converted first, and then drawn, with
+        auto ranging suspended. The axes are relabeled, and the plot is
+        ranged, just once at the end.
+
+        Parameters
+        ----------
+        data_unit : str, optional
+            The new data unit. Left alone if None.
+        spectral_axis_unit : str, optional
+            The new spectral axis unit. Left alone if None.
+        parallel : bool, optional
+            Whether the data is converted in a pool of worker threads.
+        max_workers : int, optional
+            The maximum number of worker threads.
+        """
+        plot_data_items = []
         for plot_data_item in self.listDataItems():
-            if plot_data_item.is_spectral_axis_unit_compatible(value):
-                plot_data_item.spectral_axis_unit = value
+            if data_unit is not None and \
+                    not plot_data_item.is_data_unit_compatible(data_unit):
+                units = (plot_data_item.data_unit, data_unit)
+            elif spectral_axis_unit is not None and \
+                    not plot_data_item.is_spectral_axis_unit_compatible(spectral_axis_unit):
+                units = (plot_data_item.spectral_axis_unit, spectral_axis_unit)
+            else:
+                plot_data_items.append(plot_data_item)
+                continue
+
+            # Technically, this should not occur, but in the unforseen
+            # case that it does, remove the plot and log an error
+            self.remove_plot(item=plot_data_item)
+            logging.error("Removing plot '%s' due to incompatible units "
+                          "('%s' and '%s').",
+                          plot_data_item.data_item.name, *units)
+
+        # The converted arrays are pinned in the cache until all items
+        # are drawn, so none is evicted and converted again.
+        with conversion_cache.pinned():
+            # Convert the data of all items, skipping arrays already
+            # converted, and arrays shared by several items.
+            tasks = OrderedDict()
+            for plot_data_item in plot_data_items:
+                data_item = plot_data_item.data_item
+                if not data_item.cacheable:
+                    continue
+
+                conversions = plot_data_item.conversions(
+                    plot_data_item.data_unit if data_unit is None else data_unit,
+                    spectral_axis_unit or plot_data_item.spectral_axis_unit)
+
+                for quantity, unit in conversions:
+                    if not conversion_cache.contains(data_item, quantity, unit):
+                        key = (data_item.identifier, quantity, str(unit))
+                        tasks[key] = (data_item, data_item.spectrum, quantity, unit)
+
+            arrays = _convert_all(list(tasks.values()), parallel, max_workers)
+
+            for (data_item, spectrum, quantity, unit), array in zip(tasks.values(), arrays):
+                conversion_cache.put(data_item, quantity, unit, array)
+
+            # Draw the converted data. Items don't trigger auto ranging
+            # while they change; the plot is ranged once, when
+            # re-initialized, and the user's auto range state is restored.
+            view_box = self.getViewBox()
+            auto_range = list(view_box.state['autoRange'])
+            view_box.disableAutoRange()
+
+            try:
+                for plot_data_item in plot_data_items:
+                    plot_data_item.set_units(data_unit, spectral_axis_unit)
 
                 # Re-initialize plot to update the displayed values and
                 # adjust ranges of the displayed axes
-                self.initialize_plot(spectral_axis_unit=value)
-            else:
-                # Technically, this should not occur, but in the unforseen
-                # case that it does, remove the plot and log an error
-                self.remove_plot(item=plot_data_item)
-                logging.error("Removing plot '%s' due to incompatible units "
-                              "('%s' and '%s').",
-                              plot_data_item.data_item.name,
-                              plot_data_item.spectral_axis_unit, value)
+                if len(plot_data_items) > 0:
+                    self.initialize_plot(data_unit=data_unit,
+                                         spectral_axis_unit=spectral_axis_unit)
+            finally:
+                for axis, enable in zip((view_box.XAxis, view_box.YAxis), auto_range):
+                    view_box.enableAutoRange(axis, enable)
 
     @property
     def selected_region(self):
@@ -314,6 +394,8 @@ class PlotWidget(pg.PlotWidget):
                 self.remove_plot(item=plot_data_item)
 
     def check_plot_compatibility(self):
+        # Compatibility is looked up per class of data item, so this
+        # costs a dictionary lookup per item.
         for i in range(self.proxy_model.sourceModel().rowCount()):
             model_item = self.proxy_model.sourceModel().item(i)
             source_index = self.proxy_model.sourceModel().indexFromItem(model_item)
@@ -363,13 +445,13 @@ class PlotWidget(pg.PlotWidget):
 
         if item.are_units_compatible(self.spectral_axis_unit,
                                                self.data_unit):
-            item.data_unit = self.data_unit
-            item.spectral_axis_unit = self.spectral_axis_unit
+            item.set_units(self.data_unit, self.spectral_axis_unit)
         else:
             item.reset_units()
 
-        # Include uncertainty item
+        # Include uncertainty items
         if item.uncertainty is not None:
+            self.addItem(item.band_item)
             self.addItem(item.error_bar_item)
 
         self.addItem(item)
@@ -453,8 +535,9 @@ class PlotWidget(pg.PlotWidget):
             # Remove plot data item from this plot
             self.removeItem(item)
 
-            # Remove plot error bars
+            # Remove plot error bars and uncertainty band
             if item.uncertainty is not None:
+                self.removeItem(item.band_item)
                 self.removeItem(item.error_bar_item)
 
             # If there are no current plots, reset unit information for plot
@@ -565,12 +648,6 @@ class PlotWidget(pg.PlotWidget):
     # at hand. The range will be used to bracket the set of lines
     # actually read from the line list table(s).
 
-    def enterEvent(self, event):
-        self.mouse_enterexit.emit(event.type())
-
-    def leaveEvent(self, event):
-        self.mouse_enterexit.emit(event.type())
-
     def _find_wavelength_range(self):
         # increasing dispersion values!
         amin = sys.float_info.max
@@ -626,3 +703,20 @@ class PlotWidget(pg.PlotWidget):
                 self.linelist_window = None
             else:
                 self.linelist_window.hide()
+
+
+def _convert_all(tasks, parallel, max_workers):
+    """
+    Converts the data in a list of (data item, spectrum, quantity, unit)
+    tasks, serially or in a pool of worker threads, and returns the
+    converted arrays in the same order.
+    """
+    def convert_task(task):
+        data_item, spectrum, quantity, unit = task
+        return convert(spectrum, quantity, unit)
+
+    if parallel and len(tasks) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(convert_task, tasks))
+
+    return [convert_task(task) for task in tasks]
@@ -0,0 +1,215 @@
+import os
+import uuid
+
+import astropy.units as u
+import numpy as np
+import pyqtgraph as pg
+import pytest
+from qtpy.QtCore import QRectF, Signal
+from specutils import Spectrum1D
+
+from specviz.core import items, linelist
+from specviz.core.items import DataItem, PlotDataItem
+from specviz.widgets.line_labels_plotter import (LineLabelsPlotter, DeclutterIndex,
+                                                 HEIGHT_FIXED, HEIGHT_FLUX)
+
+LINELIST_PATH = os.path.join(os.path.dirname(linelist.__file__),
+                             '..', 'data', 'linelists')
+
+
+class PlotWindow(pg.PlotWidget):
+
+    # Stands in for the plot window, with just what the
+    # line labels plotter needs from it.
+
+    dismiss_linelists_window = Signal(bool)
+    erase_linelabels = Signal(pg.PlotWidget)
+
+    def __init__(self):
+        super(PlotWindow, self).__init__()
+        self._plot_item = self.getPlotItem()
+        self._is_selected = True
+        self.linelist_window = None
+        self.linelists = []
+
+
+@pytest.fixture
+def plotter(qtbot, cache_path):
+    # the plot window is closed here, after any pending zoom
+    # layout is cancelled, instead of by qtbot.
+    plot_window = PlotWindow()
+    plot_window.resize(800, 500)
+    plot_window.show()
+    qtbot.waitExposed(plot_window)
+
+    plotter = LineLabelsPlotter(plot_window)
+    plot_window.sigRangeChanged.connect(plotter.process_zoom_signal)
+
+    yield plotter
+
+    plot_window.sigRangeChanged.disconnect(plotter.process_zoom_signal)
+    plotter._zoom_timer.stop()
+    plot_window.close()
+
+
+def _plot_list(plotter, name, rows):
+    line_list = linelist.get_from_file(LINELIST_PATH, os.path.join(LINELIST_PATH, name))
+    view = linelist.LineListView(line_list, np.asarray(rows))
+    view.setColor('red')
+    view.setHeight(0.75)
+    wavelengths = np.sort(np.asarray(view[linelist.WAVELENGTH_COLUMN]))
+
+    plot_window = plotter._caller
+    plot_window.plot(wavelengths, np.ones(len(wavelengths)))
+    plot_window.getPlotItem().vb.autoRange()
+
+    merged = linelist.LineList.merge([view], line_list[linelist.WAVELENGTH_COLUMN].unit)
+    plotter._merged_linelist = merged
+    plotter._go_plot_markers(merged)
+
+    return wavelengths
+
+
+def test_zoom_coalescing(qtbot, plotter):
+    wavelengths = _plot_list(plotter, 'Reader-Corliss.yaml', range(2000))
+
+    layouts = []
+    plotter._zoom_timer.timeout.connect(lambda: layouts.append(1))
+
+    # a burst of range changes results in a single layout, for
+    # the last range. No mouse interaction is required.
+    view_box = plotter._plot_item.vb
+    for step in range(20):
+        view_box.setXRange(wavelengths[100] - step, wavelengths[140] + step, padding=0)
+
+    qtbot.waitUntil(lambda: len(layouts) > 0)
+    qtbot.wait(50)
+    assert len(layouts) == 1
+
+    xrange = plotter._plot_item.viewRange()[0]
+    x = plotter._labels_item._x
+    assert len(x) > 0
+    assert np.all((x >= xrange[0]) & (x <= xrange[1]))
+
+
+def test_declutter_index():
+    rng = np.random.RandomState(42)
+    x = rng.uniform(0., 1000., 2000)
+    priority = rng.permutation(len(x))
+
+    index = DeclutterIndex(x, priority)
+
+    previous = set()
+    for units_per_pixel in [10., 1., 0.1, 0.01]:
+        rows = index.visible(200., 800., units_per_pixel, 10.)
+        shown = np.sort(x[rows])
+
+        assert np.all((shown >= 200.) & (shown <= 800.))
+        assert np.all(np.diff(shown) >= 10. * units_per_pixel)
+
+        # zooming in only adds markers.
+        assert previous <= set(rows)
+        previous = set(rows)
+
+    # the marker with highest priority in range always shows up.
+    in_range = np.flatnonzero((x >= 200.) & (x <= 800.))
+    top = in_range[np.argmin(priority[in_range])]
+    assert top in index.visible(200., 800., 1000., 10.)
+
+    # also when a marker with higher priority sits just out of range.
+    index = DeclutterIndex(np.array([0., 1., 2., 10.]), np.array([1, 2, 3, 0]))
+    assert list(index.visible(0., 5., 1., 20.)) == [0]
+    assert list(index.visible(1.5, 12., 1., 20.)) == [3]
+    assert list(index.visible(1.5, 5., 1., 20.)) == [2]
+
+
+def test_declutter_priority(qtbot, plotter):
+    _plot_list(plotter, 'Reader-Corliss.yaml', range(2000))
+
+    merged = plotter._merged_linelist
+    rows = plotter._declutter()
+    assert 0 < len(rows) < len(merged)
+
+    # the strongest line in range is among the markers on display.
+    xrange = plotter._plot_item.viewRange()[0]
+    x = np.asarray(merged[linelist.REDSHIFTED_WAVELENGTH_COLUMN])
+    intensity = np.ma.filled(np.ma.asarray(merged[linelist.INTENSITY_COLUMN]).astype(float), -np.inf)
+    in_range = np.flatnonzero((x >= xrange[0]) & (x <= xrange[1]))
+    assert in_range[np.argmax(intensity[in_range])] in rows
+
+
+def test_declutter_empty_view(qtbot, plotter, monkeypatch):
+    _plot_list(plotter, 'Reader-Corliss.yaml', range(2000))
+
+    # a view box with no width on screen shows no markers.
+    monkeypatch.setattr(plotter._plot_item.getViewBox(), 'sceneBoundingRect', lambda: QRectF())
+    assert len(plotter._declutter()) == 0
+
+
+def test_lazy_tooltips(qtbot, plotter):
+    _plot_list(plotter, 'Reader-Corliss.yaml', range(2000))
+
+    # nothing is formatted until a marker is hovered.
+    assert plotter._tooltip_cache == {}
+
+    labels = plotter._labels_item
+    rows = plotter._declutter()
+    assert len(labels) == len(rows) > 0
+
+    merged = plotter._merged_linelist
+    tool_tip = labels._tooltips(0)
+    assert tool_tip.startswith(linelist.WAVELENGTH_COLUMN + '=' + str(merged[linelist.WAVELENGTH_COLUMN][rows[0]]))
+    assert linelist.ID_COLUMN + '=' + str(merged[linelist.ID_COLUMN][rows[0]]) in tool_tip
+    assert list(plotter._tooltip_cache) == [rows[0]]
+
+
+def test_marker_heights(qtbot, plotter):
+    wavelengths = _plot_list(plotter, 'Reader-Corliss.yaml', range(2000))
+
+    labels = plotter._labels_item
+    assert np.all(labels._y == 0.75)
+
+    # markers stay at the same height on screen when zooming.
+    def screen_heights():
+        return labels._device_positions(labels.sceneTransform())[1]
+
+    heights = screen_heights()
+    plotter._plot_item.vb.setYRange(-5., 2., padding=0)
+    assert np.allclose(screen_heights(), heights)
+
+    # or they follow the flux.
+    for curve in plotter._plot_item.listDataItems():
+        plotter._plot_item.removeItem(curve)
+    plotter._caller.plot(wavelengths, wavelengths / 1000.)
+    plotter.set_label_height(HEIGHT_FLUX)
+    assert np.allclose(labels._y, labels._x / 1000.)
+
+    plotter.set_label_height(HEIGHT_FIXED)
+    assert np.all(labels._y == 0.75)
+
+
+def test_marker_heights_decimated(qtbot, plotter, monkeypatch):
+    monkeypatch.setattr(items, 'DECIMATION_THRESHOLD', 1000)
+
+    wavelengths = _plot_list(plotter, 'Reader-Corliss.yaml', range(2000))
+    for curve in plotter._plot_item.listDataItems():
+        plotter._plot_item.removeItem(curve)
+
+    # a spectrum drawn from its decimation pyramid.
+    size = 100000
+    spectral_axis = np.linspace(wavelengths[0], wavelengths[-1], size)
+    spectrum = Spectrum1D(flux=spectral_axis / 1000. * u.Jy,
+                          spectral_axis=spectral_axis * u.AA)
+    plot_data_item = PlotDataItem(DataItem("Test", identifier=uuid.uuid4(), data=spectrum))
+    plotter._plot_item.addItem(plot_data_item)
+    qtbot.waitUntil(lambda: plot_data_item._pyramid is not None)
+
+    # zoomed in on a few lines, the curve only displays part of the data.
+    view_box = plotter._plot_item.vb
+    view_box.setXRange(wavelengths[100], wavelengths[140], padding=0)
+    assert len(plot_data_item.getData()[1]) < size
+
+    # markers out of view still follow the full resolution flux.
+    plotter.label_height = HEIGHT_FLUX
+    plotter._go_plot_markers(plotter._merged_linelist)
+    assert np.allclose(plotter._marker_height, plotter._marker_x / 1000.)
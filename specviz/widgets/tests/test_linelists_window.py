@@ -0,0 +1,205 @@
+import os
+
+import numpy as np
+from astropy.io import ascii
+from qtpy.QtCore import Qt, QPersistentModelIndex
+
+from specviz.core import linelist
+from specviz.widgets.linelists_window import (LineListTableModel, LineListFilterBar,
+                                              LineListStreamer, LineListViewBuilder,
+                                              PlottedLinesTableModel, ROW_CACHE_SIZE)
+
+LINELIST_PATH = os.path.join(os.path.dirname(linelist.__file__),
+                             '..', 'data', 'linelists')
+
+
+def _read_list(name):
+    return linelist.get_from_file(LINELIST_PATH, os.path.join(LINELIST_PATH, name))
+
+
+def test_table_model_row_cache(qtbot, cache_path):
+    line_list = _read_list('Reader-Corliss.yaml')
+    model = LineListTableModel(line_list)
+
+    assert model.rowCount() == len(line_list)
+    assert model.columnCount() == len(line_list.colnames)
+
+    # nothing is formatted until cells are requested.
+    assert len(model._row_cache) == 0
+
+    for row in range(0, len(line_list), 10):
+        value = model.data(model.index(row, 1), role=Qt.DisplayRole)
+        assert value.value() == str(line_list[linelist.ID_COLUMN][row])
+
+    assert len(model._row_cache) == ROW_CACHE_SIZE
+
+
+def test_table_model_sort(qtbot, cache_path):
+    line_list = _read_list('illss.yaml')
+    model = LineListTableModel(line_list)
+
+    # a persistent index follows its row when sorting.
+    persistent = QPersistentModelIndex(model.index(10, 0))
+
+    model.sort(0, Qt.AscendingOrder)
+    wavelengths = [float(model.data(model.index(row, 0), Qt.DisplayRole).value())
+                   for row in range(model.rowCount())]
+    assert wavelengths == sorted(wavelengths)
+    assert model.mapToSource(persistent).row() == 10
+
+    # masked cells go last in both orders.
+    intensity = line_list.colnames.index('Intensity')
+    nmasked = np.count_nonzero(np.ma.getmaskarray(line_list['Intensity']))
+    for order in [Qt.AscendingOrder, Qt.DescendingOrder]:
+        model.sort(intensity, order)
+        values = [model.data(model.index(row, intensity), Qt.DisplayRole).value()
+                  for row in range(model.rowCount())]
+        assert values[-nmasked:] == ['--'] * nmasked
+        values = [float(value) for value in values[:-nmasked]]
+        assert values == sorted(values, reverse=order == Qt.DescendingOrder)
+
+    # string columns.
+    model.sort(1, Qt.AscendingOrder)
+    species = [model.data(model.index(row, 1), Qt.DisplayRole).value()
+               for row in range(model.rowCount())]
+    assert species == sorted(species)
+
+    # back to the original order.
+    model.sort(-1)
+    assert model.mapToSource(model.index(5, 0)).row() == 5
+
+
+def test_table_model_filter(qtbot, cache_path):
+    line_list = _read_list('Reader-Corliss.yaml')
+    model = LineListTableModel(line_list)
+
+    mask = model.filter_mask(species='FE', thresholds={linelist.WAVELENGTH_COLUMN: (4000, 5000)})
+    model.set_filter(mask)
+    assert model.rowCount() == np.count_nonzero(mask)
+
+    # rows map back to the line list, also when sorted.
+    model.sort(0, Qt.DescendingOrder)
+    rows = [model.mapToSource(model.index(row, 0)).row() for row in range(model.rowCount())]
+    assert sorted(rows) == list(np.flatnonzero(mask))
+    wavelengths = line_list[linelist.WAVELENGTH_COLUMN][rows]
+    assert list(wavelengths) == sorted(wavelengths, reverse=True)
+
+    model.set_filter(None)
+    assert model.rowCount() == len(line_list)
+
+
+def test_filter_bar(qtbot, cache_path):
+    line_list = _read_list('Reader-Corliss.yaml')
+    filter_bar = LineListFilterBar(line_list)
+    qtbot.addWidget(filter_bar)
+
+    assert filter_bar.is_empty()
+
+    with qtbot.waitSignal(filter_bar.filter_changed, timeout=2000):
+        filter_bar.species_text.setText('FE')
+        filter_bar.wmin_text.setText('4000')
+
+    criteria = filter_bar.criteria()
+    assert criteria['species'] == 'FE'
+    assert criteria['thresholds'][linelist.WAVELENGTH_COLUMN] == (4000., None)
+
+
+def test_filter_bar_without_species_column(qtbot, cache_path):
+    line_list = _read_list('illss.yaml')
+    filter_bar = LineListFilterBar(line_list)
+    qtbot.addWidget(filter_bar)
+
+    assert not filter_bar.species_text.isEnabled()
+    assert not filter_bar.regex_checkbox.isEnabled()
+
+    model = LineListTableModel(line_list)
+    mask = model.filter_mask(species='fe')
+    assert len(mask) == len(line_list)
+    assert not mask.any()
+
+
+def test_view_builder(qtbot, cache_path):
+    line_list = _read_list('Reader-Corliss.yaml')
+    waverange = (2000. * line_list[linelist.WAVELENGTH_COLUMN].unit, 3000. * line_list[linelist.WAVELENGTH_COLUMN].unit)
+
+    builder = LineListViewBuilder(line_list, waverange)
+    with qtbot.waitSignal(builder.ready) as blocker:
+        builder.start()
+    builder.wait()
+
+    view, column_widths = blocker.args[0]
+    wavelengths = view[linelist.WAVELENGTH_COLUMN]
+    assert len(view) > 0
+    assert np.all((wavelengths >= 2000.) & (wavelengths <= 3000.))
+    assert len(column_widths) == len(view.colnames)
+    assert all(width >= len(name) for width, name in zip(column_widths, view.colnames))
+
+    # a cancelled builder never reports its results.
+    builder = LineListViewBuilder(line_list, waverange)
+    builder.cancel()
+    with qtbot.assertNotEmitted(builder.ready):
+        builder.start()
+        builder.wait()
+
+
+def test_streamer(qtbot, cache_path, tmpdir):
+    line_list = _read_list('illss.yaml')
+    ecsv_filename = str(tmpdir.join('illss.ecsv'))
+    ascii.write(line_list.table, ecsv_filename, format='ecsv')
+    unit = line_list[linelist.WAVELENGTH_COLUMN].unit
+    waverange = (5000. * unit, 6000. * unit)
+
+    streamer = LineListStreamer(ecsv_filename, waverange)
+    progress = []
+    streamer.progress.connect(progress.append)
+    with qtbot.waitSignal(streamer.ready) as blocker:
+        streamer.start()
+    streamer.wait()
+
+    streamed = blocker.args[0]
+    assert len(streamed) == len(line_list.extract_range(waverange))
+    assert progress[-1] == 100
+
+    # a cancelled streamer never reports its results.
+    streamer = LineListStreamer(ecsv_filename, waverange)
+    streamer.cancel()
+    with qtbot.assertNotEmitted(streamer.ready):
+        streamer.start()
+        streamer.wait()
+
+
+def test_plotted_lines_model_update(qtbot, cache_path):
+    line_list = _read_list('Reader-Corliss.yaml')
+    units = line_list[linelist.WAVELENGTH_COLUMN].unit
+
+    def merged(rows):
+        return linelist.LineList.merge([linelist.LineListView(line_list, np.array(rows))], units)
+
+    def displayed(model):
+        column = model._colnames.index(linelist.ID_COLUMN)
+        return [model.data(model.index(row, column), Qt.DisplayRole).value()
+                for row in range(model.rowCount())]
+
+    first = merged(range(0, 40))
+    second = merged(range(20, 60))
+
+    model = PlottedLinesTableModel(first)
+    model.sort(0, Qt.DescendingOrder)
+
+    removed = []
+    inserted = []
+    model.rowsRemoved.connect(lambda parent, start, end: removed.append((start, end)))
+    model.rowsInserted.connect(lambda parent, start, end: inserted.append((start, end)))
+    resets = []
+    model.modelReset.connect(lambda: resets.append(1))
+
+    model.update_lines(second)
+
+    # lines in common are not touched.
+    assert resets == []
+    assert sum(end - start + 1 for start, end in removed) == 20
+    assert sum(end - start + 1 for start, end in inserted) == 20
+
+    expected = PlottedLinesTableModel(second)
+    expected.sort(0, Qt.DescendingOrder)
+    assert displayed(model) == displayed(expected)
@@ -0,0 +1,86 @@
+import astropy.units as u
+import numpy as np
+import pytest
+from specutils import Spectrum1D
+
+from specviz.core import items
+from specviz.core.items import conversion_cache
+from specviz.core.models import DataListModel
+from specviz.widgets.plotting import PlotWidget
+
+
+def _plot_widget(qtbot, count):
+    model = DataListModel()
+    plot_widget = PlotWidget(model=model)
+    qtbot.addWidget(plot_widget)
+
+    for index in range(count):
+        spectrum = Spectrum1D(flux=np.full(100, index + 1.) * u.Jy,
+                              spectral_axis=np.linspace(4000., 5000., 100) * u.AA)
+        data_item = model.add_data(spectrum, "Spectrum {}".format(index))
+
+        plot_widget.add_plot(item=plot_widget.proxy_model.item_from_id(data_item.identifier),
+                             visible=True, initialize=index == 0)
+
+    return plot_widget
+
+
+@pytest.fixture
+def plot_widget(qtbot):
+    return _plot_widget(qtbot, 5)
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_set_units(plot_widget, monkeypatch, parallel):
+    calls = []
+    monkeypatch.setattr(plot_widget, 'autoRange', lambda *args, **kwargs: calls.append('range'))
+    monkeypatch.setattr(plot_widget, 'initialize_plot',
+                        lambda *args, _initialize=plot_widget.initialize_plot, **kwargs:
+                        (calls.append('initialize'), _initialize(*args, **kwargs)))
+    plot_widget.getViewBox().enableAutoRange()
+
+    plot_widget.set_units(data_unit='mJy', spectral_axis_unit='um', parallel=parallel)
+
+    # the plot is relabeled and ranged once, for all items.
+    assert calls == ['initialize', 'range']
+    assert plot_widget.data_unit == 'mJy'
+    assert plot_widget.spectral_axis_unit == 'um'
+    assert plot_widget.getPlotItem().getAxis('bottom').labelUnits == 'um'
+    assert plot_widget.getViewBox().state['autoRange'] == [True, True]
+
+    for index, item in enumerate(plot_widget.listDataItems()):
+        assert item.data_unit == 'mJy' and item.spectral_axis_unit == 'um'
+        x, y = item.getData()
+        assert np.allclose(y, 1000. * (index + 1))
+        assert np.isclose(x[0], 0.4) and np.isclose(x[-1], 0.5)
+
+    # the unit setters go through the same path.
+    calls.clear()
+    plot_widget.data_unit = 'Jy'
+    assert calls == ['initialize', 'range']
+    assert np.allclose(plot_widget.listDataItems()[0].getData()[1], 1.)
+    assert plot_widget.spectral_axis_unit == 'um'
+
+
+def test_set_units_many_items(qtbot, monkeypatch):
+    plot_widget = _plot_widget(qtbot, 40)
+
+    # room for a few arrays only.
+    monkeypatch.setattr(conversion_cache, 'max_bytes', 4 * 800)
+
+    # arrays converted by the batch are not converted again by the items.
+    calls = []
+    monkeypatch.setattr(items, 'convert', lambda *args: calls.append(args))
+
+    view_box = plot_widget.getViewBox()
+    view_box.enableAutoRange(x=False, y=True)
+
+    plot_widget.set_units(data_unit='mJy', spectral_axis_unit='um', parallel=True)
+
+    assert calls == []
+    assert view_box.state['autoRange'] == [False, True]
+    for index, item in enumerate(plot_widget.listDataItems()):
+        assert np.allclose(item.getData()[1], 1000. * (index + 1))
+
+    # the cache is trimmed once the transaction is done.
+    assert conversion_cache.nbytes <= 4 * 800